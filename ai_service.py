@@ -1,55 +1,103 @@
 # ai_service.py (Definitive fix for the ImportError)
+import asyncio
+import contextvars
 import json
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from datetime import datetime
-import google.generativeai as genai
-from gradio_client import Client
 
 # [修正] 移除 'Part' 的 import，因為它導致了錯誤
 # from google.generativeai.types import Part
 
 # 從設定檔匯入金鑰和 URL
-from config import GEMINI_API_KEY, MCP_SERVER_URL
+from config import (
+    GEMINI_API_KEY, GEMINI_API_ENDPOINT, AI_SEARCH_BACKEND,
+    AI_MAX_TOOL_ROUNDS, AI_DEADLINE_SECONDS, AI_TOOL_WORKERS,
+    AI_TOOL_RESULT_COMPACTION, ASYNC_AI_CONCURRENCY, AI_SESSION_ENABLED,
+)
+import catalog_store
+import chat_sessions
+import mcp_client
+import metrics
+import resilience
 
-# --- 1. 設定 Gemini API 金鑰 (一次性設定) ---
-if GEMINI_API_KEY and "YOUR_GEMINI_API_KEY" not in GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
+# google.generativeai、quake_index (NumPy) 與 result_compactor (pandas) 匯入成本高，
+# 皆在第一次需要時才載入，讓 webhook 行程能快速啟動
 
 # --- 2. 工具函式 (用於地震查詢) ---
+# 預設搜尋範圍 (台灣周邊)
+SEARCH_MIN_LATITUDE, SEARCH_MAX_LATITUDE = 21.0, 26.0
+SEARCH_MIN_LONGITUDE, SEARCH_MAX_LONGITUDE = 119.0, 123.0
+
+def _format_search_result(dataframe_dict: dict) -> str:
+    """將 {"headers", "data"} 資料表轉為回傳給 Gemini 的 JSON 字串。"""
+    data = dataframe_dict.get('data', [])
+    if not data:
+        return "查詢完成，但未找到任何符合條件的地震資料。"
+    if AI_TOOL_RESULT_COMPACTION:
+        import result_compactor
+        return result_compactor.compact(dataframe_dict)
+    headers = dataframe_dict.get('headers', [])
+    formatted_results = [dict(zip(headers, row)) for row in data]
+    return json.dumps(formatted_results, indent=2, ensure_ascii=False)
+
 def call_mcp_earthquake_search(
     start_date: str,
     end_date: str,
     min_magnitude: float = 4.5,
-    max_magnitude: float = 8.0
+    max_magnitude: float = 8.0,
+    min_depth: float = 0.0,
+    max_depth: float = 100.0
 ) -> str:
-    """根據指定的條件（時間、規模）從遠端伺服器搜尋地震事件。"""
+    """根據指定的條件（時間、規模、深度）從遠端伺服器搜尋地震事件。"""
     try:
         print(f"--- 正在呼叫遠端地震 MCP 伺服器 (由 Gemini 觸發) ---")
         print(f"    查詢條件: {start_date} 到 {end_date}, 規模 {min_magnitude} 以上")
 
-        client = Client(src=MCP_SERVER_URL)
-        result = client.predict(
-            param_0=start_date, param_1="00:00:00",
-            param_2=end_date, param_3="23:59:59",
-            param_4=21.0, param_5=26.0, # 預設台灣緯度
-            param_6=119.0, param_7=123.0, # 預設台灣經度
-            param_8=0.0, param_9=100.0,
-            param_10=min_magnitude, param_11=max_magnitude,
-            api_name="/gradio_fetch_and_plot_data"
+        dataframe_dict = mcp_client.search(
+            start_date, end_date,
+            SEARCH_MIN_LATITUDE, SEARCH_MAX_LATITUDE, # 預設台灣緯度
+            SEARCH_MIN_LONGITUDE, SEARCH_MAX_LONGITUDE, # 預設台灣經度
+            min_depth, max_depth,
+            min_magnitude, max_magnitude,
         )
-        dataframe_dict = result[0]
         data = dataframe_dict.get('data', [])
 
         if not data:
             print("--- MCP 伺服器回傳：未找到符合條件的地震 ---")
-            return "查詢完成，但未找到任何符合條件的地震資料。"
-
-        headers = dataframe_dict.get('headers', [])
-        formatted_results = [dict(zip(headers, row)) for row in data]
-        print(f"--- MCP 伺服器成功回傳 {len(data)} 筆資料 ---")
-        return json.dumps(formatted_results, indent=2, ensure_ascii=False)
+        else:
+            print(f"--- MCP 伺服器成功回傳 {len(data)} 筆資料 ---")
+        return _format_search_result(dataframe_dict)
     except Exception as e:
         print(f"呼叫 MCP 伺服器失敗: {e}")
-        return f"工具執行失敗，錯誤訊息: {e}"
+        # 由 _run_tool_calls 轉為錯誤訊息回傳給 Gemini，並標記為失敗 (不留給之後的追問沿用)
+        raise
+
+def call_local_earthquake_search(
+    start_date: str,
+    end_date: str,
+    min_magnitude: float = 4.5,
+    max_magnitude: float = 8.0,
+    min_depth: float = 0.0,
+    max_depth: float = 100.0
+) -> str:
+    """以本地地震目錄的索引搜尋；本地資料無法涵蓋查詢範圍時改用遠端 MCP 伺服器。"""
+    bbox = (SEARCH_MIN_LATITUDE, SEARCH_MAX_LATITUDE, SEARCH_MIN_LONGITUDE, SEARCH_MAX_LONGITUDE)
+    try:
+        import quake_index
+        catalog_store.ensure_synced()
+        if quake_index.covers(start_date, end_date, float(min_magnitude), *bbox):
+            print(f"--- 使用本地地震目錄查詢: {start_date} 到 {end_date}, 規模 {min_magnitude} 以上 ---")
+            dataframe_dict = quake_index.search_local(
+                start_date, end_date, float(min_magnitude), float(max_magnitude),
+                float(min_depth), float(max_depth), *bbox,
+            )
+            return _format_search_result(dataframe_dict)
+        print("--- 本地地震目錄未涵蓋查詢範圍，改用 MCP 伺服器 ---")
+    except Exception as e:
+        print(f"本地地震目錄查詢失敗，改用 MCP 伺服器: {e}")
+    return call_mcp_earthquake_search(start_date, end_date, min_magnitude, max_magnitude, min_depth, max_depth)
 
 # --- 3. 向 Gemini 定義工具 ---
 earthquake_search_tool_declaration = {
@@ -61,63 +109,190 @@ earthquake_search_tool_declaration = {
             "end_date": {"type": "STRING", "description": "搜尋的結束日期 (格式 'YYYY-MM-DD')。模型應根據使用者問題推斷此日期，例如從『昨天』或『2024年』推斷出 '2024-12-31'。"},
             "min_magnitude": {"type": "NUMBER", "description": "要搜尋的最小地震規模。如果使用者未指定，請使用預設值 4.5。"},
             "max_magnitude": {"type": "NUMBER", "description": "要搜尋的最大地震規模。預設為 8.0。"},
+            "min_depth": {"type": "NUMBER", "description": "要搜尋的最小震源深度 (公里)。預設為 0。"},
+            "max_depth": {"type": "NUMBER", "description": "要搜尋的最大震源深度 (公里)。預設為 100。"},
         }, "required": ["start_date", "end_date"]
     }
 }
 
-available_tools = {"call_earthquake_search_tool": call_mcp_earthquake_search}
+# 依 AI_SEARCH_BACKEND 選擇地震搜尋工具的實作
+SEARCH_BACKENDS = {"mcp": call_mcp_earthquake_search, "local": call_local_earthquake_search}
+available_tools = {"call_earthquake_search_tool": SEARCH_BACKENDS.get(AI_SEARCH_BACKEND, call_mcp_earthquake_search)}
+
+# --- 4. 建立 Gemini 模型 (第一次使用時才建立) ---
+SYSTEM_INSTRUCTION = (
+    "You are a helpful AI assistant. You must answer in Traditional Chinese."
+    "You have access to tools. When a tool returns data in JSON format, "
+    "you must analyze the JSON data to fully answer the user's question. "
+    "For example, if the user asks for the largest earthquake, use the search tool for the relevant date range "
+    "and then find the entry with the highest magnitude from the JSON results before answering. "
+    "When there are many results, the tool returns a 'summary' object instead of every row: "
+    "it contains the total count, magnitude statistics, the top events by magnitude, "
+    "counts per month, the depth distribution and a time-ordered sample. Rely on these figures."
+)
+
+_model = None
+_model_lock = threading.Lock()
+
+def get_model():
+    """回傳共用的 Gemini 模型；未設定金鑰或建立失敗時回傳 None。"""
+    global _model
+    if _model is None and GEMINI_API_KEY and "YOUR_GEMINI_API_KEY" not in GEMINI_API_KEY:
+        with _model_lock:
+            if _model is None:
+                try:
+                    import google.generativeai as genai
+                    if GEMINI_API_ENDPOINT:
+                        genai.configure(api_key=GEMINI_API_KEY, transport="rest",
+                                        client_options={"api_endpoint": GEMINI_API_ENDPOINT})
+                    else:
+                        genai.configure(api_key=GEMINI_API_KEY)
+                    _model = genai.GenerativeModel(
+                        model_name="gemini-1.5-flash",
+                        tools=[earthquake_search_tool_declaration],
+                        system_instruction=SYSTEM_INSTRUCTION
+                    )
+                except Exception as e:
+                    print(f"建立 Gemini 模型失敗: {e}")
+    return _model
+
+# --- 5. 主要的 AI 文字生成函式 ---
+DEADLINE_MESSAGE = "🤖 AI 查詢時間過長，請縮小查詢範圍 (例如時間區間) 後再試一次。"
+
+_tool_executor = ThreadPoolExecutor(max_workers=AI_TOOL_WORKERS, thread_name_prefix="ai-tool")
 
-# --- 4. 建立 Gemini 模型 ---
-model = None
-if GEMINI_API_KEY and "YOUR_GEMINI_API_KEY" not in GEMINI_API_KEY:
+def _function_calls(response) -> list:
+    """取出回應中所有的 function_call (Gemini 可能一次要求多個工具呼叫)。"""
     try:
-        system_instruction = (
-            "You are a helpful AI assistant. You must answer in Traditional Chinese."
-            "You have access to tools. When a tool returns data in JSON format, "
-            "you must analyze the JSON data to fully answer the user's question. "
-            "For example, if the user asks for the largest earthquake, use the search tool for the relevant date range "
-            "and then find the entry with the highest magnitude from the JSON results before answering."
-        )
-        model = genai.GenerativeModel(
-            model_name="gemini-1.5-flash",
-            tools=[earthquake_search_tool_declaration],
-            system_instruction=system_instruction
-        )
+        parts = response.candidates[0].content.parts
+    except (IndexError, AttributeError):
+        return []
+    return [part.function_call for part in parts if getattr(part, "function_call", None) and part.function_call.name]
+
+def _run_tool(name: str, args: dict) -> str:
+    tool_function = available_tools.get(name)
+    if not tool_function:
+        return f"錯誤：模型嘗試呼叫一個不存在的工具 '{name}'。"
+    with metrics.span(f"tool:{name}"):
+        return tool_function(**args)
+
+def _function_args(fc) -> dict:
+    # 轉為一般的 dict / list / 數值，才能存入對話記錄並與先前的參數比較
+    return type(fc).to_dict(fc).get("args") or {}
+
+def _run_tool_calls(function_calls: list, timeout: float, session=None) -> tuple[list, list]:
+    """
+    在執行緒池中並行執行同一輪的所有工具呼叫，回傳 (function_response 列表, [(工具名稱, 參數, 結果, 是否失敗), ...])。
+    使用者先前的對話中已有相同工具與參數的成功結果時直接沿用，不再查詢。
+    """
+    calls = [(fc.name, _function_args(fc)) for fc in function_calls]
+    futures = []
+    for name, args in calls:
+        reused = chat_sessions.sessions.find_tool_result(session, name, args) if session is not None else None
+        if reused is not None:
+            future = Future()
+            future.set_result(reused)
+        else:
+            # 複製 contextvars，讓工具執行緒中的 span 歸入同一個請求的追蹤範圍
+            future = _tool_executor.submit(contextvars.copy_context().run, _run_tool, name, dict(args))
+        futures.append(future)
+    wait(futures, timeout=timeout)
+    responses, results = [], []
+    for (name, args), future in zip(calls, futures):
+        failed = True
+        if future.done():
+            try:
+                result, failed = future.result(), False
+            except Exception as e:
+                result = f"工具執行失敗，錯誤訊息: {e}"
+        else:
+            future.cancel()
+            result = "工具執行逾時，請改用較小的查詢範圍。"
+        responses.append({"function_response": {"name": name, "response": {"result": result}}})
+        results.append((name, args, result, failed))
+    return responses, results
+
+def _send_message(chat, content, timeout: float):
+    """經過 "gemini" 斷路器送出一輪對話。"""
+    breaker = resilience.breaker("gemini")
+    breaker.before()
+    try:
+        with metrics.span("gemini"):
+            response = chat.send_message(content, request_options={"timeout": timeout})
     except Exception as e:
-        print(f"建立 Gemini 模型失敗: {e}")
+        from google.api_core import exceptions as api_exceptions
+        # 4xx (429 除外) 是請求本身的問題，不計入上游故障
+        if isinstance(e, api_exceptions.ClientError) and not isinstance(e, api_exceptions.TooManyRequests):
+            breaker.release()
+        else:
+            breaker.failure()
+        raise
+    breaker.success()
+    return response
 
-# --- 5. 主要的 AI 文字生成函式 ---
-def generate_ai_text(user_prompt: str) -> str:
+def _remember(session, user_prompt: str, rounds: list, answer: str) -> str:
+    if session is not None:
+        chat_sessions.sessions.add_turn(session, user_prompt, rounds, answer)
+    return answer
+
+def generate_ai_text(user_prompt: str, user_id: str | None = None) -> str:
+    """
+    與 Gemini 對話 (含工具呼叫迴圈)。有 user_id 且啟用 AI_SESSION_ENABLED 時，
+    帶入該使用者先前的對話與工具結果，讓追問不必重新查詢，並在回答後記錄這次對話。
+    """
+    model = get_model()
     if not model:
         return "🤖 AI (Gemini) 服務尚未設定 API 金鑰，或金鑰無效。"
+    # 對話時間上限不超過本次請求的剩餘期限
+    try:
+        budget = resilience.timeout(AI_DEADLINE_SECONDS)
+    except resilience.DeadlineExceeded:
+        return DEADLINE_MESSAGE
+    deadline = time.monotonic() + budget
+    session = chat_sessions.sessions.get(user_id) if AI_SESSION_ENABLED and user_id else None
+    rounds = []
     try:
         print(f"--- 開始 Gemini 對話，使用者輸入: '{user_prompt}' ---")
-        chat = model.start_chat()
-        response = chat.send_message(user_prompt)
-        try:
-            function_call = response.candidates[0].content.parts[0].function_call
-        except (IndexError, AttributeError):
-            function_call = None
-        if not function_call:
-            print("--- Gemini 直接回覆文字 ---")
-            return response.text
-        
-        print(f"--- Gemini 要求呼叫工具: {function_call.name} ---")
-        tool_function = available_tools.get(function_call.name)
-        if not tool_function:
-            return f"錯誤：模型嘗試呼叫一個不存在的工具 '{function_call.name}'。"
-        
-        tool_result = tool_function(**dict(function_call.args))
-        print("--- 將工具結果回傳給 Gemini ---")
-        
-        # [修正] 直接傳送包含 function_response 的字典，不再使用 Part 類別
-        response = chat.send_message(
-            {"function_response": {"name": function_call.name, "response": {"result": tool_result}}}
-        )
-        
+        chat = model.start_chat(history=session.history() if session is not None else None)
+        response = _send_message(chat, user_prompt, budget)
+        for round_no in range(1, AI_MAX_TOOL_ROUNDS + 1):
+            function_calls = _function_calls(response)
+            if not function_calls:
+                print("--- Gemini 回覆文字 ---")
+                return _remember(session, user_prompt, rounds, response.text)
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return DEADLINE_MESSAGE
+            print(f"--- 第 {round_no} 輪：Gemini 要求呼叫 {len(function_calls)} 個工具: "
+                  f"{', '.join(fc.name for fc in function_calls)} ---")
+            tool_responses, results = _run_tool_calls(function_calls, remaining, session)
+            rounds.append(results)
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return DEADLINE_MESSAGE
+            print("--- 將工具結果回傳給 Gemini ---")
+            # [修正] 直接傳送包含 function_response 的字典，不再使用 Part 類別
+            response = _send_message(chat, tool_responses, remaining)
+
+        if _function_calls(response):
+            return "🤖 這個問題需要太多次查詢，請把問題拆小一點再試一次。"
         print("--- Gemini 根據工具結果生成最終回覆 ---")
-        return response.text
+        return _remember(session, user_prompt, rounds, response.text)
+    except resilience.CircuitOpenError:
+        return "🤖 AI 服務暫時無法連線，請稍後再試。"
     except Exception as e:
         print(f"與 Gemini AI 互動時發生錯誤: {e}")
+        if time.monotonic() >= deadline:
+            return DEADLINE_MESSAGE
         return f"🤖 AI 服務發生錯誤: {e}"
 
+async def generate_ai_text_async(user_prompt: str, user_id: str | None = None) -> str:
+    """
+    非同步版本 (ASGI 模式)。Gemini SDK 的非同步 API 只支援 gRPC 傳輸，且工具迴圈本身是同步的，
+    因此整段對話在執行緒中執行；事件迴圈只負責以 ASYNC_AI_CONCURRENCY 限制同時進行的對話數。
+    """
+    import async_http_client
+    async with async_http_client.limit("gemini", ASYNC_AI_CONCURRENCY):
+        return await asyncio.to_thread(generate_ai_text, user_prompt, user_id)
@@ -0,0 +1,205 @@
+# alert_fanout.py
+import os
+import queue
+import threading
+import time
+
+from linebot.v3.messaging import MulticastRequest, TextMessage
+from linebot.v3.messaging.exceptions import ApiException
+
+import metrics
+import subscriber_store
+from config import (
+    ALERT_MULTICAST_PER_SECOND, ALERT_MAX_RETRIES, ALERT_RETRY_BACKOFF,
+    ALERT_MIN_MAGNITUDE, ALERT_RESUME_AFTER_SECONDS,
+)
+from cwa_service import _to_float, _parse_significant_earthquakes, format_cwa_alarm_list
+from command_handler import latest_earthquake_messages
+from http_client import RETRY_STATUS
+from line_client import get_messaging_api
+
+# 沒有新事件時，每隔多久檢查一次是否有中斷的推播需要接手
+RESUME_CHECK_INTERVAL = 60
+
+delivery_latency = metrics.register(metrics.Histogram(
+    "linebot_alert_delivery_seconds", "Time from detecting a new event to LINE accepting each multicast batch.",
+    ("feed",), buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)))
+alert_batches = metrics.register(metrics.Counter(
+    "linebot_alert_batches_total", "Alert multicast batches by outcome.", ("feed", "outcome")))
+alert_recipients = metrics.register(metrics.Counter(
+    "linebot_alert_recipients_total", "Recipients of alert multicast batches accepted by LINE.", ("feed",)))
+
+def _alarm_event(item: dict) -> tuple[str, float | None, list]:
+    messages = [TextMessage(text=format_cwa_alarm_list({"data": [item]}, limit=1))]
+    return str(item.get("identifier")), _to_float(item.get("magnitudeValue")), messages
+
+def _significant_event(item: dict) -> tuple[str, float | None, list]:
+    quake = _parse_significant_earthquakes({"records": {"Earthquake": [item]}})[0]
+    return quake.id, quake.magnitude, latest_earthquake_messages(quake)
+
+# 會推播的 feed：事件 -> (事件 ID, 規模, 訊息)
+ALERT_FEEDS = {
+    "cwa_alarm": _alarm_event,
+    "cwa_significant": _significant_event,
+}
+
+class AlertFanout:
+    """
+    把背景輪詢偵測到的新事件，以 multicast (每批最多 500 人) 推播給所有訂閱者。
+    每個事件的認領與各批次的 retry key 都記錄在 subscriber_store，
+    因此多個 worker 同時偵測到同一事件、或送到一半重啟，都不會讓使用者收到重複的推播。
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._last_send = 0.0
+        self._counts = {"events": 0, "skipped": 0, "duplicates": 0, "resumed": 0, "done": 0, "failed": 0}
+        self._last_latency = None
+
+    def on_new_events(self, feed: str, items: list) -> None:
+        """feed_poller 的 listener：只排入佇列，實際推播在背景執行緒進行，不拖慢輪詢。"""
+        build = ALERT_FEEDS.get(feed)
+        if build is None:
+            return
+        detected_at = time.time()
+        for item in items:
+            try:
+                event_id, magnitude, messages = build(item)
+            except Exception as e:
+                print(f"推播訊息產生失敗 ({feed}): {e}")
+                continue
+            if ALERT_MIN_MAGNITUDE and (magnitude is None or magnitude < ALERT_MIN_MAGNITUDE):
+                self._counts["skipped"] += 1
+                continue
+            self.submit(f"{feed}:{event_id}", feed, [m.to_dict() for m in messages], detected_at)
+
+    def submit(self, event_key: str, feed: str, messages: list[dict], detected_at: float) -> None:
+        self.ensure_started()
+        self._queue.put((event_key, feed, messages, detected_at))
+
+    def ensure_started(self) -> None:
+        """啟動此行程的推播執行緒 (fork 後的子行程會重新啟動)。"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._queue = queue.Queue()
+            threading.Thread(target=self._run, name="alert-fanout", daemon=True).start()
+
+    def wait_idle(self) -> None:
+        """等待佇列中的事件都處理完畢 (供檢查腳本使用)。"""
+        self._queue.join()
+
+    def _run(self) -> None:
+        self.resume_stalled()
+        while True:
+            try:
+                event_key, feed, messages, detected_at = self._queue.get(timeout=RESUME_CHECK_INTERVAL)
+            except queue.Empty:
+                self.resume_stalled()
+                continue
+            try:
+                if subscriber_store.claim_delivery(event_key, feed, messages, detected_at):
+                    self._counts["events"] += 1
+                    self.deliver(event_key)
+                else:
+                    # 其他 worker 已認領 (或重啟前已送出)
+                    self._counts["duplicates"] += 1
+            except Exception as e:
+                print(f"地震速報推播失敗 ({event_key}): {e}")
+            finally:
+                self._queue.task_done()
+
+    def resume_stalled(self) -> None:
+        """接手中斷的推播，只送出尚未成功的批次 (沿用原本的 retry key)。"""
+        try:
+            keys = subscriber_store.reclaim_stalled(ALERT_RESUME_AFTER_SECONDS)
+        except Exception as e:
+            print(f"檢查中斷的推播失敗: {e}")
+            return
+        for event_key in keys:
+            print(f"--- 接手中斷的推播 {event_key} ---")
+            self._counts["resumed"] += 1
+            try:
+                self.deliver(event_key)
+            except Exception as e:
+                print(f"地震速報推播失敗 ({event_key}): {e}")
+
+    def deliver(self, event_key: str) -> str:
+        """依序送出一個已認領事件的所有待送批次，回傳 done 或 failed。"""
+        delivery = subscriber_store.get_delivery(event_key)
+        feed = delivery["feed"]
+        for batch in subscriber_store.pending_batches(event_key):
+            request = MulticastRequest.from_dict({"to": batch["recipients"], "messages": delivery["messages"]})
+            outcome, attempts = self._send_batch(feed, request, batch["retry_key"], batch["attempts"])
+            subscriber_store.mark_batch(event_key, batch["batch_no"], "sent" if outcome != "failed" else "failed",
+                                        attempts)
+            alert_batches.inc(feed=feed, outcome=outcome)
+            if outcome != "failed":
+                alert_recipients.inc(len(batch["recipients"]), feed=feed)
+                self._last_latency = time.time() - delivery["detected_at"]
+                delivery_latency.observe(self._last_latency, feed=feed)
+        status = subscriber_store.finish_delivery(event_key)
+        self._counts[status] += 1
+        print(f"--- 地震速報 {event_key} 推播完成 ({status}，{delivery['recipients']} 位訂閱者) ---")
+        return status
+
+    def _throttle(self) -> None:
+        # 依 ALERT_MULTICAST_PER_SECOND 拉開兩次 multicast 的間隔
+        interval = 1.0 / ALERT_MULTICAST_PER_SECOND if ALERT_MULTICAST_PER_SECOND > 0 else 0
+        delay = self._last_send + interval - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self._last_send = time.monotonic()
+
+    def _send_batch(self, feed: str, request: MulticastRequest, retry_key: str, attempts: int) -> tuple[str, int]:
+        """
+        送出單一批次，回傳 (結果, 累計嘗試次數)。
+        每次重試都帶同一個 X-Line-Retry-Key：前一次其實已送達時 LINE 回應 409，不會重複推播。
+        """
+        api = get_messaging_api()
+        first = True
+        while True:
+            self._throttle()
+            attempts += 1
+            try:
+                with metrics.span("line_multicast"):
+                    api.multicast_with_http_info(request, x_line_retry_key=retry_key)
+                return ("sent" if first else "retried"), attempts
+            except ApiException as e:
+                if e.status == 409:
+                    return "duplicate", attempts
+                retry_after = (e.headers or {}).get("Retry-After")
+                if e.status not in RETRY_STATUS or attempts > ALERT_MAX_RETRIES:
+                    print(f"multicast 失敗 ({feed}): {e.status} {e.reason}")
+                    return "failed", attempts
+            except Exception as e:
+                # 連線錯誤、逾時：不確定是否已送達，以相同的 retry key 重試
+                retry_after = None
+                if attempts > ALERT_MAX_RETRIES:
+                    print(f"multicast 失敗 ({feed}): {e}")
+                    return "failed", attempts
+            first = False
+            try:
+                delay = float(retry_after)
+            except (TypeError, ValueError):
+                delay = ALERT_RETRY_BACKOFF * (2 ** (attempts - 1))
+            time.sleep(delay)
+
+    def stats(self) -> dict:
+        try:
+            subscribers = subscriber_store.subscriber_count()
+        except Exception:
+            subscribers = None
+        return {
+            **self._counts,
+            "subscribers": subscribers,
+            "queued": self._queue.qsize(),
+            "last_delivery_seconds": round(self._last_latency, 3) if self._last_latency is not None else None,
+        }
+
+fanout = AlertFanout()
@@ -2,25 +2,102 @@
 # 首先匯入 config，以設定環境變數
 import config
 
-from flask import Flask, request, abort, send_from_directory
+import mimetypes
+import sys
+from flask import Flask, Response, request, abort, jsonify
+from werkzeug.middleware.proxy_fix import ProxyFix
 from linebot.v3 import WebhookHandler
 from linebot.v3.exceptions import InvalidSignatureError
-from linebot.v3.messaging import (
-    Configuration, ApiClient, MessagingApi,
-    ReplyMessageRequest
-)
-from linebot.v3.webhooks import MessageEvent, TextMessageContent
+from linebot.v3.messaging import TextMessage
 
 # 匯入指令處理器
-from command_handler import process_message
+from dispatcher import WebhookDispatcher
+from line_client import send_reply
+import webhook_batch
+from response_cache import feed_cache
+from feed_poller import feed_poller
+import mcp_client
+import intent_router
+import result_compactor
+import plotting_service
+from asset_store import asset_store
+import warmup
+import metrics
+import shared_cache
+import resilience
+import chat_sessions
+import rate_limiter
+import report_images
+from alert_fanout import fanout
 
 # ------------------------------------------------------------------------------
 # Flask & LINE Bot 設定
 # ------------------------------------------------------------------------------
-app = Flask(__name__)
-line_config = Configuration(access_token=config.CHANNEL_ACCESS_TOKEN)
+# 停用 Flask 內建的 /static 路由，改由下方的 serve_static 提供 STATIC_DIR 中的檔案
+app = Flask(__name__, static_folder=None)
+# Hugging Face Spaces 位於反向代理之後，依 X-Forwarded-* 還原實際的 https 網址
+app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 handler = WebhookHandler(config.CHANNEL_SECRET)
 
+BUSY_MESSAGE = "⏳ 目前查詢人數眾多，請稍後再試一次。"
+
+# 佇列中的工作為「同一次 Webhook 中可共用回覆的一組事件」(見 webhook_batch)
+dispatcher = WebhookDispatcher(
+    webhook_batch.reply_to_group,
+    workers=config.WEBHOOK_WORKERS,
+    maxsize=config.WEBHOOK_QUEUE_MAXSIZE,
+)
+
+def _collect_metrics() -> list:
+    """將既有的運作統計 (快取、佇列、背景輪詢、MCP) 轉為 Prometheus 指標。"""
+    d = dispatcher.stats()
+    cache = feed_cache.stats()
+    poller = feed_poller.stats()
+    mcp = mcp_client.stats()
+    shared = shared_cache.stats()
+    collected = [
+        ("linebot_dispatcher_queue_depth", "gauge", "Webhook events waiting in the dispatcher queue.",
+         [({}, d["queue_depth"])]),
+        ("linebot_dispatcher_events_total", "counter", "Webhook event groups (events sharing one reply) by dispatcher outcome.",
+         [({"result": k}, d[k]) for k in ("processed", "failed", "rejected")]),
+        ("linebot_feed_cache_events_total", "counter", "Upstream feed cache lookups by result.",
+         [({"feed": feed, "result": k}, v) for feed, counts in sorted(cache.items()) for k, v in sorted(counts.items())]),
+        ("linebot_mcp_cache_events_total", "counter", "MCP search result cache lookups by result.",
+         [({"result": k}, v) for k, v in sorted(mcp["cache"].items())]),
+        ("linebot_feed_poller_events_total", "counter", "Background feed poller activity by kind.",
+         [({"feed": feed, "kind": k}, s[k]) for feed, s in sorted(poller.items())
+          for k in ("polls", "errors", "renders", "new_events")]),
+        ("linebot_shared_cache_events_total", "counter", "Cross-process cache lookups and leases by result.",
+         [({"result": k}, v) for k, v in sorted(shared.items()) if k not in ("enabled", "path", "entries", "error")]),
+        ("linebot_feed_snapshot_age_seconds", "gauge", "Age of the pre-rendered reply for each polled feed.",
+         [({"feed": feed}, s["age_seconds"]) for feed, s in sorted(poller.items())]),
+    ]
+    if config.ALERT_FANOUT_ENABLED:
+        alerts = fanout.stats()
+        collected.append(("linebot_alert_subscribers", "gauge", "Users subscribed to earthquake alert multicasts.",
+                          [({}, alerts["subscribers"] or 0)]))
+    return collected
+
+metrics.register_collector(_collect_metrics)
+
+if config.ALERT_FANOUT_ENABLED:
+    # 推播依賴背景輪詢偵測新事件
+    feed_poller.add_listener(fanout.on_new_events)
+
+if config.FEED_POLLER_ENABLED or config.ALERT_FANOUT_ENABLED:
+    @app.before_request
+    def _start_feed_poller():
+        # 在 worker 行程內啟動 (相容 gunicorn --preload)，之後只是一次 PID 比對
+        feed_poller.ensure_started()
+        if config.ALERT_FANOUT_ENABLED:
+            fanout.ensure_started()
+
+if config.WARMUP_ON_START:
+    @app.before_request
+    def _start_warmup():
+        # 伺服器開始接受請求後才在背景載入重量級套件，不拖慢綁定連接埠的時間
+        warmup.ensure_started()
+
 # ------------------------------------------------------------------------------
 # Web 伺服器路由
 # ------------------------------------------------------------------------------
@@ -84,10 +161,56 @@ def healthz():
     """健康檢查端點。"""
     return "ok"
 
+@app.route("/metrics")
+def metrics_endpoint():
+    """以 Prometheus 文字格式輸出各階段延遲直方圖與計數器 (每個 worker 行程各自統計)。"""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+def _seismicity_stats() -> dict:
+    # seismicity 匯入 NumPy；尚未有人使用統計指令時不為了 /stats 載入
+    module = sys.modules.get("seismicity")
+    return module.stats() if module is not None else {"loaded": False}
+
+@app.route("/stats")
+def stats():
+    """回傳內部運作統計 (JSON)。"""
+    return jsonify({
+        "dispatcher": dispatcher.stats(),
+        "cache": feed_cache.stats(),
+        "feed_poller": feed_poller.stats(),
+        "mcp": mcp_client.stats(),
+        "intent_router": intent_router.stats(),
+        "tool_results": result_compactor.stats(),
+        "maps": plotting_service.stats(),
+        "assets": asset_store.stats(),
+        "warmup": warmup.stats(),
+        "shared_cache": shared_cache.stats(),
+        "webhook_batch": webhook_batch.stats(),
+        "circuit_breakers": resilience.stats(),
+        "ai_sessions": chat_sessions.sessions.stats(),
+        "rate_limit": rate_limiter.stats(),
+        "report_images": report_images.stats(),
+        "seismicity": _seismicity_stats(),
+        "alerts": fanout.stats() if config.ALERT_FANOUT_ENABLED else {"enabled": False},
+    })
+
 @app.route("/static/<path:filename>")
 def serve_static(filename):
-    """提供靜態檔案（例如，生成的地圖）。"""
-    return send_from_directory(config.STATIC_DIR, filename)
+    """
+    提供靜態檔案（例如，生成的地圖）。
+    檔名以內容雜湊命名、內容不會變動，因此附上強 ETag 與 immutable 快取標頭，並支援條件式 GET。
+    """
+    asset = asset_store.read(filename)
+    if asset is None:
+        abort(404)
+    data, etag = asset
+    response = Response(data, mimetype=mimetypes.guess_type(filename)[0] or "application/octet-stream")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    response = response.make_conditional(request)
+    if response.status_code == 304:
+        asset_store.count("not_modified")
+    return response
 
 # ------------------------------------------------------------------------------
 # LINE Webhook 處理器
@@ -95,28 +218,28 @@ def serve_static(filename):
 @app.route("/callback", methods=["POST"])
 def callback():
     """處理來自 LINE 平台的傳入 Webhooks。"""
+    with metrics.span("callback"):
+        return _handle_callback()
+
+def _handle_callback():
     signature = request.headers.get("X-Line-Signature")
     body = request.get_data(as_text=True)
     try:
-        handler.handle(body, signature)
+        events = handler.parser.parse(body, signature)
     except InvalidSignatureError:
         abort(400)
-    return "OK"
-
-@handler.add(MessageEvent, message=TextMessageContent)
-def handle_message(event):
-    """
-    處理來自使用者的文字訊息並回覆。
-    所有邏輯都委派給 command_handler。
-    """
     base_url = request.url_root.rstrip("/")
-    reply_messages = process_message(event.message.text, base_url)
-    
-    with ApiClient(line_config) as api_client:
-        line_bot_api = MessagingApi(api_client)
-        line_bot_api.reply_message_with_http_info(
-            ReplyMessageRequest(
-                reply_token=event.reply_token,
-                messages=reply_messages
-            )
-        )
+    if config.WEBHOOK_DISPATCH_MODE != "queue":
+        webhook_batch.handle_events(events, base_url)
+        return "OK"
+
+    # 背景模式：只驗證簽章並將各組事件排入佇列，立即回應 LINE 平台
+    for group in webhook_batch.group_events(events):
+        if not dispatcher.submit(group, base_url):
+            print("--- Webhook 佇列已滿，回覆忙碌訊息 ---")
+            for event in group:
+                try:
+                    send_reply(event, [TextMessage(text=BUSY_MESSAGE)])
+                except Exception as e:
+                    print(f"回覆忙碌訊息失敗: {e}")
+    return "OK"
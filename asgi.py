@@ -0,0 +1,190 @@
+# asgi.py
+"""
+ASGI 進入點：所有 webhook 事件在同一個事件迴圈上並行處理，
+上游查詢使用 httpx 的非同步版本，並依上游各自限制同時進行的請求數。
+
+    uvicorn asgi:app --host 0.0.0.0 --port 7860
+    gunicorn -k uvicorn.workers.UvicornWorker asgi:app
+
+/callback 由此處直接處理 (驗證簽章後立即回應 LINE 平台，事件依 webhook_batch 分組後在背景 task 中回覆)；
+其餘路由 (/healthz、/metrics、/stats、/static/...) 轉交給 app.py 的 Flask 應用程式，
+因此原本的 WSGI 啟動方式 (gunicorn app:app) 不受影響。
+"""
+import asyncio
+import io
+import sys
+
+import config
+import metrics
+import async_http_client
+import line_client
+from app import app as flask_app, handler, BUSY_MESSAGE
+from feed_poller import feed_poller
+from line_client import send_reply_async
+from alert_fanout import fanout
+from linebot.v3.exceptions import InvalidSignatureError
+from linebot.v3.messaging import TextMessage
+import warmup
+import webhook_batch
+
+_tasks = set()
+_stats = {"inflight": 0, "processed": 0, "failed": 0, "rejected": 0}
+
+def stats() -> dict:
+    return {**_stats, "max_inflight": config.ASGI_MAX_INFLIGHT}
+
+def _collect_metrics() -> list:
+    return [
+        ("linebot_asgi_inflight_events", "gauge", "Webhook events being handled on the ASGI event loop.",
+         [({}, _stats["inflight"])]),
+        ("linebot_asgi_events_total", "counter", "ASGI webhook events by outcome.",
+         [({"result": k}, _stats[k]) for k in ("processed", "failed", "rejected")]),
+    ]
+
+metrics.register_collector(_collect_metrics)
+
+def _spawn(coro) -> None:
+    # 保留 task 的參照，避免執行中被回收
+    task = asyncio.get_running_loop().create_task(coro)
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+async def _handle_group(group: list, base_url: str) -> None:
+    try:
+        await webhook_batch.reply_to_group_async(group, base_url)
+        _stats["processed"] += len(group)
+    except Exception as e:
+        _stats["failed"] += len(group)
+        print(f"非同步處理 Webhook 事件失敗: {e}")
+    finally:
+        _stats["inflight"] -= len(group)
+
+async def _reply_busy(event) -> None:
+    try:
+        await send_reply_async(event, [TextMessage(text=BUSY_MESSAGE)])
+    except Exception as e:
+        print(f"回覆忙碌訊息失敗: {e}")
+
+# ------------------------------------------------------------------------------
+# HTTP 協定處理
+# ------------------------------------------------------------------------------
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+async def _respond(send, status: int, body: bytes, headers: list) -> None:
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+def _header(scope, name: bytes) -> str | None:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin1")
+    return None
+
+def _base_url(scope) -> str:
+    # 與 app.py 的 ProxyFix 相同，以 X-Forwarded-* 還原反向代理之前的網址
+    proto = (_header(scope, b"x-forwarded-proto") or scope.get("scheme", "http")).split(",")[0].strip()
+    host = (_header(scope, b"x-forwarded-host") or _header(scope, b"host") or "localhost").split(",")[0].strip()
+    return f"{proto}://{host}{scope.get('root_path', '')}"
+
+async def _callback(scope, receive, send) -> None:
+    """驗證簽章並把各組文字訊息事件交給背景 task，立即回應 LINE 平台。"""
+    body = (await _read_body(receive)).decode("utf-8")
+    with metrics.span("callback"):
+        try:
+            events = handler.parser.parse(body, _header(scope, b"x-line-signature"))
+        except InvalidSignatureError:
+            return await _respond(send, 400, b"Bad Request", [(b"content-type", b"text/plain")])
+        base_url = _base_url(scope)
+        for group in webhook_batch.group_events(events):
+            if _stats["inflight"] >= config.ASGI_MAX_INFLIGHT:
+                _stats["rejected"] += len(group)
+                print("--- 處理中的 Webhook 事件已達上限，回覆忙碌訊息 ---")
+                for event in group:
+                    _spawn(_reply_busy(event))
+                continue
+            _stats["inflight"] += len(group)
+            _spawn(_handle_group(group, base_url))
+    await _respond(send, 200, b"OK", [(b"content-type", b"text/plain; charset=utf-8")])
+
+def _wsgi_environ(scope, body: bytes) -> dict:
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin1"),
+        "SERVER_NAME": server[0], "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "wsgi.version": (1, 0), "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body), "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True, "wsgi.multiprocess": True, "wsgi.run_once": False,
+    }
+    for key, value in scope["headers"]:
+        name, value = key.decode("latin1"), value.decode("latin1")
+        if name == "content-type":
+            environ["CONTENT_TYPE"] = value
+        elif name == "content-length":
+            environ["CONTENT_LENGTH"] = value
+        else:
+            name = "HTTP_" + name.upper().replace("-", "_")
+            environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+def _call_wsgi(environ: dict) -> tuple[int, list, bytes]:
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response["status"], response["headers"] = status, headers
+        return chunks.append
+
+    chunks = []
+    result = flask_app(environ, start_response)
+    try:
+        chunks.extend(result)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    headers = [(k.lower().encode("latin1"), v.encode("latin1")) for k, v in response["headers"]]
+    return int(response["status"].split(" ", 1)[0]), headers, b"".join(chunks)
+
+async def _wsgi(scope, receive, send) -> None:
+    """其餘路由交給 Flask，在執行緒中執行以免阻塞事件迴圈。"""
+    environ = _wsgi_environ(scope, await _read_body(receive))
+    status, headers, body = await asyncio.to_thread(_call_wsgi, environ)
+    await _respond(send, status, body, headers)
+
+async def _lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            if config.FEED_POLLER_ENABLED or config.ALERT_FANOUT_ENABLED:
+                feed_poller.ensure_started()
+            if config.ALERT_FANOUT_ENABLED:
+                fanout.ensure_started()
+            if config.WARMUP_ON_START:
+                warmup.ensure_started()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            if _tasks:
+                await asyncio.wait(list(_tasks), timeout=10)
+            await async_http_client.aclose()
+            await line_client.aclose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def app(scope, receive, send) -> None:
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+    if scope["path"] == "/callback" and scope["method"] == "POST":
+        return await _callback(scope, receive, send)
+    return await _wsgi(scope, receive, send)
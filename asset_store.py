@@ -0,0 +1,188 @@
+# asset_store.py
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from config import (
+    STATIC_DIR, ASSET_STORE_MAX_BYTES, ASSET_STORE_MAX_FILES,
+    ASSET_MEMORY_ITEM_MAX_BYTES, ASSET_MEMORY_MAX_BYTES,
+)
+
+# 只接受單一層、安全的檔名
+VALID_NAME = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+# 多個 worker 共用同一個目錄，定期重新掃描以同步其他行程新增或淘汰的檔案
+RESCAN_INTERVAL = 60.0
+
+class AssetStore:
+    """
+    以內容雜湊命名的靜態檔案儲存區。
+    - 檔案一經寫入就不再變動，可放心使用強 ETag 與 immutable 快取標頭。
+    - 依最近使用順序 (LRU) 在容量或檔案數超過上限時淘汰舊檔。
+    - 小型熱門檔案保留在記憶體中，避免重複讀取磁碟。
+    """
+
+    def __init__(self, directory: str, max_bytes: int, max_files: int,
+                 memory_item_max_bytes: int, memory_max_bytes: int):
+        self._dir = directory
+        self._max_bytes = max_bytes
+        self._max_files = max_files
+        self._memory_item_max_bytes = memory_item_max_bytes
+        self._memory_max_bytes = memory_max_bytes
+        self._lock = threading.Lock()
+        self._index = OrderedDict()   # name -> size，依使用順序排列
+        self._total_bytes = 0
+        self._etags = {}
+        self._memory = OrderedDict()  # name -> bytes
+        self._memory_bytes = 0
+        self._scanned_at = None
+        self._stats = {
+            "puts": 0, "memory_hits": 0, "disk_reads": 0, "not_found": 0, "not_modified": 0,
+            "evictions": 0, "evicted_bytes": 0,
+        }
+
+    def _path(self, name: str) -> str:
+        if not VALID_NAME.match(name or "") or name.startswith("."):
+            raise ValueError(f"invalid asset name: {name!r}")
+        return os.path.join(self._dir, name)
+
+    def _scan_locked(self) -> None:
+        entries = []
+        for entry in os.scandir(self._dir):
+            if entry.is_file() and VALID_NAME.match(entry.name) and not entry.name.endswith(".tmp"):
+                st = entry.stat()
+                entries.append((st.st_atime if st.st_atime > st.st_mtime else st.st_mtime, entry.name, st.st_size))
+        entries.sort()
+        self._index = OrderedDict((name, size) for _, name, size in entries)
+        self._total_bytes = sum(self._index.values())
+        for name in [n for n in self._memory if n not in self._index]:
+            self._memory_bytes -= len(self._memory.pop(name))
+        self._scanned_at = time.monotonic()
+
+    def _ensure_scanned_locked(self) -> None:
+        if self._scanned_at is None or time.monotonic() - self._scanned_at > RESCAN_INTERVAL:
+            self._scan_locked()
+
+    def _remember_locked(self, name: str, data: bytes) -> None:
+        if len(data) > self._memory_item_max_bytes:
+            return
+        if name in self._memory:
+            self._memory.move_to_end(name)
+            return
+        self._memory[name] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self._memory_max_bytes and self._memory:
+            _, old = self._memory.popitem(last=False)
+            self._memory_bytes -= len(old)
+
+    def _forget_locked(self, name: str) -> None:
+        size = self._index.pop(name, None)
+        if size is not None:
+            self._total_bytes -= size
+        self._etags.pop(name, None)
+        data = self._memory.pop(name, None)
+        if data is not None:
+            self._memory_bytes -= len(data)
+
+    def _evict_locked(self, keep: str) -> None:
+        while (self._total_bytes > self._max_bytes or len(self._index) > self._max_files) and len(self._index) > 1:
+            name = next(iter(self._index))
+            if name == keep:
+                self._index.move_to_end(name)
+                continue
+            size = self._index[name]
+            self._forget_locked(name)
+            try:
+                os.remove(os.path.join(self._dir, name))
+            except FileNotFoundError:
+                pass
+            self._stats["evictions"] += 1
+            self._stats["evicted_bytes"] += size
+
+    def exists(self, name: str) -> bool:
+        path = self._path(name)
+        with self._lock:
+            if name in self._index and os.path.exists(path):
+                self._index.move_to_end(name)
+                return True
+        return os.path.exists(path)
+
+    def put(self, data: bytes, suffix: str = ".bin", name: str | None = None) -> str:
+        """
+        寫入檔案並回傳檔名。未指定 name 時以內容的 SHA-256 命名；
+        指定 name 時，呼叫端須保證相同名稱必定對應相同內容 (例如以輸入資料的雜湊命名)。
+        """
+        if name is None:
+            name = hashlib.sha256(data).hexdigest()[:32] + suffix
+        path = self._path(name)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._ensure_scanned_locked()
+            self._forget_locked(name)
+            self._index[name] = len(data)
+            self._total_bytes += len(data)
+            self._remember_locked(name, data)
+            self._stats["puts"] += 1
+            self._evict_locked(keep=name)
+        return name
+
+    def read(self, name: str) -> tuple[bytes, str] | None:
+        """讀取檔案內容與其強 ETag；檔案不存在時回傳 None。"""
+        try:
+            path = self._path(name)
+        except ValueError:
+            return None
+        with self._lock:
+            data = self._memory.get(name)
+            if data is not None:
+                self._memory.move_to_end(name)
+                if name in self._index:
+                    self._index.move_to_end(name)
+                self._stats["memory_hits"] += 1
+                return data, self._etags.get(name) or self._etag_locked(name, data)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except (FileNotFoundError, IsADirectoryError):
+            with self._lock:
+                self._forget_locked(name)
+                self._stats["not_found"] += 1
+            return None
+        with self._lock:
+            self._stats["disk_reads"] += 1
+            if name in self._index:
+                self._index.move_to_end(name)
+            else:
+                self._index[name] = len(data)
+                self._total_bytes += len(data)
+            self._remember_locked(name, data)
+            return data, self._etags.get(name) or self._etag_locked(name, data)
+
+    def _etag_locked(self, name: str, data: bytes) -> str:
+        etag = hashlib.sha256(data).hexdigest()[:32]
+        self._etags[name] = etag
+        return etag
+
+    def count(self, key: str) -> None:
+        with self._lock:
+            self._stats[key] = self._stats.get(key, 0) + 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._stats,
+                "files": len(self._index), "bytes": self._total_bytes,
+                "memory_files": len(self._memory), "memory_bytes": self._memory_bytes,
+            }
+
+
+asset_store = AssetStore(
+    STATIC_DIR, ASSET_STORE_MAX_BYTES, ASSET_STORE_MAX_FILES,
+    ASSET_MEMORY_ITEM_MAX_BYTES, ASSET_MEMORY_MAX_BYTES,
+)
@@ -0,0 +1,152 @@
+# async_http_client.py
+import asyncio
+import os
+import random
+from typing import TYPE_CHECKING
+from urllib.parse import urlsplit
+
+import metrics
+import resilience
+from config import (
+    HTTP_POOL_MAXSIZE, HTTP_RETRY_TOTAL, HTTP_RETRY_BACKOFF, HTTP_RETRY_JITTER, HTTP_HEDGE_DELAY,
+    ASYNC_UPSTREAM_CONCURRENCY,
+)
+from http_client import RETRY_STATUS, hedged_requests
+
+if TYPE_CHECKING:
+    import httpx
+
+# httpx 只在 ASGI 模式第一次發出請求時才載入，不影響 WSGI 行程的啟動時間
+_state = {"key": None, "client": None, "limits": {}}
+
+def _current_key() -> tuple:
+    return os.getpid(), asyncio.get_running_loop()
+
+def _ensure_state() -> dict:
+    """AsyncClient 與 Semaphore 都綁定事件迴圈，換了迴圈 (或 fork 後) 就重新建立。"""
+    key = _current_key()
+    if _state["key"] != key:
+        _state.update(key=key, client=None, limits={})
+    return _state
+
+def get_client() -> "httpx.AsyncClient":
+    """取得目前事件迴圈共用、保留 keep-alive 連線的 httpx.AsyncClient。"""
+    state = _ensure_state()
+    if state["client"] is None:
+        import httpx
+        state["client"] = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=HTTP_POOL_MAXSIZE),
+            follow_redirects=True,
+        )
+    return state["client"]
+
+def limit(upstream: str, concurrency: int = ASYNC_UPSTREAM_CONCURRENCY) -> asyncio.Semaphore:
+    """
+    取得某個上游 (主機名稱或 "gemini" 之類的名稱) 的並行上限。
+    同一個事件迴圈上所有請求共用這個 Semaphore，避免尖峰時同時對單一上游送出過多請求。
+    """
+    limits = _ensure_state()["limits"]
+    semaphore = limits.get(upstream)
+    if semaphore is None:
+        semaphore = limits[upstream] = asyncio.Semaphore(max(1, int(concurrency)))
+    return semaphore
+
+def _retry_delay(attempt: int, response) -> float:
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after and retry_after.isdigit():
+        return float(retry_after)
+    return HTTP_RETRY_BACKOFF * (2 ** attempt) + random.uniform(0, HTTP_RETRY_JITTER)
+
+async def _send(client, url: str, params: dict | None, timeout: float, host: str) -> "httpx.Response":
+    """送出一個 GET；啟用 HTTP_HEDGE_DELAY 時，慢的請求會再送一次並採用先成功者。"""
+    if HTTP_HEDGE_DELAY <= 0:
+        return await client.get(url, params=params, timeout=timeout)
+    tasks = [asyncio.ensure_future(client.get(url, params=params, timeout=timeout))]
+    done, _ = await asyncio.wait(tasks, timeout=HTTP_HEDGE_DELAY)
+    if not done:
+        tasks.append(asyncio.ensure_future(client.get(url, params=params, timeout=timeout)))
+    pending, error = set(tasks), None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            winners = [t for t in done if t.exception() is None]
+            if winners:
+                if len(tasks) > 1:
+                    hedged_requests.inc(host=host, winner="first" if winners[0] is tasks[0] else "hedge")
+                return winners[0].result()
+            error = next(iter(done)).exception()
+        raise error
+    finally:
+        for t in pending:
+            t.cancel()
+
+async def _get_with_retries(url: str, params: dict | None, timeout: float, host: str) -> "httpx.Response":
+    import httpx
+    client = get_client()
+    for attempt in range(HTTP_RETRY_TOTAL + 1):
+        status, response = None, None
+        try:
+            with metrics.span(f"http:{host}"):
+                response = await _send(client, url, params, resilience.timeout(timeout), host)
+            status = response.status_code
+        except httpx.TransportError:
+            if attempt >= HTTP_RETRY_TOTAL:
+                raise
+        finally:
+            metrics.record_upstream(host, status)
+        if response is not None and (status not in RETRY_STATUS or attempt >= HTTP_RETRY_TOTAL):
+            return response
+        delay = _retry_delay(attempt, response)
+        left = resilience.remaining()
+        if left is not None and delay >= left:
+            # 等不到下一次重試就會超過請求期限
+            if response is not None:
+                return response
+            raise resilience.DeadlineExceeded("已超過本次請求的處理期限")
+        await asyncio.sleep(delay)
+
+async def get(url: str, params: dict | None = None, timeout: float = 10) -> "httpx.Response":
+    """
+    非同步版的 http_client.get：429 / 5xx 與連線錯誤以相同的設定退避重試，
+    並受該主機的並行上限限制。耗時與結果同樣記錄於 metrics；請求期限、斷路器與對沖請求的行為也相同。
+    """
+    import httpx
+    host = urlsplit(url).netloc
+    # 逾時因請求期限而縮短時，逾時不代表上游不健康
+    shortened = resilience.timeout(timeout) < timeout
+    breaker = resilience.breaker(host)
+    breaker.before()
+    try:
+        async with limit(host):
+            response = await _get_with_retries(url, params, timeout, host)
+    except (httpx.TimeoutException, resilience.DeadlineExceeded):
+        if shortened:
+            breaker.release()
+        else:
+            breaker.failure()
+        raise
+    except Exception:
+        breaker.failure()
+        raise
+    except BaseException:
+        # 例如 task 被取消
+        breaker.release()
+        raise
+    if response.status_code in RETRY_STATUS:
+        breaker.failure()
+    else:
+        breaker.success()
+    return response
+
+async def get_json(url: str, params: dict | None = None, timeout: float = 10):
+    """GET 並解析 JSON；非 2xx 回應會拋出 httpx.HTTPStatusError。"""
+    response = await get(url, params=params, timeout=timeout)
+    response.raise_for_status()
+    return response.json()
+
+async def aclose() -> None:
+    """關閉目前事件迴圈的 AsyncClient (ASGI lifespan 結束時呼叫)。"""
+    state = _ensure_state()
+    client, state["client"] = state["client"], None
+    if client is not None:
+        await client.aclose()
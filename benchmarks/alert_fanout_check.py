@@ -0,0 +1,118 @@
+# benchmarks/alert_fanout_check.py
+"""
+驗證地震速報推播 (alert_fanout) 對本地 stub LINE API 的行為：
+
+1. 訂閱者依 500 人一批切成 multicast，每位訂閱者每個事件剛好收到一次；
+2. 批次遇到 5xx 時以相同的 retry key 重試；
+3. 兩個 worker 同時偵測到同一事件時只推播一次；
+4. 推播中斷後接手，只送出剩餘批次；已被 LINE 接受的批次重送時回應 409，不會重複推播。
+
+    python benchmarks/alert_fanout_check.py
+    python benchmarks/alert_fanout_check.py --subscribers 5000 --failures 3
+
+輸出 JSON (含偵測到最後一批送達的延遲)；任一項檢查失敗時以結束碼 1 結束。
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from stub_servers import StubUpstreams, load_fixture
+
+def _recipients(multicasts: list) -> Counter:
+    return Counter(user for m in multicasts for user in m["to"])
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subscribers", type=int, default=1234, help="訂閱者人數")
+    parser.add_argument("--events", type=int, default=2, help="同時偵測到的新地震預警數")
+    parser.add_argument("--failures", type=int, default=2, help="注入的 multicast 500 錯誤次數")
+    parser.add_argument("--output", help="將結果寫入 JSON 檔")
+    args = parser.parse_args()
+
+    stubs = StubUpstreams().start()
+    os.environ.update(stubs.env())
+    os.environ.update({
+        "ALERT_FANOUT_ENABLED": "true",
+        "SUBSCRIBER_DB_PATH": os.path.join(tempfile.mkdtemp(prefix="subscribers_"), "subscribers.sqlite3"),
+        "ALERT_RETRY_BACKOFF": "0.05", "ALERT_MULTICAST_PER_SECOND": "50", "ALERT_RESUME_AFTER_SECONDS": "60",
+        "FEED_POLLER_ENABLED": "false", "WARMUP_ON_START": "false",
+    })
+    import subscriber_store
+    from alert_fanout import AlertFanout, ALERT_FEEDS
+    from config import ALERT_MULTICAST_BATCH_SIZE
+
+    line = stubs.servers["line"]
+    users = [f"U{i:032x}" for i in range(args.subscribers)]
+    for user in users:
+        subscriber_store.subscribe(user)
+    expected_batches = -(-len(users) // ALERT_MULTICAST_BATCH_SIZE)
+    checks = {}
+    try:
+        # --- 1~3. 兩個 worker 同時收到相同的新事件，並注入 5xx ---
+        items = load_fixture("cwa_alarm.json")["data"][:args.events]
+        workers = [AlertFanout(), AlertFanout()]
+        line.fail_next = args.failures
+        started = time.perf_counter()
+        for worker in workers:
+            worker.on_new_events("cwa_alarm", items)
+        for worker in workers:
+            worker.wait_idle()
+        with line.lock:
+            multicasts = list(line.multicasts)
+        latency = max(m["at"] for m in multicasts) - started if multicasts else None
+        counts = _recipients(multicasts)
+        batch_sizes = sorted((len(m["to"]) for m in multicasts), reverse=True)
+        checks["batch_count_ok"] = len(multicasts) == expected_batches * len(items)
+        checks["each_recipient_once_per_event"] = (set(counts) == set(users)
+                                                   and all(n == len(items) for n in counts.values()))
+        checks["retries_ok"] = line.fail_next == 0 and sum(w.stats()["done"] for w in workers) == len(items)
+        checks["duplicates_suppressed"] = sum(w.stats()["duplicates"] for w in workers) == len(items)
+
+        # --- 4. 推播送到一半中斷：第 0 批已標記送出，第 1 批 LINE 已接受但尚未記錄 ---
+        item = load_fixture("cwa_significant.json")["records"]["Earthquake"][0]
+        event_id, _, messages = ALERT_FEEDS["cwa_significant"](item)
+        event_key = f"cwa_significant:{event_id}"
+        subscriber_store.claim_delivery(event_key, "cwa_significant", [m.to_dict() for m in messages], time.time())
+        batches = subscriber_store.pending_batches(event_key)
+        subscriber_store.mark_batch(event_key, batches[0]["batch_no"], "sent", 1)
+        with line.lock:
+            line.multicasts.clear()
+            line.retry_keys.add(batches[1]["retry_key"])
+        conn = subscriber_store.connect()
+        with conn:
+            conn.execute("UPDATE deliveries SET claimed_at = claimed_at - 3600 WHERE event_key = ?", (event_key,))
+        conn.close()
+        resumer = AlertFanout()
+        resumer.resume_stalled()
+        with line.lock:
+            resumed = list(line.multicasts)
+        already_sent = set(batches[0]["recipients"]) | set(batches[1]["recipients"])
+        checks["resume_skips_sent_batches"] = (len(resumed) == expected_batches - 2
+                                               and not already_sent & set(_recipients(resumed)))
+        checks["resume_done"] = subscriber_store.get_delivery(event_key)["status"] == "done"
+    finally:
+        stubs.stop()
+
+    ok = all(checks.values())
+    text = json.dumps({
+        "subscribers": len(users), "events": args.events, "batch_size": ALERT_MULTICAST_BATCH_SIZE,
+        "injected_failures": args.failures, "batch_sizes": batch_sizes,
+        "detect_to_last_batch_seconds": round(latency, 3) if latency is not None else None,
+        "checks": checks, "ok": ok,
+    }, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+# benchmarks/quake_models_bench.py
+"""
+比較服務層以 pandas DataFrame 與以 Quake / QuakeBatch 產生回覆文字的延遲與記憶體配置。
+
+    python benchmarks/quake_models_bench.py
+    python benchmarks/quake_models_bench.py --rows 5 50 250 --repeat 200 --output result.json
+
+兩種路徑使用相同的合成資料 (CWA 顯著有感地震報告與 USGS GeoJSON)，
+「dataframe」為改版前 cwa_service / command_handler 的寫法，「records」為目前的寫法。
+輸出每次呼叫的中位數延遲 (微秒) 與 tracemalloc 量測的配置峰值 (KB)。
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from cwa_service import TAIPEI_TZ, _parse_significant_earthquakes, _to_float
+from quake_models import Quake, QuakeBatch
+
+def make_cwa_payload(n: int) -> dict:
+    base = datetime(2025, 1, 1, 8, 0, 0)
+    return {"records": {"Earthquake": [
+        {
+            "EarthquakeNo": 114000 + i, "Web": f"https://example.invalid/{i}",
+            "ReportImageURI": f"https://example.invalid/{i}.png",
+            "EarthquakeInfo": {
+                "OriginTime": (base + timedelta(hours=i)).strftime("%Y-%m-%d %H:%M:%S"),
+                "FocalDepth": 5.0 + i % 30,
+                "Epicenter": {"Location": f"花蓮縣政府東方 {i} 公里", "EpicenterLatitude": 23.5, "EpicenterLongitude": 121.5},
+                "EarthquakeMagnitude": {"MagnitudeValue": 4.0 + (i % 30) / 10},
+            },
+        }
+        for i in range(n)
+    ]}}
+
+def make_usgs_features(n: int) -> list:
+    t0 = int(datetime(2025, 1, 1, tzinfo=timezone.utc).timestamp() * 1000)
+    return [
+        {"id": f"us{i}", "properties": {"mag": 5.0 + (i % 20) / 10, "time": t0 + i * 3_600_000,
+                                         "place": f"{i} km E of Hualien, Taiwan", "url": f"https://example.invalid/{i}"},
+         "geometry": {"coordinates": [121.0 + (i % 10) / 10, 23.0 + (i % 10) / 10, 10.0]}}
+        for i in range(n)
+    ]
+
+# ------------------------------------------------------------------------------
+# 改版前的 DataFrame 路徑
+# ------------------------------------------------------------------------------
+def significant_dataframe(payload: dict, limit: int = 5) -> str:
+    rows = []
+    for q in payload["records"]["Earthquake"]:
+        ei = q["EarthquakeInfo"]
+        epic = ei["Epicenter"]
+        rows.append({
+            "ID": q.get("EarthquakeNo"), "Time": ei.get("OriginTime"),
+            "Lat": _to_float(epic.get("EpicenterLatitude")), "Lon": _to_float(epic.get("EpicenterLongitude")),
+            "Depth": _to_float(ei.get("FocalDepth")),
+            "Magnitude": _to_float(ei["EarthquakeMagnitude"].get("MagnitudeValue")),
+            "Location": epic.get("Location"), "URL": q.get("Web"),
+        })
+    df = pd.DataFrame(rows)
+    df["Time"] = pd.to_datetime(df["Time"], errors="coerce").dt.tz_localize(TAIPEI_TZ)
+    df = df.sort_values(by="Time", ascending=False).head(limit)
+    lines = []
+    for _, row in df.iterrows():
+        mag_str = f"{row['Magnitude']:.1f}" if pd.notna(row['Magnitude']) else "—"
+        depth_str = f"{row['Depth']:.0f}" if pd.notna(row['Depth']) else "—"
+        lines.append(f"時間: {row['Time'].strftime('%Y-%m-%d %H:%M')}\n地點: {row['Location']}\n"
+                     f"規模: M{mag_str} | 深度: {depth_str} km\n報告: {row['URL']}")
+    return "\n\n".join(lines)
+
+def taiwan_dataframe(features: list) -> str:
+    rows = []
+    for f in features:
+        p = f["properties"]
+        lon, lat, *_ = f["geometry"]["coordinates"]
+        rows.append({"latitude": lat, "longitude": lon, "magnitude": p["mag"], "place": p.get("place", ""),
+                     "time_utc": datetime.fromtimestamp(p["time"] / 1000, tz=timezone.utc), "url": p.get("url", "")})
+    df = pd.DataFrame(rows)
+    lines = []
+    for _, row in df.head(15).iterrows():
+        lines.append(f"規模: {row['magnitude']:.1f} | 日期時間: {row['time_utc'].strftime('%Y-%m-%d %H:%M')} (UTC)\n"
+                     f"地點: {row['place']}\n報告連結: {row.get('url', '無')}")
+    # 地圖繪製需要的欄位
+    df["longitude"].astype(float).tolist(), df["latitude"].astype(float).tolist(), df["magnitude"].astype(float).tolist()
+    return "\n\n".join(lines)
+
+# ------------------------------------------------------------------------------
+# 目前的 Quake / QuakeBatch 路徑
+# ------------------------------------------------------------------------------
+def significant_records(payload: dict, limit: int = 5) -> str:
+    quakes = _parse_significant_earthquakes(payload)
+    quakes.sort(key=lambda q: (q.time is not None, q.time.timestamp() if q.time else 0), reverse=True)
+    lines = []
+    for q in quakes[:limit]:
+        mag_str = f"{q.magnitude:.1f}" if q.magnitude is not None else "—"
+        depth_str = f"{q.depth:.0f}" if q.depth is not None else "—"
+        lines.append(f"時間: {q.time.strftime('%Y-%m-%d %H:%M')}\n地點: {q.place}\n"
+                     f"規模: M{mag_str} | 深度: {depth_str} km\n報告: {q.url}")
+    return "\n\n".join(lines)
+
+def taiwan_records(features: list) -> str:
+    batch = QuakeBatch.from_quakes(map(Quake.from_usgs_feature, features))
+    lines = []
+    for q in batch.head(15):
+        lines.append(f"規模: {q.magnitude:.1f} | 日期時間: {q.time.strftime('%Y-%m-%d %H:%M')} (UTC)\n"
+                     f"地點: {q.place}\n報告連結: {q.url or '無'}")
+    batch.longitude.tolist(), batch.latitude.tolist(), batch.magnitude.tolist()
+    return "\n\n".join(lines)
+
+CASES = {
+    "significant": (make_cwa_payload, significant_dataframe, significant_records),
+    "taiwan": (make_usgs_features, taiwan_dataframe, taiwan_records),
+}
+
+def _measure(fn, arg, repeat: int) -> dict:
+    fn(arg)  # 預熱
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(arg)
+        samples.append(time.perf_counter() - started)
+    tracemalloc.start()
+    fn(arg)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"median_us": round(statistics.median(samples) * 1e6, 1), "peak_kb": round(peak / 1024, 1)}
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[5, 50, 250], help="每次呼叫的事件筆數")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--output", help="將結果寫入 JSON 檔")
+    args = parser.parse_args()
+
+    results = []
+    for case, (make, legacy, current) in CASES.items():
+        for n in args.rows:
+            data = make(n)
+            before, after = _measure(legacy, data, args.repeat), _measure(current, data, args.repeat)
+            results.append({
+                "case": case, "rows": n, "dataframe": before, "records": after,
+                "speedup": round(before["median_us"] / max(after["median_us"], 1e-9), 1),
+            })
+
+    text = json.dumps({"python": sys.version.split()[0], "pandas": pd.__version__, "results": results},
+                      indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,60 @@
+# benchmarks/record_fixtures.py
+"""
+從真實的 CWA 與 USGS API 重新錄製 benchmarks/fixtures/ 中的回應 (需要網路與 CWA_API_KEY)。
+
+    CWA_API_KEY=... python benchmarks/record_fixtures.py
+
+查詢條件與 cwa_service / usgs_service 相同。Gemini 與 MCP 的 fixture
+(gemini_*.json、mcp_search.json) 為手動整理的代表性回應，不在此重新錄製。
+"""
+import json
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from config import CWA_ALARM_API, CWA_SIGNIFICANT_API, USGS_API_BASE_URL, CWA_API_KEY
+
+FIXTURES_DIR = os.path.join(BENCH_DIR, "fixtures")
+
+def _iso(dt: datetime) -> str:
+    return dt.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+
+def _save(name: str, payload: dict) -> None:
+    path = os.path.join(FIXTURES_DIR, name)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=1)
+        f.write("\n")
+    print(f"{name}: {os.path.getsize(path)} bytes")
+
+def _get(url: str, params: dict | None = None) -> dict:
+    r = requests.get(url, params=params, timeout=30)
+    r.raise_for_status()
+    return r.json()
+
+def main() -> int:
+    if not CWA_API_KEY:
+        print("CWA_API_KEY is required", file=sys.stderr)
+        return 1
+    now = datetime.now(timezone.utc)
+    _save("cwa_alarm.json", _get(CWA_ALARM_API))
+    _save("cwa_significant.json", _get(CWA_SIGNIFICANT_API, {
+        "Authorization": CWA_API_KEY, "format": "JSON", "timeFrom": (now - timedelta(days=7)).strftime("%Y-%m-%d"),
+    }))
+    _save("usgs_global.json", _get(USGS_API_BASE_URL, {
+        "format": "geojson", "starttime": _iso(now - timedelta(hours=24)), "endtime": _iso(now),
+        "minmagnitude": 5.0, "limit": 10, "orderby": "time",
+    }))
+    _save("usgs_taiwan.json", _get(USGS_API_BASE_URL, {
+        "format": "geojson", "starttime": _iso(datetime(now.year, 1, 1, tzinfo=timezone.utc)), "endtime": _iso(now),
+        "minmagnitude": 4.0, "minlatitude": 21, "maxlatitude": 26, "minlongitude": 119, "maxlongitude": 123,
+        "limit": 250, "orderby": "time",
+    }))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
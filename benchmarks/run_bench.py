@@ -0,0 +1,325 @@
+# benchmarks/run_bench.py
+"""
+離線效能測試：所有外部服務 (CWA、USGS、Gemini、MCP、LINE) 皆由 stub_servers 以錄製的 fixture 回應。
+
+    python benchmarks/run_bench.py
+    python benchmarks/run_bench.py --output after.json --baseline before.json
+    python benchmarks/run_bench.py --skip-callback --upstream-latency-ms 80
+
+量測項目 (JSON 輸出，可用 --baseline 與前一次結果比較)：
+- commands：每個指令經由 process_message 的延遲百分位數
+    uncached = 每次都清空回應快取 (包含連到 stub 上游的 HTTP 往返)
+    cached   = 上游回應已在快取中，只剩解析與格式化
+- parse_format：不經 HTTP，直接對 fixture 解析與格式化的成本
+- report_images：報告圖代理；fresh = 每次使用新的地震編號 (從 stub 下載、縮圖並寫入 asset_store)，
+  reused = 圖檔已存在
+- callback：以 gunicorn 啟動 app，並行送出已簽章的 webhook，
+  量測 /callback 的回應延遲、每秒請求數，以及到 LINE stub 收到全部回覆為止的端對端吞吐量
+"""
+import argparse
+import base64
+import contextlib
+import hashlib
+import hmac
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+from stub_servers import StubUpstreams, load_fixture
+
+CHANNEL_SECRET = "benchmark-channel-secret"
+
+# 名稱 -> 使用者輸入
+COMMANDS = {
+    "latest": "1",
+    "global": "2",
+    "taiwan": "3",
+    "alert": "5",
+    "significant": "6",
+    "help": "9",
+    "plot": "台灣地震畫圖",
+    "greeting": "你好",
+    "ai": "7 2024年台灣規模5以上最大的地震是哪一個",
+}
+
+# /callback 壓力測試輪流送出的訊息
+CALLBACK_MESSAGES = ["1", "2", "3", "5", "6", "9", "你好"]
+
+def summarize(samples: list) -> dict:
+    """延遲樣本 (秒) 的百分位數 (毫秒)。"""
+    ordered = sorted(samples)
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000, 3)
+
+    return {
+        "n": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": pct(50), "p90_ms": pct(90), "p99_ms": pct(99),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+def _timed(fn, iterations: int, before=None) -> dict:
+    samples = []
+    for _ in range(iterations):
+        if before:
+            before()
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+def _git_rev() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# ------------------------------------------------------------------------------
+# 行程內：process_message 與解析/格式化
+# ------------------------------------------------------------------------------
+def bench_commands(iterations: int, cached_iterations: int) -> dict:
+    import command_handler
+    import mcp_client
+    from response_cache import feed_cache
+
+    def clear_caches():
+        feed_cache.invalidate()
+        mcp_client.result_cache.invalidate()
+
+    results = {}
+    for name, text in COMMANDS.items():
+        run = lambda: command_handler.process_message(text, "http://127.0.0.1")
+        # 第一次呼叫包含延遲載入模組、建立連線等一次性成本，單獨記錄
+        clear_caches()
+        started = time.perf_counter()
+        reply = run()
+        first_ms = round((time.perf_counter() - started) * 1000, 3)
+        results[name] = {
+            "first_call_ms": first_ms,
+            "reply_messages": len(reply),
+            "uncached": _timed(run, iterations, before=clear_caches),
+            "cached": _timed(run, cached_iterations),
+        }
+    return results
+
+def bench_parse_format(iterations: int) -> dict:
+    import cwa_service
+    import result_compactor
+    from quake_models import Quake, QuakeBatch
+
+    significant = load_fixture("cwa_significant.json")
+    taiwan = load_fixture("usgs_taiwan.json")["features"]
+    search = load_fixture("mcp_search.json")
+    return {
+        "cwa_significant_parse": _timed(lambda: cwa_service._parse_significant_earthquakes(significant), iterations),
+        "usgs_taiwan_batch": _timed(lambda: QuakeBatch.from_quakes(map(Quake.from_usgs_feature, taiwan)), iterations),
+        "tool_result_compact": _timed(lambda: result_compactor.compact(search), max(1, iterations // 10)),
+    }
+
+def bench_report_images(stubs: StubUpstreams, iterations: int, cached_iterations: int) -> dict:
+    import report_images
+
+    # 與 cwa_significant.json 改寫後的 ReportImageURI 相同，皆由 CWA stub 回應 fixtures/cwa_report.png
+    image_url = f"{stubs.servers['cwa'].url}/webdata/OLDEQ/bench/report.png"
+    if report_images.get_report_images("bench", image_url) is None:
+        raise RuntimeError("報告圖代理未啟用或處理失敗")
+    return {
+        "fresh": _timed(lambda: report_images.get_report_images(uuid.uuid4().hex, image_url), iterations),
+        "reused": _timed(lambda: report_images.get_report_images("bench", image_url), cached_iterations),
+    }
+
+# ------------------------------------------------------------------------------
+# gunicorn + /callback 壓力測試
+# ------------------------------------------------------------------------------
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _webhook_body(text: str) -> bytes:
+    event = {
+        "type": "message", "mode": "active", "timestamp": int(time.time() * 1000),
+        "source": {"type": "user", "userId": "U" + uuid.uuid4().hex},
+        "webhookEventId": uuid.uuid4().hex.upper()[:26],
+        "deliveryContext": {"isRedelivery": False},
+        "replyToken": uuid.uuid4().hex,
+        "message": {"id": str(uuid.uuid4().int)[:18], "type": "text", "quoteToken": uuid.uuid4().hex, "text": text},
+    }
+    return json.dumps({"destination": "U" + "0" * 32, "events": [event]}, ensure_ascii=False).encode()
+
+def _sign(body: bytes) -> str:
+    return base64.b64encode(hmac.new(CHANNEL_SECRET.encode(), body, hashlib.sha256).digest()).decode()
+
+def _post(url: str, body: bytes) -> float:
+    request = urllib.request.Request(url, data=body, method="POST", headers={
+        "Content-Type": "application/json", "X-Line-Signature": _sign(body),
+    })
+    started = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=30) as r:
+        r.read()
+        if r.status != 200:
+            raise RuntimeError(f"/callback returned {r.status}")
+    return time.perf_counter() - started
+
+def bench_callback(stubs: StubUpstreams, env: dict, requests: int, concurrency: int,
+                   workers: int, reply_timeout: float) -> dict:
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "--workers", str(workers), "--bind", f"127.0.0.1:{port}", "app:app"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.perf_counter() + 60
+        while True:
+            try:
+                with urllib.request.urlopen(f"{base}/healthz", timeout=1):
+                    break
+            except OSError:
+                if proc.poll() is not None or time.perf_counter() > deadline:
+                    raise RuntimeError("gunicorn did not start")
+                time.sleep(0.05)
+
+        # 預熱：每個 worker 先處理一輪各種指令，讓上游回應進入快取
+        for text in CALLBACK_MESSAGES * workers:
+            _post(f"{base}/callback", _webhook_body(text))
+        line = stubs.servers["line"]
+        expected_warm = len(CALLBACK_MESSAGES) * workers
+        _wait_for_replies(line, expected_warm, reply_timeout)
+        stubs.reset_counts()
+
+        bodies = [_webhook_body(CALLBACK_MESSAGES[i % len(CALLBACK_MESSAGES)]) for i in range(requests)]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            latencies = list(pool.map(lambda b: _post(f"{base}/callback", b), bodies))
+        posted = time.perf_counter() - started
+        replies, last_reply = _wait_for_replies(line, requests, reply_timeout)
+
+        try:
+            with urllib.request.urlopen(f"{base}/stats", timeout=5) as r:
+                server_stats = json.loads(r.read())
+        except (OSError, ValueError):
+            server_stats = {}
+        return {
+            "workers": workers, "concurrency": concurrency, "requests": requests,
+            "ack": summarize(latencies),
+            "ack_per_s": round(requests / posted, 1),
+            "replies": replies,
+            "end_to_end_s": round(last_reply - started, 3) if last_reply else None,
+            "replies_per_s": round(replies / (last_reply - started), 1) if last_reply else None,
+            "upstream_calls": stubs.counts(),
+            "dispatcher": server_stats.get("dispatcher"),
+        }
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+def _wait_for_replies(line_server, expected: int, timeout: float) -> tuple[int, float | None]:
+    """等待 LINE stub 收到 expected 則回覆 (reply 或 push)，回傳 (收到的數量, 最後一則的時間)。"""
+    deadline = time.perf_counter() + timeout
+    while True:
+        with line_server.lock:
+            stamps = line_server.timestamps["/v2/bot/message/reply"] + line_server.timestamps["/v2/bot/message/push"]
+        if len(stamps) >= expected or time.perf_counter() > deadline:
+            return len(stamps), max(stamps) if stamps else None
+        time.sleep(0.02)
+
+# ------------------------------------------------------------------------------
+# 與前一次結果比較
+# ------------------------------------------------------------------------------
+def _flatten(obj, prefix="") -> dict:
+    flat = {}
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            flat.update(_flatten(v, f"{prefix}.{k}" if prefix else k))
+    elif isinstance(obj, (int, float)) and not isinstance(obj, bool):
+        flat[prefix] = obj
+    return flat
+
+def compare(current: dict, baseline: dict) -> dict:
+    """列出兩次結果中延遲 (*_ms) 與吞吐量 (*_per_s) 指標的變化百分比。"""
+    cur, base = _flatten(current), _flatten(baseline)
+    changes = {}
+    for key, value in cur.items():
+        if not key.endswith(("_ms", "_per_s")) or key.startswith("meta.") or not base.get(key):
+            continue
+        changes[key] = {"baseline": base[key], "current": value,
+                        "change_pct": round((value - base[key]) / base[key] * 100, 1)}
+    return changes
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20, help="每個指令 uncached 的次數")
+    parser.add_argument("--cached-iterations", type=int, default=200, help="每個指令 cached 的次數")
+    parser.add_argument("--upstream-latency-ms", type=float, default=0, help="stub 上游每個回應的額外延遲")
+    parser.add_argument("--skip-callback", action="store_true", help="不執行 gunicorn /callback 壓力測試")
+    parser.add_argument("--requests", type=int, default=300, help="/callback 壓力測試的請求數")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=1, help="gunicorn worker 數 (Dockerfile 預設為 1)")
+    parser.add_argument("--reply-timeout", type=float, default=120, help="等待 LINE stub 收到全部回覆的秒數上限")
+    parser.add_argument("--output", help="將結果寫入 JSON 檔")
+    parser.add_argument("--baseline", help="與先前輸出的 JSON 比較")
+    args = parser.parse_args()
+
+    stubs = StubUpstreams(latency=args.upstream_latency_ms / 1000).start()
+    workdir = tempfile.mkdtemp(prefix="line-robot-bench-")
+    env = {
+        **os.environ, **stubs.env(),
+        "CHANNEL_SECRET": CHANNEL_SECRET,
+        "DATA_DIR": os.path.join(workdir, "data"),
+        "STATIC_DIR": os.path.join(workdir, "static"),
+        "CATALOG_DB_PATH": os.path.join(workdir, "catalog.sqlite3"),
+        "FEED_POLLER_ENABLED": "false",
+        "WARMUP_ON_START": "false",
+    }
+    os.environ.update(env)
+
+    report = {"meta": {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "git_rev": _git_rev(),
+        "python": sys.version.split()[0], "args": vars(args),
+    }}
+    # 各模組的執行紀錄會印到 stdout，改導向 stderr 以保持 stdout 為純 JSON
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            report["commands"] = bench_commands(args.iterations, args.cached_iterations)
+            report["parse_format"] = bench_parse_format(args.cached_iterations)
+            report["report_images"] = bench_report_images(stubs, args.iterations, args.cached_iterations)
+            if not args.skip_callback:
+                # 行程內測試已建立地震目錄，讓 gunicorn 使用獨立的目錄以量測相同的冷啟動情境
+                callback_env = {**env, "CATALOG_DB_PATH": os.path.join(workdir, "catalog-callback.sqlite3")}
+                report["callback"] = bench_callback(stubs, callback_env, args.requests, args.concurrency,
+                                                    args.workers, args.reply_timeout)
+    finally:
+        stubs.stop()
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            report["comparison"] = compare(report, json.load(f))
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
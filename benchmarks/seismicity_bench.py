@@ -0,0 +1,134 @@
+# benchmarks/seismicity_bench.py
+"""
+以合成的本地目錄量測地震活動統計指令 (seismicity) 的延遲，並驗證增量更新的結果與整份重建相同：
+
+1. 建立 N 筆事件的 SQLite 目錄 (規模依 b=1 的 Gutenberg–Richter 分布，另含一個 M7 主震序列)；
+2. 量測第一次建立彙總表、餘震分群與各指令的回覆延遲；
+3. 新增與修改少量事件後量測增量更新的耗時，並與重新建立的彙總表比較；
+4. 刪除事件後確認會整份重建。
+
+    python benchmarks/seismicity_bench.py
+    python benchmarks/seismicity_bench.py --events 50000 --repeat 50 --output result.json
+
+輸出 JSON；任一項檢查失敗時以結束碼 1 結束。
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+def make_events(n: int, seed: int = 7) -> list[tuple]:
+    """合成事件 (欄位對應 catalog_store.COLUMNS)：背景地震均勻分布於 2000 年至今，外加一個主震序列。"""
+    rng = np.random.default_rng(seed)
+    start = datetime(2000, 1, 1, tzinfo=timezone.utc).timestamp() * 1000
+    now = time.time() * 1000
+    times = rng.uniform(start, now, n)
+    mags = np.round(4.0 - np.log10(rng.uniform(size=n)), 1)
+    lats, lons = rng.uniform(21, 26, n), rng.uniform(119, 123, n)
+    # M7.0 主震，以及之後數十天內在附近發生的餘震
+    main_t = now - 200 * 86_400_000
+    k = n // 50
+    times = np.concatenate([times, [main_t], main_t + rng.exponential(5, k) * 86_400_000])
+    mags = np.concatenate([mags, [7.0], np.minimum(np.round(4.0 - np.log10(rng.uniform(size=k)), 1), 6.5)])
+    lats = np.concatenate([lats, [23.8], 23.8 + rng.normal(0, 0.1, k)])
+    lons = np.concatenate([lons, [121.6], 121.6 + rng.normal(0, 0.1, k)])
+    keep = times < now
+    return [
+        (f"syn{i}", int(t), int(t), float(lat), float(lon), 10.0, float(m), "", "")
+        for i, (t, lat, lon, m) in enumerate(zip(times[keep], lats[keep], lons[keep], mags[keep]))
+    ]
+
+def _write(conn, rows: list[tuple], catalog_store) -> None:
+    cols = catalog_store.COLUMNS
+    with conn:
+        conn.executemany(f"INSERT OR REPLACE INTO events ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})", rows)
+        max_updated = conn.execute("SELECT MAX(updated_ms) FROM events").fetchone()[0]
+        catalog_store._set_meta(conn, "last_updated_ms", max_updated)
+        catalog_store._set_meta(conn, "last_sync_at", time.time())
+
+def _timed(fn) -> float:
+    started = time.perf_counter()
+    fn()
+    return (time.perf_counter() - started) * 1000
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=20000, help="合成的背景事件數")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output", help="將結果寫入 JSON 檔")
+    args = parser.parse_args()
+
+    os.environ["CATALOG_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="catalog_"), "catalog.sqlite3")
+    import catalog_store
+    import seismicity
+
+    conn = catalog_store.connect()
+    events = make_events(args.events)
+    _write(conn, events, catalog_store)
+    rollup = seismicity.rollup
+    result = {"events": len(events), "first_build_ms": round(_timed(lambda: rollup.refresh(force=True)), 1)}
+    result["first_cluster_ms"] = round(_timed(rollup.clusters), 1)
+
+    reports = {
+        "activity": seismicity.activity_report, "daily": seismicity.daily_report,
+        "monthly": seismicity.monthly_report, "bvalue": seismicity.b_value_report,
+        "aftershocks": seismicity.aftershock_report,
+    }
+    result["reply_median_ms"] = {
+        name: round(statistics.median(_timed(fn) for _ in range(args.repeat)), 2) for name, fn in reports.items()
+    }
+    texts = {name: fn() for name, fn in reports.items()}
+
+    # --- 增量更新：新增 100 筆、修改 20 筆的規模 ---
+    now_ms = int(time.time() * 1000)
+    added = [(f"new{i}", now_ms - i * 60_000, now_ms + i, 24.0, 121.5, 10.0, 4.5, "", "") for i in range(100)]
+    modified = [(e[0], e[1], now_ms + 1000 + i, e[3], e[4], e[5], round(e[6] + 0.5, 1), "", "")
+                for i, e in enumerate(events[:20])]
+    _write(conn, added + modified, catalog_store)
+    result["incremental_update_ms"] = round(_timed(lambda: rollup.refresh(force=True)), 2)
+    result["recluster_ms"] = round(_timed(rollup.clusters), 1)
+    incremental = rollup.rows(seismicity.FIRST_DAY, seismicity._today() + 1)
+
+    checks = {}
+    rebuilt = seismicity.SeismicityRollup()
+    rebuilt.refresh(force=True)
+    checks["incremental_equals_rebuild"] = bool(np.array_equal(
+        incremental, rebuilt.rows(seismicity.FIRST_DAY, seismicity._today() + 1)))
+    checks["counts_match_catalog"] = int(incremental.sum()) == len(events) + len(added)
+
+    # --- 刪除事件：筆數不符時整份重建 ---
+    with conn:
+        conn.execute("DELETE FROM events WHERE id IN ('new0', 'new1')")
+    before = rollup.stats()["rebuilds"]
+    rollup.refresh(force=True)
+    checks["delete_triggers_rebuild"] = rollup.stats()["rebuilds"] == before + 1
+    checks["counts_after_delete"] = int(rollup.rows(seismicity.FIRST_DAY, seismicity._today() + 1).sum()) == len(events) + 98
+
+    fit = seismicity.fit_gutenberg_richter(incremental.sum(axis=0))
+    checks["b_value_near_1"] = fit is not None and abs(fit["b"] - 1.0) < 0.15
+    c = rollup.clusters()
+    # 合成的主震 (背景事件中可能有更大的地震)
+    main = int(np.nonzero((c.magnitude == 7.0) & (c.latitude == 23.8) & (c.longitude == 121.6))[0][0])
+    checks["mainshock_has_aftershocks"] = int((c.parent == main).sum() - 1) >= (args.events // 50) * 0.8
+    conn.close()
+
+    ok = all(checks.values())
+    result.update({"b_value": round(fit["b"], 3) if fit else None, "checks": checks, "ok": ok})
+    text = json.dumps(result, indent=2, ensure_ascii=False)
+    print(text)
+    print("\n\n".join(texts.values()))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+# benchmarks/startup_bench.py
+"""
+量測 webhook 行程的冷啟動成本，並可設定上限以防止效能退化。
+
+    python benchmarks/startup_bench.py
+    python benchmarks/startup_bench.py --max-import-ms 2500 --max-healthz-ms 5000 --max-rss-mb 250
+
+量測項目 (以 JSON 輸出)：
+- import_ms: `import app` 的總時間，以及各專案模組與最耗時第三方套件的累計匯入時間 (python -X importtime)
+- healthz_ms: 從啟動 gunicorn 到第一次 /healthz 回應 200 的時間
+- rss_mb: 第一次 /healthz 之後，以及背景預熱完成之後的 worker 常駐記憶體
+任一項超過指定上限時以結束碼 1 離開。
+"""
+import argparse
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 未設定時使用假的憑證，讓 app 可以在沒有 LINE 設定的環境中匯入
+BENCH_ENV = {
+    "CHANNEL_SECRET": "benchmark-secret",
+    "CHANNEL_ACCESS_TOKEN": "benchmark-token",
+}
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+def _env(**extra) -> dict:
+    env = {**os.environ, **extra}
+    for key, value in BENCH_ENV.items():
+        env.setdefault(key, value)
+    return env
+
+def _project_modules() -> set:
+    return {name[:-3] for name in os.listdir(ROOT) if name.endswith(".py")}
+
+def measure_imports(top: int) -> dict:
+    """以 -X importtime 匯入 app，回傳總時間、專案模組與最耗時的第三方套件 (毫秒)。"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=ROOT, env=_env(), capture_output=True, text=True, check=True,
+    )
+    project = _project_modules()
+    modules, third_party = {}, {}
+    for line in proc.stderr.splitlines():
+        m = IMPORTTIME_LINE.match(line)
+        if not m:
+            continue
+        cumulative_ms = int(m.group(2)) / 1000
+        name = m.group(4)
+        if name in project:
+            modules[name] = round(cumulative_ms, 1)
+        else:
+            # 同一套件的子模組可能分別被匯入，取最大的累計時間
+            root = name.split(".")[0]
+            third_party[root] = max(third_party.get(root, 0), round(cumulative_ms, 1))
+    heaviest = dict(sorted(third_party.items(), key=lambda kv: kv[1], reverse=True)[:top])
+    return {"total_ms": modules.get("app"), "modules": modules, "third_party": heaviest}
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _get(url: str, timeout: float = 1.0) -> bytes | None:
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as r:
+            return r.read() if r.status == 200 else None
+    except OSError:
+        return None
+
+def _rss_mb(pid: int) -> float | None:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+def _worker_pids(master_pid: int) -> list:
+    try:
+        with open(f"/proc/{master_pid}/task/{master_pid}/children") as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+def measure_server(timeout: float, warmup_timeout: float) -> dict:
+    """以與 Dockerfile 相同的方式啟動 gunicorn，量測第一次 /healthz 的時間與 worker 記憶體。"""
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "--workers", "1", "--bind", f"127.0.0.1:{port}", "app:app"],
+        cwd=ROOT, env=_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    result = {"healthz_ms": None, "rss_mb": None, "rss_after_warmup_mb": None, "warmup": None}
+    try:
+        while time.perf_counter() - started < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError(f"gunicorn exited with code {proc.returncode}")
+            if _get(f"{base}/healthz") is not None:
+                result["healthz_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                break
+            time.sleep(0.02)
+        else:
+            raise RuntimeError(f"/healthz did not respond within {timeout}s")
+
+        workers = _worker_pids(proc.pid)
+        worker = workers[0] if workers else proc.pid
+        result["rss_mb"] = _rss_mb(worker)
+
+        # 等待背景預熱完成 (WARMUP_ON_START 停用時 state 會維持 idle)
+        deadline = time.perf_counter() + warmup_timeout
+        while time.perf_counter() < deadline:
+            body = _get(f"{base}/stats", timeout=5)
+            warmup = json.loads(body).get("warmup") if body else None
+            if not warmup or warmup.get("state") in ("idle", "done"):
+                result["warmup"] = warmup
+                break
+            time.sleep(0.2)
+        result["rss_after_warmup_mb"] = _rss_mb(worker)
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+    return result
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=10, help="列出最耗時的第三方套件數量")
+    parser.add_argument("--timeout", type=float, default=60, help="等待 /healthz 的秒數上限")
+    parser.add_argument("--warmup-timeout", type=float, default=60, help="等待背景預熱完成的秒數上限")
+    parser.add_argument("--skip-server", action="store_true", help="只量測匯入時間，不啟動 gunicorn")
+    parser.add_argument("--max-import-ms", type=float, help="import app 的時間上限")
+    parser.add_argument("--max-healthz-ms", type=float, help="第一次 /healthz 的時間上限")
+    parser.add_argument("--max-rss-mb", type=float, help="第一次 /healthz 後 worker 記憶體上限")
+    parser.add_argument("--output", help="將結果寫入 JSON 檔")
+    args = parser.parse_args()
+
+    report = {"python": sys.version.split()[0], "imports": measure_imports(args.top)}
+    if not args.skip_server:
+        report["server"] = measure_server(args.timeout, args.warmup_timeout)
+
+    checks = [
+        ("import_ms", report["imports"]["total_ms"], args.max_import_ms),
+        ("healthz_ms", report.get("server", {}).get("healthz_ms"), args.max_healthz_ms),
+        ("rss_mb", report.get("server", {}).get("rss_mb"), args.max_rss_mb),
+    ]
+    report["budget_exceeded"] = [name for name, value, limit in checks
+                                 if limit is not None and value is not None and value > limit]
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    return 1 if report["budget_exceeded"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,333 @@
+# benchmarks/stub_servers.py
+"""
+以 benchmarks/fixtures/ 中錄製的回應模擬外部服務的本地 HTTP 伺服器。
+
+每個上游各自使用一個連接埠，路徑與真實 API 相同，因此只需以環境變數覆寫 config 中的端點：
+- CWA：地震預警清單 (CWA_ALARM_API) 與顯著有感地震報告 E-A0015-001 (CWA_SIGNIFICANT_API)；
+  報告中的 ReportImageURI 改指向本地伺服器，以 fixtures/cwa_report.png 回應報告圖
+- USGS：fdsnws event query (USGS_API_BASE_URL)；帶有台灣經緯度範圍的查詢回傳台灣區域資料
+- Gemini：REST generateContent (GEMINI_API_ENDPOINT)；第一輪要求呼叫地震搜尋工具，收到工具結果後回傳文字
+- MCP：Gradio 5 的 /config、/info 與 SSE 佇列協定 (MCP_SERVER_URL)
+- LINE：reply / push / multicast (LINE_API_HOST)，只記錄呼叫次數與時間
+
+    python benchmarks/stub_servers.py          # 啟動並印出可直接 export 的環境變數
+"""
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+MCP_API_NAME = "gradio_fetch_and_plot_data"
+MCP_PARAMETERS = 12
+
+def load_fixture(name: str) -> dict:
+    with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+        return json.load(f)
+
+def load_binary_fixture(name: str) -> bytes:
+    with open(os.path.join(FIXTURES_DIR, name), "rb") as f:
+        return f.read()
+
+def rebase_report_images(report: dict, base_url: str) -> dict:
+    """把報告圖網址的主機換成本地伺服器 (保留路徑)，避免基準測試連到真實的 CWA。"""
+    for quake in report.get("records", {}).get("Earthquake", []):
+        if quake.get("ReportImageURI"):
+            quake["ReportImageURI"] = base_url + urlparse(quake["ReportImageURI"]).path
+    return report
+
+def rebase_usgs_times(collection: dict, newest: datetime) -> dict:
+    """把 GeoJSON 的事件時間整體平移，使最新一筆落在 newest (保留事件間的間隔)。"""
+    features = collection.get("features", [])
+    if not features:
+        return collection
+    shift = int(newest.timestamp() * 1000) - max(f["properties"]["time"] for f in features)
+    for f in features:
+        f["properties"]["time"] += shift
+        f["properties"]["updated"] += shift
+    return collection
+
+class StubServer(ThreadingHTTPServer):
+    """記錄每個路徑的請求次數，並可為每個回應加上固定延遲以模擬網路往返。"""
+    daemon_threads = True
+
+    def __init__(self, name: str, handler, latency: float = 0.0):
+        super().__init__(("127.0.0.1", 0), handler)
+        self.name = name
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.counts = defaultdict(int)
+        self.timestamps = defaultdict(list)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def record(self, path: str) -> None:
+        with self.lock:
+            self.counts[path] += 1
+            self.timestamps[path].append(time.perf_counter())
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # 標頭與本文合併成一次寫入並停用 Nagle，避免 keep-alive 連線上出現 40ms 的延遲 ACK
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def _send_json(self, obj, status: int = 200) -> None:
+        out = json.dumps(obj, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def _send_bytes(self, data: bytes, content_type: str) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _begin(self) -> tuple[str, dict]:
+        parsed = urlparse(self.path)
+        self.server.record(parsed.path)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        return parsed.path, {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+
+class CWAHandler(_Handler):
+    def do_GET(self):
+        path, _ = self._begin()
+        if path.endswith("/alarm/list"):
+            return self._send_json(self.server.fixtures["alarm"])
+        if path.endswith("/E-A0015-001"):
+            return self._send_json(self.server.fixtures["significant"])
+        if path.endswith(".png"):
+            return self._send_bytes(self.server.report_image, "image/png")
+        self._send_json({"success": False}, 404)
+
+class USGSHandler(_Handler):
+    def do_GET(self):
+        path, params = self._begin()
+        if not path.endswith("/query"):
+            return self._send_json({}, 404)
+        if "minlatitude" not in params:
+            return self._send_json(self.server.fixtures["global"])
+        # 地震目錄以 offset 分頁，fixture 只有一頁
+        if int(params.get("offset", 1)) > 1:
+            return self._send_json({**self.server.fixtures["taiwan"], "features": []})
+        self._send_json(self.server.fixtures["taiwan"])
+
+class GeminiHandler(_Handler):
+    def do_POST(self):
+        path, _ = self._begin()
+        body = json.loads(self._body() or b"{}")
+        last = (body.get("contents") or [{}])[-1]
+        has_tool_result = any("functionResponse" in part or "function_response" in part for part in last.get("parts", []))
+        if not path.endswith(":generateContent"):
+            return self._send_json({"error": {"code": 404}}, 404)
+        self._send_json(self.server.fixtures["answer" if has_tool_result else "tool_call"])
+
+class MCPHandler(_Handler):
+    """Gradio 5 (sse_v3) 協定的最小實作，足以讓 gradio_client.Client 建立連線並呼叫 predict。"""
+
+    def do_GET(self):
+        path, params = self._begin()
+        if path == "/config":
+            return self._send_json(self.server.gradio_config)
+        if path == "/gradio_api/info":
+            return self._send_json(self.server.gradio_info)
+        if path == "/gradio_api/queue/data":
+            return self._stream(params.get("session_hash", ""))
+        self._send_json({}, 404)
+
+    def do_POST(self):
+        path, _ = self._begin()
+        body = json.loads(self._body() or b"{}")
+        if path != "/gradio_api/queue/join":
+            return self._send_json({}, 404)
+        event_id = uuid.uuid4().hex
+        self.server.session_queue(body.get("session_hash", "")).put(event_id)
+        self._send_json({"event_id": event_id})
+
+    def _stream(self, session_hash: str) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        pending = self.server.session_queue(session_hash)
+        output = {"data": [self.server.fixtures["search"], None], "is_generating": False}
+        while True:
+            try:
+                event_id = pending.get(timeout=0.5)
+            except queue.Empty:
+                break
+            msg = {"msg": "process_completed", "event_id": event_id, "success": True, "output": output}
+            self.wfile.write(b"data: " + json.dumps(msg, ensure_ascii=False).encode() + b"\n\n")
+            self.wfile.flush()
+        self.wfile.write(b'data: {"msg": "close_stream"}\n\n')
+        self.wfile.flush()
+
+class LINEHandler(_Handler):
+    """
+    回覆 reply / push / multicast。multicast 會記錄收件人與 X-Line-Retry-Key，
+    重複的 retry key 回應 409 (與 LINE 相同)；server.fail_next > 0 時下一個請求回應 500。
+    """
+
+    def do_POST(self):
+        path, _ = self._begin()
+        body = self._body()
+        if not path.startswith("/v2/bot/message/"):
+            return self._send_json({"message": "Not found"}, 404)
+        server = self.server
+        retry_key = self.headers.get("X-Line-Retry-Key")
+        with server.lock:
+            if server.fail_next > 0:
+                server.fail_next -= 1
+                failed, duplicate = True, False
+            else:
+                failed, duplicate = False, retry_key is not None and retry_key in server.retry_keys
+                if retry_key is not None:
+                    server.retry_keys.add(retry_key)
+                if path.endswith("/multicast") and not duplicate:
+                    server.multicasts.append({"to": json.loads(body).get("to", []), "retry_key": retry_key,
+                                              "at": time.perf_counter()})
+        if failed:
+            return self._send_json({"message": "Stub failure"}, 500)
+        if duplicate:
+            return self._send_json({"message": "The retry key is already accepted", "sentMessages": []}, 409)
+        if path.endswith("/multicast"):
+            return self._send_json({})
+        self._send_json({"sentMessages": [{"id": uuid.uuid4().hex[:16], "quoteToken": "stub"}]})
+
+def _gradio_config() -> tuple[dict, dict]:
+    inputs = list(range(1, MCP_PARAMETERS + 1))
+    components = [{"id": i, "type": "textbox", "props": {}, "skip_api": False, "api_info": {"type": "string"}} for i in inputs]
+    components += [
+        {"id": 100, "type": "dataframe", "props": {}, "skip_api": False, "api_info": {"type": "object"}},
+        {"id": 101, "type": "plot", "props": {}, "skip_api": False, "api_info": {"type": "object"}},
+    ]
+    config = {
+        "version": "5.0.0", "protocol": "sse_v3", "api_prefix": "/gradio_api", "connect_heartbeat": False,
+        "components": components,
+        "dependencies": [{
+            "id": 0, "api_name": MCP_API_NAME, "inputs": inputs, "outputs": [100, 101],
+            "backend_fn": True, "queue": True, "show_api": True, "types": {"generator": False, "cancel": False},
+        }],
+    }
+    info = {"named_endpoints": {f"/{MCP_API_NAME}": {
+        "parameters": [
+            {"parameter_name": f"param_{i}", "label": f"param_{i}", "type": {"type": "string"},
+             "python_type": {"type": "str"}, "component": "Textbox", "parameter_has_default": False}
+            for i in range(MCP_PARAMETERS)
+        ],
+        "returns": [
+            {"label": "table", "type": {"type": "object"}, "python_type": {"type": "dict"}, "component": "Dataframe"},
+            {"label": "plot", "type": {"type": "object"}, "python_type": {"type": "dict"}, "component": "Plot"},
+        ],
+    }}, "unnamed_endpoints": {}}
+    return config, info
+
+class StubUpstreams:
+    """啟動所有上游的 stub 伺服器；latency 為每個回應的額外延遲 (秒)。"""
+
+    def __init__(self, latency: float = 0.0):
+        now = datetime.now(timezone.utc)
+        newest = now - timedelta(hours=1)
+        self.servers = {
+            "cwa": StubServer("cwa", CWAHandler, latency),
+            "usgs": StubServer("usgs", USGSHandler, latency),
+            "gemini": StubServer("gemini", GeminiHandler, latency),
+            "mcp": StubServer("mcp", MCPHandler, latency),
+            "line": StubServer("line", LINEHandler, 0.0),
+        }
+        self.servers["cwa"].fixtures = {
+            "alarm": load_fixture("cwa_alarm.json"),
+            "significant": rebase_report_images(load_fixture("cwa_significant.json"), self.servers["cwa"].url),
+        }
+        self.servers["cwa"].report_image = load_binary_fixture("cwa_report.png")
+        self.servers["usgs"].fixtures = {
+            "global": rebase_usgs_times(load_fixture("usgs_global.json"), newest),
+            "taiwan": rebase_usgs_times(load_fixture("usgs_taiwan.json"), newest),
+        }
+        self.servers["gemini"].fixtures = {
+            "tool_call": load_fixture("gemini_tool_call.json"),
+            "answer": load_fixture("gemini_answer.json"),
+        }
+        mcp = self.servers["mcp"]
+        mcp.fixtures = {"search": load_fixture("mcp_search.json")}
+        mcp.gradio_config, mcp.gradio_info = _gradio_config()
+        sessions, sessions_lock = {}, threading.Lock()
+
+        def session_queue(session_hash: str) -> queue.Queue:
+            with sessions_lock:
+                return sessions.setdefault(session_hash, queue.Queue())
+
+        mcp.session_queue = session_queue
+        line = self.servers["line"]
+        line.fail_next, line.retry_keys, line.multicasts = 0, set(), []
+
+    def start(self) -> "StubUpstreams":
+        for server in self.servers.values():
+            threading.Thread(target=server.serve_forever, name=f"stub-{server.name}", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        for server in self.servers.values():
+            server.shutdown()
+            server.server_close()
+
+    def env(self) -> dict:
+        """覆寫 config 端點所需的環境變數 (以及讓功能可以運作的假金鑰)。"""
+        return {
+            "CWA_ALARM_API": f"{self.servers['cwa'].url}/api/v1/earthquake/alarm/list",
+            "CWA_SIGNIFICANT_API": f"{self.servers['cwa'].url}/api/v1/rest/datastore/E-A0015-001",
+            "USGS_API_BASE_URL": f"{self.servers['usgs'].url}/fdsnws/event/1/query",
+            "GEMINI_API_ENDPOINT": self.servers["gemini"].url,
+            "MCP_SERVER_URL": self.servers["mcp"].url,
+            "LINE_API_HOST": self.servers["line"].url,
+            "CWA_API_KEY": "stub-cwa-key",
+            "GEMINI_API_KEY": "stub-gemini-key",
+            "CHANNEL_ACCESS_TOKEN": "stub-channel-token",
+            "GRADIO_ANALYTICS_ENABLED": "False",
+            "HF_HUB_DISABLE_TELEMETRY": "1",
+        }
+
+    def counts(self) -> dict:
+        return {name: dict(server.counts) for name, server in self.servers.items()}
+
+    def reset_counts(self) -> None:
+        for server in self.servers.values():
+            with server.lock:
+                server.counts.clear()
+                server.timestamps.clear()
+        line = self.servers["line"]
+        with line.lock:
+            line.fail_next = 0
+            line.retry_keys.clear()
+            line.multicasts.clear()
+
+if __name__ == "__main__":
+    stubs = StubUpstreams().start()
+    for key, value in stubs.env().items():
+        print(f"export {key}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stubs.stop()
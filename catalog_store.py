@@ -0,0 +1,244 @@
+# catalog_store.py
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+import http_client
+import shared_cache
+from config import (
+    USGS_API_BASE_URL, CATALOG_DB_PATH,
+    CATALOG_MIN_LATITUDE, CATALOG_MAX_LATITUDE, CATALOG_MIN_LONGITUDE, CATALOG_MAX_LONGITUDE,
+    CATALOG_MIN_MAGNITUDE, CATALOG_START_TIME, CATALOG_SYNC_INTERVAL, CATALOG_PAGE_SIZE,
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id TEXT PRIMARY KEY,
+    time_ms INTEGER NOT NULL,
+    updated_ms INTEGER NOT NULL,
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL,
+    depth REAL,
+    magnitude REAL,
+    place TEXT,
+    url TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_events_time ON events (time_ms);
+CREATE INDEX IF NOT EXISTS idx_events_mag ON events (magnitude);
+CREATE INDEX IF NOT EXISTS idx_events_updated ON events (updated_ms);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+COLUMNS = ("id", "time_ms", "updated_ms", "latitude", "longitude", "depth", "magnitude", "place", "url")
+
+_sync_lock = threading.Lock()
+_initial_lock = threading.Lock()
+_initial_pid = None
+
+class CatalogNotReady(RuntimeError):
+    """本地目錄尚未完成首次同步 (正在背景進行)，呼叫端應改用遠端查詢。"""
+
+def _iso_ms(ms: int) -> str:
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3]
+
+def connect() -> sqlite3.Connection:
+    """開啟目錄資料庫 (WAL 模式，可供多個 worker 行程同時讀取)。"""
+    conn = sqlite3.connect(CATALOG_DB_PATH, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+def _get_meta(conn: sqlite3.Connection, key: str) -> str | None:
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+def _set_meta(conn: sqlite3.Connection, key: str, value) -> None:
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+def _feature_to_row(f: dict) -> tuple:
+    p = f["properties"]
+    lon, lat, *rest = f["geometry"]["coordinates"]
+    depth = rest[0] if rest else None
+    return (f["id"], int(p["time"]), int(p.get("updated") or p["time"]), float(lat), float(lon),
+            depth, p.get("mag"), p.get("place", ""), p.get("url", ""))
+
+def _fetch_page(params: dict, offset: int) -> list:
+    r = http_client.get(USGS_API_BASE_URL, params={**params, "offset": offset, "limit": CATALOG_PAGE_SIZE}, timeout=30)
+    r.raise_for_status()
+    return r.json().get("features", [])
+
+def sync() -> dict:
+    """
+    與 USGS 進行增量同步：以 updatedafter 只取上次同步後有異動的事件，
+    依事件 ID upsert，並分頁取得超過單頁上限的資料。已被 USGS 刪除的事件會一併移除。
+    首次完整同步中斷時 (每頁各自提交)，下次從已存入的最新事件時間接續，不必從頭下載。
+    回傳 {"features": 本次有異動的 GeoJSON features}。
+    """
+    with _sync_lock:
+        conn = connect()
+        try:
+            last_updated = _get_meta(conn, "last_updated_ms")
+            params = {
+                "format": "geojson",
+                "starttime": CATALOG_START_TIME,
+                "endtime": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S"),
+                "minmagnitude": CATALOG_MIN_MAGNITUDE,
+                "minlatitude": CATALOG_MIN_LATITUDE, "maxlatitude": CATALOG_MAX_LATITUDE,
+                "minlongitude": CATALOG_MIN_LONGITUDE, "maxlongitude": CATALOG_MAX_LONGITUDE,
+                "orderby": "time-asc",
+            }
+            if last_updated:
+                params["updatedafter"] = _iso_ms(int(last_updated))
+                params["includedeleted"] = "true"
+            else:
+                # 依時間由舊到新分頁，已提交的頁面之前的事件都已存入
+                resume_ms = conn.execute("SELECT MAX(time_ms) FROM events").fetchone()[0]
+                if resume_ms is not None:
+                    params["starttime"] = _iso_ms(int(resume_ms))
+
+            changed = []
+            max_updated = int(last_updated or 0)
+            offset = 1
+            while True:
+                features = _fetch_page(params, offset)
+                upserts, deletes = [], []
+                for f in features:
+                    if f.get("properties", {}).get("status") == "deleted":
+                        deletes.append((f["id"],))
+                        continue
+                    row = _feature_to_row(f)
+                    if last_updated and row[2] <= int(last_updated):
+                        continue  # 上次同步已取得的版本
+                    upserts.append(row)
+                    max_updated = max(max_updated, row[2])
+                    changed.append(f)
+                with conn:
+                    conn.executemany(
+                        f"INSERT OR REPLACE INTO events ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                        upserts,
+                    )
+                    conn.executemany("DELETE FROM events WHERE id = ?", deletes)
+                if len(features) < CATALOG_PAGE_SIZE:
+                    break
+                offset += CATALOG_PAGE_SIZE
+
+            if not last_updated:
+                # 首次同步可能分成多次完成，以目錄中所有事件的最新更新時間作為增量同步的起點
+                stored = conn.execute("SELECT MAX(updated_ms) FROM events").fetchone()[0]
+                max_updated = max(max_updated, int(stored or 0))
+            with conn:
+                if max_updated:
+                    _set_meta(conn, "last_updated_ms", max_updated)
+                _set_meta(conn, "last_sync_at", time.time())
+            if changed:
+                print(f"--- 地震目錄同步完成，更新 {len(changed)} 筆事件 ---")
+            return {"features": changed}
+        finally:
+            conn.close()
+
+def last_sync_at() -> float | None:
+    conn = connect()
+    try:
+        value = _get_meta(conn, "last_sync_at")
+        return float(value) if value else None
+    finally:
+        conn.close()
+
+def version() -> tuple:
+    """目錄內容的版本標記 (最後更新時間, 筆數)，內容變動時會改變。"""
+    conn = connect()
+    try:
+        last_updated = _get_meta(conn, "last_updated_ms")
+        count = conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+        return (last_updated, count)
+    finally:
+        conn.close()
+
+def initial_sync() -> None:
+    """本地目錄尚未同步過時進行首次完整同步 (由背景執行緒、預熱或輪詢呼叫，不在請求中執行)。"""
+    if last_sync_at() is not None:
+        return
+    # 多個 worker 同時啟動時只由一個行程下載，其他行程等待它完成
+    shared_cache.single_flight("catalog_sync", sync, lambda: last_sync_at() is not None)
+
+def start_initial_sync() -> None:
+    """在目前的行程中啟動一次背景首次同步 (以 PID 判斷，相容 gunicorn fork)。"""
+    global _initial_pid
+    with _initial_lock:
+        if _initial_pid == os.getpid():
+            return
+        _initial_pid = os.getpid()
+
+    def _run():
+        global _initial_pid
+        try:
+            initial_sync()
+        except Exception as e:
+            print(f"--- 地震目錄首次同步失敗，下次查詢時重試: {e} ---")
+            with _initial_lock:
+                _initial_pid = None
+
+    threading.Thread(target=_run, name="catalog-initial-sync", daemon=True).start()
+
+def ensure_synced(max_age: float = CATALOG_SYNC_INTERVAL) -> None:
+    """
+    若距離上次同步已超過 max_age 秒則進行增量同步；同步失敗但本地已有資料時沿用舊資料。
+    尚未完成首次同步時不在請求中下載完整目錄：改在背景同步並拋出 CatalogNotReady。
+    """
+    synced_at = last_sync_at()
+    if synced_at is None:
+        start_initial_sync()
+        raise CatalogNotReady("地震目錄首次同步中，請稍後再試")
+    if time.time() - synced_at < max_age:
+        return
+    try:
+        # 多個 worker 同時發現目錄過期時，只由一個行程同步，其他行程等待它完成
+        shared_cache.single_flight(
+            "catalog_sync", sync, lambda: (last_sync_at() or 0) > synced_at)
+    except Exception as e:
+        print(f"地震目錄同步失敗，沿用本地資料: {e}")
+
+def covers(min_magnitude: float | None = None) -> bool:
+    """判斷本地目錄的規模下限是否足以回答此查詢。"""
+    return min_magnitude is None or min_magnitude >= CATALOG_MIN_MAGNITUDE
+
+def query_events(start_ms: int | None = None, end_ms: int | None = None,
+                 min_magnitude: float | None = None, max_magnitude: float | None = None,
+                 newest_first: bool = True) -> list[dict]:
+    """依時間與規模條件查詢本地目錄，回傳事件 dict 列表 (無筆數上限)。"""
+    clauses, args = [], []
+    if start_ms is not None:
+        clauses.append("time_ms >= ?"); args.append(int(start_ms))
+    if end_ms is not None:
+        clauses.append("time_ms <= ?"); args.append(int(end_ms))
+    if min_magnitude is not None:
+        clauses.append("magnitude >= ?"); args.append(float(min_magnitude))
+    if max_magnitude is not None:
+        clauses.append("magnitude <= ?"); args.append(float(max_magnitude))
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    order = "DESC" if newest_first else "ASC"
+    conn = connect()
+    try:
+        rows = conn.execute(
+            f"SELECT {', '.join(COLUMNS)} FROM events {where} ORDER BY time_ms {order}", args
+        ).fetchall()
+    finally:
+        conn.close()
+    return [dict(zip(COLUMNS, row)) for row in rows]
+
+def changed_since(updated_ms: int) -> list[dict]:
+    """updated_ms 之後新增或修改的事件 (依 updated_ms 由舊到新)，供統計彙總增量更新。"""
+    conn = connect()
+    try:
+        rows = conn.execute(
+            f"SELECT {', '.join(COLUMNS)} FROM events WHERE updated_ms > ? ORDER BY updated_ms", (int(updated_ms),)
+        ).fetchall()
+    finally:
+        conn.close()
+    return [dict(zip(COLUMNS, row)) for row in rows]
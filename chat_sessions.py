@@ -0,0 +1,196 @@
+# chat_sessions.py
+import json
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+import metrics
+from config import AI_SESSION_MAX_USERS, AI_SESSION_TTL_SECONDS, AI_SESSION_TOKEN_BUDGET
+
+# 濃縮成摘要時，每個舊對話保留的字數
+SUMMARY_QUESTION_CHARS = 60
+SUMMARY_ANSWER_CHARS = 160
+
+def estimate_tokens(text: str) -> int:
+    """粗估 token 數：中日韓文字約一字一個 token，其餘約四個字元一個 token。"""
+    wide = sum(1 for c in text if ord(c) >= 0x2E80)
+    return wide + (len(text) - wide + 3) // 4
+
+def _args_key(args: dict) -> str:
+    return json.dumps(args, sort_keys=True, ensure_ascii=False, default=str)
+
+class Turn:
+    """一問一答；rounds 為這次回答中每一輪的工具呼叫 [(工具名稱, 參數, 結果, 是否失敗), ...]。"""
+    __slots__ = ("question", "rounds", "answer", "tokens")
+
+    def __init__(self, question: str, rounds: list, answer: str):
+        self.question, self.rounds, self.answer = question, rounds, answer
+        self.tokens = self._estimate()
+
+    def _estimate(self) -> int:
+        tools = sum(estimate_tokens(_args_key(args)) + estimate_tokens(result)
+                    for calls in self.rounds for _, args, result, _ in calls)
+        return estimate_tokens(self.question) + estimate_tokens(self.answer) + tools
+
+    def drop_tools(self) -> None:
+        self.rounds = []
+        self.tokens = self._estimate()
+
+    def contents(self) -> list[dict]:
+        """轉為 Gemini 對話歷史的 Content (dict 形式)。"""
+        result = [{"role": "user", "parts": [{"text": self.question}]}]
+        for calls in self.rounds:
+            result.append({"role": "model", "parts": [
+                {"function_call": {"name": name, "args": args}} for name, args, *_ in calls]})
+            result.append({"role": "user", "parts": [
+                {"function_response": {"name": name, "response": {"result": res}}} for name, _, res, _ in calls]})
+        result.append({"role": "model", "parts": [{"text": self.answer}]})
+        return result
+
+class ChatSession:
+    """單一使用者的對話：較早的對話濃縮成 summary，最近的對話 (含工具結果) 完整保留在 turns。"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.summary = ""
+        self.turns = []
+        self.touched_at = time.monotonic()
+
+    def tokens(self) -> int:
+        return estimate_tokens(self.summary) + sum(t.tokens for t in self.turns)
+
+    def history(self) -> list[dict]:
+        with self.lock:
+            contents = []
+            if self.summary:
+                contents += [
+                    {"role": "user", "parts": [{"text": f"(先前對話摘要)\n{self.summary}"}]},
+                    {"role": "model", "parts": [{"text": "好的，我會參考先前的對話。"}]},
+                ]
+            for turn in self.turns:
+                contents += turn.contents()
+            return contents
+
+    def find_tool_result(self, name: str, args: dict) -> str | None:
+        """先前對話中相同工具、相同參數的成功結果 (由新到舊尋找)；失敗或逾時的結果不沿用，下次重新查詢。"""
+        key = _args_key(args)
+        with self.lock:
+            for turn in reversed(self.turns):
+                for calls in turn.rounds:
+                    for n, a, result, failed in calls:
+                        if n == name and not failed and _args_key(a) == key:
+                            return result
+        return None
+
+class SessionStore:
+    """
+    依 LINE 使用者 ID 保存 ChatSession 的記憶體存放區 (每個行程各自一份)：
+    最多 max_users 位使用者 (LRU 淘汰)，閒置超過 ttl 秒即清除，
+    每位使用者的對話以 token_budget 為上限，因此整體記憶體用量有固定上限。
+    """
+
+    def __init__(self, max_users: int, ttl: float, token_budget: int):
+        self._max_users = max(1, max_users)
+        self._ttl = ttl
+        self._budget = token_budget
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+        self._stats = defaultdict(int)
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self._stats[name] += n
+
+    def get(self, user_id: str) -> ChatSession:
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(user_id)
+            if session is not None and now - session.touched_at > self._ttl:
+                self._stats["expired"] += 1
+                session = None
+            if session is None:
+                session = self._sessions[user_id] = ChatSession()
+                self._stats["created"] += 1
+            else:
+                self._stats["resumed"] += 1
+            session.touched_at = now
+            self._sessions.move_to_end(user_id)
+            self._prune(now)
+            return session
+
+    def _prune(self, now: float) -> None:
+        # 呼叫端須持有 self._lock；OrderedDict 依最近使用排序，最舊的在前
+        while self._sessions:
+            user_id, session = next(iter(self._sessions.items()))
+            if len(self._sessions) > self._max_users:
+                self._stats["evicted"] += 1
+            elif now - session.touched_at > self._ttl:
+                self._stats["expired"] += 1
+            else:
+                break
+            del self._sessions[user_id]
+
+    def add_turn(self, session: ChatSession, question: str, rounds: list, answer: str) -> None:
+        """加入一問一答，並把對話縮減到 token 上限內。"""
+        with session.lock:
+            session.turns.append(Turn(question, rounds, answer))
+            self._fit(session)
+
+    def _fit(self, session: ChatSession) -> None:
+        # 1. 由舊到新移除工具結果 (最近一次對話的結果保留，供追問使用)
+        for turn in session.turns[:-1]:
+            if session.tokens() <= self._budget:
+                return
+            if turn.rounds:
+                turn.drop_tools()
+                self._count("tools_dropped")
+        # 2. 把最舊的對話濃縮成摘要中的一行
+        while session.tokens() > self._budget and len(session.turns) > 1:
+            turn = session.turns.pop(0)
+            line = f"- 問：{turn.question[:SUMMARY_QUESTION_CHARS]} 答：{turn.answer[:SUMMARY_ANSWER_CHARS]}"
+            session.summary = f"{session.summary}\n{line}".strip()
+            self._count("summarized")
+        # 摘要本身也只保留最近的部分 (最多占上限的四分之一)
+        while session.summary and estimate_tokens(session.summary) > self._budget // 4:
+            _, _, session.summary = session.summary.partition("\n")
+        # 3. 只剩一個對話仍超過上限時，連同最近的工具結果一起移除
+        if session.tokens() > self._budget and session.turns and session.turns[-1].rounds:
+            session.turns[-1].drop_tools()
+            self._count("tools_dropped")
+
+    def find_tool_result(self, session: ChatSession, name: str, args: dict) -> str | None:
+        result = session.find_tool_result(name, args)
+        if result is not None:
+            self._count("tool_reuse")
+        return result
+
+    def clear(self, user_id: str | None = None) -> None:
+        with self._lock:
+            if user_id is None:
+                self._sessions.clear()
+            else:
+                self._sessions.pop(user_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            sessions = list(self._sessions.values())
+            result = dict(self._stats)
+        return {
+            **result,
+            "sessions": len(sessions),
+            "max_users": self._max_users,
+            "estimated_tokens": sum(s.tokens() for s in sessions),
+        }
+
+sessions = SessionStore(AI_SESSION_MAX_USERS, AI_SESSION_TTL_SECONDS, AI_SESSION_TOKEN_BUDGET)
+
+def _collect_metrics() -> list:
+    s = sessions.stats()
+    return [
+        ("linebot_ai_sessions", "gauge", "Gemini conversations kept in memory by this process.", [({}, s["sessions"])]),
+        ("linebot_ai_session_events_total", "counter", "Conversation store activity by kind.",
+         [({"kind": k}, s.get(k, 0)) for k in
+          ("created", "resumed", "expired", "evicted", "tools_dropped", "summarized", "tool_reuse")]),
+    ]
+
+metrics.register_collector(_collect_metrics)
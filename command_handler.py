@@ -1,14 +1,30 @@
 # command_handler.py (Corrected and Modified Version)
-import pandas as pd
+import asyncio
+import math
 from linebot.v3.messaging import TextMessage, ImageMessage
 
 # 匯入所有服務函式
-from cwa_service import fetch_cwa_alarm_list, fetch_significant_earthquakes, fetch_latest_significant_earthquake
-from usgs_service import fetch_global_last24h_text, fetch_taiwan_df_this_year
+from cwa_service import (
+    fetch_cwa_alarm_list, fetch_significant_earthquakes, fetch_latest_significant_earthquake,
+    fetch_cwa_alarm_list_async, fetch_significant_earthquakes_async, fetch_latest_significant_earthquake_async,
+)
+from usgs_service import (
+    fetch_global_last24h_text, fetch_taiwan_quakes_this_year,
+    fetch_global_last24h_text_async, fetch_taiwan_quakes_this_year_async,
+)
 from plotting_service import create_and_save_map
-from ai_service import generate_ai_text
+from report_images import get_report_images
+from ai_service import generate_ai_text, generate_ai_text_async
+from feed_poller import feed_poller
+import intent_router
+import metrics
+import rate_limiter
+import subscriber_store
 # [修正] 將 HF_SPACE_URL 改為 MCP_SERVER_URL
-from config import CURRENT_YEAR, MCP_SERVER_URL
+from config import (
+    CURRENT_YEAR, MCP_SERVER_URL, INTENT_ROUTER_ENABLED, PUBLIC_BASE_URL, ALERT_FANOUT_ENABLED, AI_SESSION_ENABLED,
+    REQUEST_COALESCING_ENABLED, CATALOG_MIN_MAGNITUDE, SEISMICITY_ACTIVITY_MIN_MAGNITUDE,
+)
 
 def get_help_message() -> TextMessage:
     text = (
@@ -19,7 +35,14 @@ def get_help_message() -> TextMessage:
         "• 3 - 今年台灣顯著地震列表（USGS)\n"
         "• 4 - CWA 地震目錄查詢 (外部連結)\n"
         "• 5 - CWA 最新地震預警\n"
-        "• 6 - CWA 最近7天顯著有感地震\n\n"
+        "• 6 - CWA 最近7天顯著有感地震\n"
+        "• 台灣地震畫圖 - 今年台灣顯著地震分布圖\n"
+        "• 訂閱 / 取消訂閱 - 地震速報推播\n\n"
+        "【地震統計】(台灣區域 USGS 目錄)\n"
+        "• 地震活動 [規模] - 今年與去年同期比較、近期是否偏高\n"
+        "• 每日地震 / 每月地震 [規模] - 近 14 天 / 12 個月的地震數\n"
+        "• b值 [年數] - 規模–頻率分析與大地震年發生率\n"
+        "• 餘震 [天數] - 主震與餘震分群\n\n"
         "【AI 與工具】\n"
         "• 7 <問題> - 與 AI 助理對話\n\n"
         "【基本指令】\n"
@@ -39,16 +62,18 @@ def get_info_message() -> TextMessage:
     return TextMessage(text=text)
 
 def get_taiwan_earthquake_list() -> TextMessage:
-    result = fetch_taiwan_df_this_year()
-    if isinstance(result, pd.DataFrame):
+    return _taiwan_list_message(fetch_taiwan_quakes_this_year())
+
+def _taiwan_list_message(result) -> TextMessage:
+    if not isinstance(result, str):
         count = len(result)
         lines = [f"🇹🇼 今年 ({CURRENT_YEAR} 年) 台灣區域顯著地震 (M≥5.0)，共 {count} 筆:", "-" * 20]
-        for _, row in result.head(15).iterrows():
-            t = row["time_utc"].strftime("%Y-%m-%d %H:%M")
+        for q in result.head(15):
+            t = q.time.strftime("%Y-%m-%d %H:%M")
             lines.append(
-                f"規模: {row['magnitude']:.1f} | 日期時間: {t} (UTC)\n"
-                f"地點: {row['place']}\n"
-                f"報告連結: {row.get('url', '無')}"
+                f"規模: {q.magnitude:.1f} | 日期時間: {t} (UTC)\n"
+                f"地點: {q.place}\n"
+                f"報告連結: {q.url or '無'}"
             )
         if count > 15:
             lines.append(f"... (還有 {count-15} 筆資料)")
@@ -57,77 +82,340 @@ def get_taiwan_earthquake_list() -> TextMessage:
         reply_text = result
     return TextMessage(text=reply_text)
 
-def get_latest_earthquake_reply() -> list:
+def _public_url(request_base_url: str, path: str) -> str:
+    """組成 LINE 可讀取的公開網址 (LINE 只接受 HTTPS 圖片連結)。"""
+    base = PUBLIC_BASE_URL or request_base_url
+    if base.startswith("http://") and not base.startswith(("http://localhost", "http://127.0.0.1")):
+        base = "https://" + base[len("http://"):]
+    return f"{base}{path}"
+
+def get_taiwan_map_reply(request_base_url: str) -> list:
+    return _taiwan_map_messages(fetch_taiwan_quakes_this_year(), request_base_url)
+
+def _taiwan_map_messages(result, request_base_url: str) -> list:
+    if isinstance(result, str):
+        return [TextMessage(text=result)]
     try:
-        latest_eq = fetch_latest_significant_earthquake()
-        if not latest_eq:
-            return [TextMessage(text="✅ 近期無顯著有感地震報告。")]
-
-        mag_str = f"{latest_eq['Magnitude']:.1f}" if latest_eq.get('Magnitude') is not None else "—"
-        depth_str = f"{latest_eq['Depth']:.0f}" if latest_eq.get('Depth') is not None else "—"
-        
-        text_message_content = (
-            f"🚨 CWA 最新顯著有感地震\n"
-            f"----------------------------------\n"
-            f"時間: {latest_eq.get('TimeStr', '—')}\n"
-            f"地點: {latest_eq.get('Location', '—')}\n"
-            f"規模: M{mag_str} | 深度: {depth_str} km\n"
-            f"報告: {latest_eq.get('URL', '無')}"
-        )
-        reply_messages = [TextMessage(text=text_message_content)]
+        filename = create_and_save_map(result)
+    except Exception as e:
+        return [TextMessage(text=f"❌ 地圖繪製失敗：{e}")]
+    image_url = _public_url(request_base_url, f"/static/{filename}")
+    return [
+        TextMessage(text=f"🗺️ 今年 ({CURRENT_YEAR} 年) 台灣區域顯著地震 (M≥5.0) 分布圖，共 {len(result)} 筆"),
+        ImageMessage(original_content_url=image_url, preview_image_url=image_url),
+    ]
 
-        if latest_eq.get("ImageURL"):
-            image_url = latest_eq["ImageURL"]
-            reply_messages.append(
-                ImageMessage(original_content_url=image_url, preview_image_url=image_url)
-            )
-        
-        return reply_messages
+def get_latest_earthquake_reply(request_base_url: str = "") -> list:
+    try:
+        return latest_earthquake_messages(fetch_latest_significant_earthquake(), request_base_url)
     except Exception as e:
         return [TextMessage(text=f"❌ 查詢最新地震失敗：{e}")]
 
-def process_message(user_message_raw: str, request_base_url: str) -> list:
-    user_message = (user_message_raw or "").strip()
+def _report_image_urls(quake, request_base_url: str) -> tuple[str, str]:
+    """(原圖, 預覽圖) 網址：優先使用 /static 提供的縮小版本，沒有可公開存取的網址或處理失敗時使用 CWA 原始網址。"""
+    if PUBLIC_BASE_URL or request_base_url:
+        names = get_report_images(quake.id, quake.image_url)
+        if names:
+            original, preview = names
+            return (_public_url(request_base_url, f"/static/{original}"),
+                    _public_url(request_base_url, f"/static/{preview}"))
+    return quake.image_url, quake.image_url
+
+def latest_earthquake_messages(latest_eq, request_base_url: str = "") -> list:
+    if not latest_eq:
+        return [TextMessage(text="✅ 近期無顯著有感地震報告。")]
+
+    mag_str = f"{latest_eq.magnitude:.1f}" if latest_eq.magnitude is not None else "—"
+    depth_str = f"{latest_eq.depth:.0f}" if latest_eq.depth is not None else "—"
+    
+    text_message_content = (
+        f"🚨 CWA 最新顯著有感地震\n"
+        f"----------------------------------\n"
+        f"時間: {latest_eq.time.strftime('%Y-%m-%d %H:%M') if latest_eq.time else '—'}\n"
+        f"地點: {latest_eq.place or '—'}\n"
+        f"規模: M{mag_str} | 深度: {depth_str} km\n"
+        f"報告: {latest_eq.url or '無'}"
+    )
+    reply_messages = [TextMessage(text=text_message_content)]
+
+    if latest_eq.image_url:
+        original_url, preview_url = _report_image_urls(latest_eq, request_base_url)
+        reply_messages.append(
+            ImageMessage(original_content_url=original_url, preview_image_url=preview_url)
+        )
     
-    cmd_map = {
-        '1': '/latest', '2': '/global', '3': '/taiwan',
-        '4': '/map', '5': '/alert', '6': '/significant',
-        '7': '/ai', '8': '/info', '9': '/help',
-        '地震': '/global', 'quake': '/global', '幫助': '/help',
-        '台灣地震': '/taiwan', '臺灣地震': '/taiwan',
-        '台灣地震畫圖': '/map', '臺灣地震畫圖': '/map',
-        '地震預警': '/alert',
-    }
+    return reply_messages
+
+CMD_MAP = {
+    '1': '/latest', '2': '/global', '3': '/taiwan',
+    '4': '/map', '5': '/alert', '6': '/significant',
+    '7': '/ai', '8': '/info', '9': '/help',
+    '地震': '/global', 'quake': '/global', '幫助': '/help',
+    '台灣地震': '/taiwan', '臺灣地震': '/taiwan',
+    '台灣地震畫圖': '/plot', '臺灣地震畫圖': '/plot', '畫圖': '/plot', '地震地圖': '/plot',
+    '地震預警': '/alert',
+    '訂閱': '/subscribe', 'subscribe': '/subscribe',
+    '取消訂閱': '/unsubscribe', 'unsubscribe': '/unsubscribe',
+    '地震活動': '/activity', '地震統計': '/activity',
+    '每日地震': '/daily', '每月地震': '/monthly',
+    'b值': '/bvalue', 'b-value': '/bvalue', '餘震': '/aftershocks',
+}
+
+SUBSCRIPTION_COMMANDS = ('/subscribe', '/unsubscribe')
+
+# 回覆中的圖片連結需要公開網址 (PUBLIC_BASE_URL 或請求的網址) 的指令
+BASE_URL_COMMANDS = ('/latest', '/plot')
+
+# 指令: (seismicity 的報告函式, 參數型別, 預設值, 下限, 上限, 參數說明)
+SEISMICITY_COMMANDS = {
+    '/activity': ("activity_report", float, SEISMICITY_ACTIVITY_MIN_MAGNITUDE, 0, 9, "規模"),
+    '/daily': ("daily_report", float, CATALOG_MIN_MAGNITUDE, 0, 9, "規模"),
+    '/monthly': ("monthly_report", float, 5.0, 0, 9, "規模"),
+    '/bvalue': ("b_value_report", int, 10, 1, 100, "年數"),
+    '/aftershocks': ("aftershock_report", int, 365, 1, 3650, "天數"),
+}
+
+def get_seismicity_reply(command: str, arg: str) -> TextMessage:
+    """以本地目錄的統計彙總回答地震活動指令 (不經過 Gemini 與 MCP)。"""
+    name, kind, default, low, high, label = SEISMICITY_COMMANDS[command]
+    try:
+        value = kind(arg) if arg else default
+    except ValueError:
+        value = None
+    if value is None or not low <= value <= high:
+        return TextMessage(text=f"請輸入 {low}～{high} 之間的{label}，例如：{command} {default}")
+    # seismicity 匯入 NumPy，第一次使用時才載入
+    import seismicity
+    try:
+        return TextMessage(text=getattr(seismicity, name)(value))
+    except Exception as e:
+        return TextMessage(text=f"❌ 地震統計失敗：{e}")
+
+def handle_subscription(command: str, user_id: str | None) -> TextMessage:
+    """訂閱 / 取消訂閱地震速報推播 (只接受一對一聊天，推播對象為使用者本人)。"""
+    if not ALERT_FANOUT_ENABLED:
+        return TextMessage(text="🔕 管理者尚未啟用地震速報推播。")
+    if not user_id:
+        return TextMessage(text="請在與機器人的一對一聊天中輸入「訂閱」或「取消訂閱」。")
+    try:
+        if command == '/subscribe':
+            if subscriber_store.subscribe(user_id):
+                return TextMessage(text="✅ 已訂閱地震速報，有新的地震預警或顯著有感地震報告時會主動通知您。\n輸入「取消訂閱」即可停止。")
+            return TextMessage(text="您已經訂閱過地震速報了。")
+        if subscriber_store.unsubscribe(user_id):
+            return TextMessage(text="✅ 已取消訂閱地震速報。")
+        return TextMessage(text="您目前沒有訂閱地震速報。")
+    except Exception as e:
+        return TextMessage(text=f"❌ 訂閱設定失敗：{e}")
 
+def resolve_command(user_message: str) -> tuple[str, str]:
+    """將使用者輸入解析為 (指令, 參數)；無法對應任何指令時回傳 ("", "")。"""
     command = ""
     arg = ""
-    
+
     parts = user_message.split(' ', 1)
     cmd_key = parts[0].lower()
 
-    if cmd_key in cmd_map:
-        command = cmd_map[cmd_key]
+    if cmd_key in CMD_MAP:
+        command = CMD_MAP[cmd_key]
         if len(parts) > 1:
             arg = parts[1].strip()
     # Allow users to still use /command format
-    elif user_message.startswith('/') and cmd_key in cmd_map.values():
+    elif user_message.startswith('/') and cmd_key in CMD_MAP.values():
         command = cmd_key
         if len(parts) > 1:
             arg = parts[1].strip()
+    return command, arg
+
+def _age_text(seconds: float) -> str:
+    if seconds < 60:
+        return f"{seconds:.0f} 秒"
+    if seconds < 3600:
+        return f"{seconds / 60:.0f} 分鐘"
+    return f"{seconds / 3600:.1f} 小時"
+
+def add_stale_notice(messages: list, fallbacks: list) -> list:
+    """上游暫時無法連線而改用最後一次成功的資料時，在第一則文字訊息前加上提示 (不修改原本的訊息物件)。"""
+    if not fallbacks:
+        return messages
+    notice = f"⚠️ 資料來源暫時無法連線，以下為約 {_age_text(max(age for _, age in fallbacks))} 前的資料。"
+    for i, message in enumerate(messages):
+        if isinstance(message, TextMessage):
+            return [*messages[:i], TextMessage(text=f"{notice}\n\n{message.text}"), *messages[i + 1:]]
+    return [TextMessage(text=notice), *messages]
+
+def batch_key(user_message_raw: str, user_id: str | None) -> tuple:
+    """
+    同一次 Webhook 中可共用同一份回覆的事件分組依據。
+    解析得到的 (指令, 參數) 與使用者無關；訂閱指令、無法解析的文字 (交給意圖路由 / AI)，
+    以及啟用對話記憶時的 AI 問題，只和同一位使用者的相同訊息合併。
+    """
+    user_message = (user_message_raw or "").strip()
+    command, arg = resolve_command(user_message)
+    per_user = command in SUBSCRIPTION_COMMANDS or (command == '/ai' and AI_SESSION_ENABLED)
+    if command and not per_user:
+        return command, arg
+    return "", user_message, user_id
+
+def build_reply(command: str, arg: str, request_base_url: str, user_id: str | None = None) -> list:
+    """執行已解析的指令並產生回覆訊息；user_id 用於 AI 對話記憶。"""
+    if command == '/help': return [get_help_message()]
+    if command == '/info': return [get_info_message()]
+    if command == '/latest': return get_latest_earthquake_reply(request_base_url)
+    if command == '/global': return [TextMessage(text=fetch_global_last24h_text())]
+    if command == '/taiwan': return [get_taiwan_earthquake_list()]
+    # [修正] 將 HF_SPACE_URL 改為 MCP_SERVER_URL
+    if command == '/map': return [TextMessage(text=f"🗺️ 外部地震查詢服務\n\n請點擊以下連結：\n{MCP_SERVER_URL}")]
+    if command == '/plot': return get_taiwan_map_reply(request_base_url)
+    if command == '/alert': return [TextMessage(text=fetch_cwa_alarm_list(limit=5))]
+    if command == '/significant': return [TextMessage(text=fetch_significant_earthquakes(limit=5))]
+    if command in SEISMICITY_COMMANDS: return [get_seismicity_reply(command, arg)]
+    if command == '/ai':
+        prompt = arg
+        if not prompt: return [TextMessage(text="請輸入問題，例如：7 台灣最高的山是哪座？")]
+        return [TextMessage(text=generate_ai_text(prompt, user_id))]
+    return []
+
+def _rate_limited(user_id: str | None, kind: str) -> list | None:
+    """使用者超過 kind 類別的頻率限制時回傳提示訊息，否則回傳 None (群組與聊天室不限制)。"""
+    if not user_id:
+        return None
+    wait = rate_limiter.limiter.acquire(user_id, kind)
+    if not wait:
+        return None
+    metrics.set_command("rate_limited")
+    when = f"約 {math.ceil(wait)} 秒後" if math.isfinite(wait) else "稍後"
+    return [TextMessage(text=f"⏳ 您的請求太頻繁了，請{when}再試。")]
+
+def _cost_kind(command: str, arg: str) -> str:
+    return "ai" if command == '/ai' and arg else "cheap"
+
+def charge_rate_limit(user_message_raw: str, user_id: str | None) -> list | None:
+    """
+    預先為已解析為指令的訊息扣除使用者的頻率限制額度，超過限制時回傳提示訊息。
+    webhook_batch 以此逐一檢查同組事件各自的使用者，再以 rate_limit=False 執行共用的回覆。
+    """
+    return _rate_limited(user_id, _cost_kind(*resolve_command((user_message_raw or "").strip())))
+
+def process_message(user_message_raw: str, request_base_url: str, user_id: str | None = None,
+                    rate_limit: bool = True) -> list:
+    """
+    user_id 為一對一聊天的使用者 ID (群組、聊天室為 None)，用於訂閱指令、頻率限制與對話記憶。
+    同一位使用者的相同訊息仍在處理時，直接共用該次的回覆。
+    rate_limit=False 表示呼叫端已用 charge_rate_limit 扣除過額度。
+    """
+    user_message = (user_message_raw or "").strip()
+    if user_id and REQUEST_COALESCING_ENABLED:
+        return rate_limiter.coalescer.run(
+            (user_id, user_message), lambda: _process_message(user_message, request_base_url, user_id, rate_limit))
+    return _process_message(user_message, request_base_url, user_id, rate_limit)
+
+def _process_message(user_message: str, request_base_url: str, user_id: str | None, rate_limit: bool) -> list:
+    command, arg = resolve_command(user_message)
+
+    if command:
+        metrics.set_command(command)
+        limited = rate_limit and _rate_limited(user_id, _cost_kind(command, arg))
+        if limited:
+            return limited
+        if command in SUBSCRIPTION_COMMANDS:
+            return [handle_subscription(command, user_id)]
+        # 背景輪詢已預先產生的回覆 (若有啟用且夠新)
+        if not arg:
+            snapshot = feed_poller.get_snapshot(command)
+            if snapshot is not None:
+                return snapshot
+        with metrics.span("build_reply"):
+            reply = build_reply(command, arg, request_base_url, user_id)
+        if reply:
+            return reply
+
+    # 先以本地意圖路由處理寒暄、錯字與近似別名，只有真正的問題才交給 Gemini
+    if INTENT_ROUTER_ENABLED:
+        with metrics.span("intent_router"):
+            route = intent_router.get_router().route(user_message)
+        if route.kind == "canned":
+            metrics.set_command("canned")
+            return [TextMessage(text=route.reply)]
+        if route.kind == "command":
+            return _process_message(route.command, request_base_url, user_id, rate_limit)
+
+    limited = rate_limit and _rate_limited(user_id, "ai")
+    if limited:
+        return limited
+    metrics.set_command("/ai")
+    return [TextMessage(text=generate_ai_text(user_message, user_id))]
+
+# ------------------------------------------------------------------------------
+# 非同步版本 (ASGI 模式)：上游查詢在事件迴圈上進行，回覆內容與同步版本相同
+# ------------------------------------------------------------------------------
+async def build_reply_async(command: str, arg: str, request_base_url: str, user_id: str | None = None) -> list:
+    """build_reply 的非同步版本；不需要網路 I/O 的指令 (/help、/info、/map) 直接沿用同步實作。"""
+    if command == '/latest':
+        try:
+            latest_eq = await fetch_latest_significant_earthquake_async()
+            # 第一次處理報告圖時需要下載與縮圖，改在執行緒中進行
+            return await asyncio.to_thread(latest_earthquake_messages, latest_eq, request_base_url)
+        except Exception as e:
+            return [TextMessage(text=f"❌ 查詢最新地震失敗：{e}")]
+    if command == '/global': return [TextMessage(text=await fetch_global_last24h_text_async())]
+    if command == '/taiwan': return [_taiwan_list_message(await fetch_taiwan_quakes_this_year_async())]
+    if command == '/plot':
+        result = await fetch_taiwan_quakes_this_year_async()
+        # 等待繪圖行程池的結果會阻塞，改在執行緒中等待
+        return await asyncio.to_thread(_taiwan_map_messages, result, request_base_url)
+    if command == '/alert': return [TextMessage(text=await fetch_cwa_alarm_list_async(limit=5))]
+    if command == '/significant': return [TextMessage(text=await fetch_significant_earthquakes_async(limit=5))]
+    if command in SEISMICITY_COMMANDS:
+        # 目錄過期時會先同步 (阻塞式 I/O)，改在執行緒中進行
+        return [await asyncio.to_thread(get_seismicity_reply, command, arg)]
+    if command == '/ai':
+        prompt = arg
+        if not prompt: return [TextMessage(text="請輸入問題，例如：7 台灣最高的山是哪座？")]
+        return [TextMessage(text=await generate_ai_text_async(prompt, user_id))]
+    return build_reply(command, arg, request_base_url, user_id)
+
+async def process_message_async(user_message_raw: str, request_base_url: str, user_id: str | None = None,
+                                rate_limit: bool = True) -> list:
+    """process_message 的非同步版本，指令解析、快照、意圖路由、頻率限制與請求合併的行為相同。"""
+    user_message = (user_message_raw or "").strip()
+    if user_id and REQUEST_COALESCING_ENABLED:
+        return await rate_limiter.coalescer.run_async(
+            (user_id, user_message),
+            lambda: _process_message_async(user_message, request_base_url, user_id, rate_limit))
+    return await _process_message_async(user_message, request_base_url, user_id, rate_limit)
+
+async def _process_message_async(user_message: str, request_base_url: str, user_id: str | None,
+                                 rate_limit: bool) -> list:
+    command, arg = resolve_command(user_message)
 
     if command:
-        if command == '/help': return [get_help_message()]
-        if command == '/info': return [get_info_message()]
-        if command == '/latest': return get_latest_earthquake_reply()
-        if command == '/global': return [TextMessage(text=fetch_global_last24h_text())]
-        if command == '/taiwan': return [get_taiwan_earthquake_list()]
-        # [修正] 將 HF_SPACE_URL 改為 MCP_SERVER_URL
-        if command == '/map': return [TextMessage(text=f"🗺️ 外部地震查詢服務\n\n請點擊以下連結：\n{MCP_SERVER_URL}")]
-        if command == '/alert': return [TextMessage(text=fetch_cwa_alarm_list(limit=5))]
-        if command == '/significant': return [TextMessage(text=fetch_significant_earthquakes(limit=5))]
-        if command == '/ai':
-            prompt = arg
-            if not prompt: return [TextMessage(text="請輸入問題，例如：7 台灣最高的山是哪座？")]
-            return [TextMessage(text=generate_ai_text(prompt))]
-
-    return [TextMessage(text=generate_ai_text(user_message))]
+        metrics.set_command(command)
+        limited = rate_limit and _rate_limited(user_id, _cost_kind(command, arg))
+        if limited:
+            return limited
+        if command in SUBSCRIPTION_COMMANDS:
+            return [await asyncio.to_thread(handle_subscription, command, user_id)]
+        if not arg:
+            snapshot = feed_poller.get_snapshot(command)
+            if snapshot is not None:
+                return snapshot
+        with metrics.span("build_reply"):
+            reply = await build_reply_async(command, arg, request_base_url, user_id)
+        if reply:
+            return reply
+
+    if INTENT_ROUTER_ENABLED:
+        with metrics.span("intent_router"):
+            route = intent_router.get_router().route(user_message)
+        if route.kind == "canned":
+            metrics.set_command("canned")
+            return [TextMessage(text=route.reply)]
+        if route.kind == "command":
+            return await _process_message_async(route.command, request_base_url, user_id, rate_limit)
+
+    limited = rate_limit and _rate_limited(user_id, "ai")
+    if limited:
+        return limited
+    metrics.set_command("/ai")
+    return [TextMessage(text=await generate_ai_text_async(user_message, user_id))]
@@ -14,6 +14,10 @@ os.environ.setdefault("MPLCONFIGDIR", "/tmp/matplotlib")
 STATIC_DIR = os.getenv("STATIC_DIR", os.path.join(tempfile.gettempdir(), "static"))
 os.makedirs(STATIC_DIR, exist_ok=True)
 
+# 定義一個資料目錄來存放持久化資料 (例如本地地震目錄)
+DATA_DIR = os.getenv("DATA_DIR", os.path.join(tempfile.gettempdir(), "data"))
+os.makedirs(DATA_DIR, exist_ok=True)
+
 
 # ==============================================================================
 # 2. 憑證與金鑰 (從 Secret Variables 讀取)
@@ -34,15 +38,23 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 # 3. API 端點與 URL
 # ==============================================================================
 
+# 以下端點皆可用環境變數覆寫 (例如 benchmarks/ 中的本地 stub 伺服器)
+
 # CWA API 端點
-CWA_ALARM_API = "https://app-2.cwa.gov.tw/api/v1/earthquake/alarm/list"
-CWA_SIGNIFICANT_API = "https://opendata.cwa.gov.tw/api/v1/rest/datastore/E-A0015-001"
+CWA_ALARM_API = os.getenv("CWA_ALARM_API", "https://app-2.cwa.gov.tw/api/v1/earthquake/alarm/list")
+CWA_SIGNIFICANT_API = os.getenv("CWA_SIGNIFICANT_API", "https://opendata.cwa.gov.tw/api/v1/rest/datastore/E-A0015-001")
 
 # USGS API 端點
-USGS_API_BASE_URL = "https://earthquake.usgs.gov/fdsnws/event/1/query"
+USGS_API_BASE_URL = os.getenv("USGS_API_BASE_URL", "https://earthquake.usgs.gov/fdsnws/event/1/query")
 
 # MCP 伺服器 (Gradio App) URL
-MCP_SERVER_URL = "https://cwadayi-mcp-2.hf.space"
+MCP_SERVER_URL = os.getenv("MCP_SERVER_URL", "https://cwadayi-mcp-2.hf.space")
+
+# LINE Messaging API 主機
+LINE_API_HOST = os.getenv("LINE_API_HOST", "https://api.line.me")
+
+# Gemini API 端點；設定時改以 REST 連線至此位址 (未設定時使用 SDK 預設值)
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT", "")
 
 
 # ==============================================================================
@@ -52,3 +64,320 @@ MCP_SERVER_URL = "https://cwadayi-mcp-2.hf.space"
 # 顯示用的當年年份
 CURRENT_YEAR = datetime.now().year
 
+
+# ==============================================================================
+# 5. Webhook 分派設定
+# ==============================================================================
+
+# "queue": /callback 驗證簽章後立即回應 200，訊息交由背景工作池處理
+# "inline": 於 /callback 請求中直接處理 (舊行為)
+WEBHOOK_DISPATCH_MODE = os.getenv("WEBHOOK_DISPATCH_MODE", "queue").lower()
+
+# 背景工作執行緒數量與佇列上限 (超過上限時直接回覆「系統忙碌」)
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "4"))
+WEBHOOK_QUEUE_MAXSIZE = int(os.getenv("WEBHOOK_QUEUE_MAXSIZE", "100"))
+
+# 同一次 Webhook 中的多個事件依 (指令, 參數) 分組，每組只執行一次；組內事件並行回覆的執行緒數
+WEBHOOK_REPLY_CONCURRENCY = int(os.getenv("WEBHOOK_REPLY_CONCURRENCY", "8"))
+
+# reply token 的有效秒數；事件等待超過此時間就改用 push API 回覆
+REPLY_TOKEN_TTL_SECONDS = float(os.getenv("REPLY_TOKEN_TTL_SECONDS", "50"))
+
+# ==============================================================================
+# 6. 上游資料快取 (TTL / stale-while-revalidate，單位：秒)
+# ==============================================================================
+
+def _cache_ttl(feed: str, ttl: float, stale_ttl: float) -> tuple[float, float]:
+    """讀取 CACHE_TTL_<FEED> 與 CACHE_STALE_<FEED> 環境變數，允許個別覆寫。"""
+    name = feed.upper()
+    return (
+        float(os.getenv(f"CACHE_TTL_{name}", ttl)),
+        float(os.getenv(f"CACHE_STALE_{name}", stale_ttl)),
+    )
+
+# (新鮮時間, 過期後仍可回傳舊值並於背景更新的時間)；TTL 設為 0 即停用該 feed 的快取
+FEED_CACHE_TTL = {
+    "cwa_alarm": _cache_ttl("cwa_alarm", 10, 50),
+    "cwa_significant": _cache_ttl("cwa_significant", 60, 240),
+    "cwa_latest": _cache_ttl("cwa_latest", 60, 240),
+    "usgs_global": _cache_ttl("usgs_global", 120, 480),
+    "usgs_taiwan": _cache_ttl("usgs_taiwan", 600, 3000),
+}
+
+# ==============================================================================
+# 7. 對外 HTTP 連線池與重試設定
+# ==============================================================================
+
+# 每個上游主機保持的 keep-alive 連線數上限
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", str(max(4, WEBHOOK_WORKERS * 2))))
+
+# 遇到 429 / 5xx 時的重試次數與指數退避參數 (秒)，退避時間會加上隨機抖動
+HTTP_RETRY_TOTAL = int(os.getenv("HTTP_RETRY_TOTAL", "2"))
+HTTP_RETRY_BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF", "0.3"))
+HTTP_RETRY_JITTER = float(os.getenv("HTTP_RETRY_JITTER", "0.3"))
+
+# ==============================================================================
+# 8. 背景資料輪詢 (預先產生常用指令的回覆)
+# ==============================================================================
+
+# 啟用後，每個 worker 會在背景定期輪詢 CWA / USGS，並預先產生 /latest、/alert、/significant、/global 的回覆
+FEED_POLLER_ENABLED = os.getenv("FEED_POLLER_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# 各資料來源的輪詢間隔 (秒)
+FEED_POLL_INTERVALS = {
+    "cwa_alarm": float(os.getenv("FEED_POLL_INTERVAL_CWA_ALARM", "10")),
+    "cwa_significant": float(os.getenv("FEED_POLL_INTERVAL_CWA_SIGNIFICANT", "60")),
+    "usgs_global": float(os.getenv("FEED_POLL_INTERVAL_USGS_GLOBAL", "120")),
+    "usgs_catalog": float(os.getenv("FEED_POLL_INTERVAL_USGS_CATALOG", "300")),
+}
+
+# 快照超過「輪詢間隔 × 此倍數」仍未更新，即視為過舊而改走即時查詢
+FEED_SNAPSHOT_MAX_AGE_FACTOR = float(os.getenv("FEED_SNAPSHOT_MAX_AGE_FACTOR", "3"))
+
+# ==============================================================================
+# 9. 本地地震目錄 (USGS 增量同步，存放於 SQLite)
+# ==============================================================================
+
+CATALOG_DB_PATH = os.getenv("CATALOG_DB_PATH", os.path.join(DATA_DIR, "usgs_catalog.sqlite3"))
+
+# 同步範圍：區域 (緯度/經度)、最小規模與起始時間
+CATALOG_MIN_LATITUDE = float(os.getenv("CATALOG_MIN_LATITUDE", "21"))
+CATALOG_MAX_LATITUDE = float(os.getenv("CATALOG_MAX_LATITUDE", "26"))
+CATALOG_MIN_LONGITUDE = float(os.getenv("CATALOG_MIN_LONGITUDE", "119"))
+CATALOG_MAX_LONGITUDE = float(os.getenv("CATALOG_MAX_LONGITUDE", "123"))
+CATALOG_MIN_MAGNITUDE = float(os.getenv("CATALOG_MIN_MAGNITUDE", "4.0"))
+CATALOG_START_TIME = os.getenv("CATALOG_START_TIME", "2000-01-01")
+
+# 距離上次同步超過此秒數，查詢前會先做一次增量同步
+CATALOG_SYNC_INTERVAL = float(os.getenv("CATALOG_SYNC_INTERVAL", "300"))
+
+# 每頁筆數 (USGS 單次上限為 20000)
+CATALOG_PAGE_SIZE = int(os.getenv("CATALOG_PAGE_SIZE", "2000"))
+
+# ==============================================================================
+# 10. AI 地震搜尋工具的後端
+# ==============================================================================
+
+# "mcp": 一律呼叫遠端 MCP 伺服器
+# "local": 使用本地地震目錄的索引查詢，本地資料無法涵蓋查詢範圍時才改用 MCP
+AI_SEARCH_BACKEND = os.getenv("AI_SEARCH_BACKEND", "mcp").lower()
+
+# ==============================================================================
+# 11. MCP 用戶端連線池與查詢結果快取
+# ==============================================================================
+
+# 保持連線的 Gradio Client 數量 (同時進行的 MCP 查詢上限)
+MCP_CLIENT_POOL_SIZE = int(os.getenv("MCP_CLIENT_POOL_SIZE", "2"))
+
+# 相同查詢條件的結果快取 (LRU 筆數上限與有效秒數)
+MCP_RESULT_CACHE_SIZE = int(os.getenv("MCP_RESULT_CACHE_SIZE", "256"))
+MCP_RESULT_CACHE_TTL = float(os.getenv("MCP_RESULT_CACHE_TTL", "3600"))
+
+# ==============================================================================
+# 12. 本地意圖路由 (Gemini 之前的前置分類)
+# ==============================================================================
+
+# 啟用後，未對應到指令的訊息會先經過本地分類，明確的意圖直接以內建指令或固定回覆處理
+INTENT_ROUTER_ENABLED = os.getenv("INTENT_ROUTER_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# 本地分類模型的信心門檻；低於此值的訊息一律交給 Gemini
+INTENT_CONFIDENCE_THRESHOLD = float(os.getenv("INTENT_CONFIDENCE_THRESHOLD", "0.8"))
+
+# ==============================================================================
+# 13. Gemini 工具呼叫迴圈
+# ==============================================================================
+
+# 單次對話最多進行幾輪工具呼叫
+AI_MAX_TOOL_ROUNDS = int(os.getenv("AI_MAX_TOOL_ROUNDS", "4"))
+
+# 整段 AI 對話 (含所有工具呼叫) 的時間上限 (秒)
+AI_DEADLINE_SECONDS = float(os.getenv("AI_DEADLINE_SECONDS", "45"))
+
+# 同一輪中並行執行工具呼叫的執行緒數
+AI_TOOL_WORKERS = int(os.getenv("AI_TOOL_WORKERS", "4"))
+
+# ==============================================================================
+# 14. 工具結果壓縮 (送給 Gemini 前先做摘要統計)
+# ==============================================================================
+
+# 啟用後，工具結果超過 AI_TOOL_RESULT_FULL_ROWS 筆時改送摘要統計，而非每一筆資料
+AI_TOOL_RESULT_COMPACTION = os.getenv("AI_TOOL_RESULT_COMPACTION", "true").lower() in ("1", "true", "yes")
+AI_TOOL_RESULT_FULL_ROWS = int(os.getenv("AI_TOOL_RESULT_FULL_ROWS", "30"))
+
+# 摘要中附帶的規模前 N 大事件，以及依時間均勻抽樣的事件筆數 (0 表示不附樣本)
+AI_TOOL_RESULT_TOP_N = int(os.getenv("AI_TOOL_RESULT_TOP_N", "10"))
+AI_TOOL_RESULT_SAMPLE = int(os.getenv("AI_TOOL_RESULT_SAMPLE", "20"))
+
+# ==============================================================================
+# 15. 地圖繪製
+# ==============================================================================
+
+# 對外公開的網址 (例如 https://your-space.hf.space)，用於組成圖片連結；未設定時使用請求的網址
+PUBLIC_BASE_URL = (os.getenv("PUBLIC_BASE_URL") or "").rstrip("/")
+
+# 繪圖行程池的行程數，以及單張地圖繪製的逾時秒數
+MAP_RENDER_WORKERS = int(os.getenv("MAP_RENDER_WORKERS", "1"))
+MAP_RENDER_TIMEOUT = float(os.getenv("MAP_RENDER_TIMEOUT", "30"))
+
+# ==============================================================================
+# 16. 靜態檔案儲存 (STATIC_DIR 的容量上限與記憶體快取)
+# ==============================================================================
+
+# STATIC_DIR 的容量與檔案數上限，超過時淘汰最久未使用的檔案
+ASSET_STORE_MAX_BYTES = int(os.getenv("ASSET_STORE_MAX_BYTES", str(200 * 1024 * 1024)))
+ASSET_STORE_MAX_FILES = int(os.getenv("ASSET_STORE_MAX_FILES", "500"))
+
+# 小於此大小的熱門檔案直接由記憶體提供，以及記憶體快取的總容量
+ASSET_MEMORY_ITEM_MAX_BYTES = int(os.getenv("ASSET_MEMORY_ITEM_MAX_BYTES", str(512 * 1024)))
+ASSET_MEMORY_MAX_BYTES = int(os.getenv("ASSET_MEMORY_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# ==============================================================================
+# 17. 啟動與預熱
+# ==============================================================================
+
+# 啟用後，伺服器收到第一個請求 (例如健康檢查) 時在背景預先載入 pandas、Gemini SDK 等重量級套件，
+# 避免第一位使用者承擔載入成本；停用時則在第一個需要的指令執行時才載入
+WARMUP_ON_START = os.getenv("WARMUP_ON_START", "true").lower() in ("1", "true", "yes")
+
+# 開始預熱前的等待秒數，讓伺服器先處理完啟動時的請求
+WARMUP_DELAY_SECONDS = float(os.getenv("WARMUP_DELAY_SECONDS", "1"))
+
+# ==============================================================================
+# 18. 效能指標 (/metrics)
+# ==============================================================================
+
+# 單一事件處理超過此秒數時，將各階段 (上游 API、Gemini、回覆等) 的耗時印到日誌；0 表示停用
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "0"))
+
+# ==============================================================================
+# 19. 非同步 (ASGI) 服務模式
+# ==============================================================================
+
+# 以 asgi.py 啟動時 (例如 uvicorn asgi:app)，每個上游主機同時進行中的請求數上限
+ASYNC_UPSTREAM_CONCURRENCY = int(os.getenv("ASYNC_UPSTREAM_CONCURRENCY", "10"))
+
+# 同時進行中的 Gemini 對話數上限 (工具迴圈在執行緒中執行，不佔用事件迴圈)
+ASYNC_AI_CONCURRENCY = int(os.getenv("ASYNC_AI_CONCURRENCY", "4"))
+
+# 同時處理中的 webhook 事件數上限，超過時直接回覆忙碌訊息
+ASGI_MAX_INFLIGHT = int(os.getenv("ASGI_MAX_INFLIGHT", "200"))
+
+# ==============================================================================
+# 20. 跨行程共用快取 (多個 gunicorn worker 共用上游資料)
+# ==============================================================================
+
+# 啟用後，上游資料與 MCP 查詢結果會寫入 DATA_DIR 中的 SQLite (WAL) 快取，
+# 同一台主機上的所有 worker 共用，且同一時間只有一個行程會向上游取得同一筆資料
+SHARED_CACHE_ENABLED = os.getenv("SHARED_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH", os.path.join(DATA_DIR, "shared_cache.sqlite3"))
+
+# 負責載入的行程持有租約的最長秒數；超過 (例如該行程當機) 後其他行程可接手
+SHARED_CACHE_LEASE_SECONDS = float(os.getenv("SHARED_CACHE_LEASE_SECONDS", "30"))
+
+# ==============================================================================
+# 21. 地震速報推播 (訂閱者 multicast)
+# ==============================================================================
+
+# 啟用後，使用者可輸入「訂閱」/「取消訂閱」；背景輪詢偵測到新的 CWA 地震預警或顯著有感地震報告時，
+# 以 LINE multicast 推播給所有訂閱者 (會一併啟動背景輪詢)
+ALERT_FANOUT_ENABLED = os.getenv("ALERT_FANOUT_ENABLED", "false").lower() in ("1", "true", "yes")
+SUBSCRIBER_DB_PATH = os.getenv("SUBSCRIBER_DB_PATH", os.path.join(DATA_DIR, "subscribers.sqlite3"))
+
+# 每次 multicast 的收件人數 (LINE 上限為 500) 與每秒最多送出的 multicast 請求數
+ALERT_MULTICAST_BATCH_SIZE = min(500, int(os.getenv("ALERT_MULTICAST_BATCH_SIZE", "500")))
+ALERT_MULTICAST_PER_SECOND = float(os.getenv("ALERT_MULTICAST_PER_SECOND", "20"))
+
+# 單一批次失敗 (429 / 5xx / 連線錯誤) 時的重試次數與起始退避秒數 (每次加倍)
+ALERT_MAX_RETRIES = int(os.getenv("ALERT_MAX_RETRIES", "4"))
+ALERT_RETRY_BACKOFF = float(os.getenv("ALERT_RETRY_BACKOFF", "1"))
+
+# 只推播規模不低於此值的事件 (0 表示全部推播)
+ALERT_MIN_MAGNITUDE = float(os.getenv("ALERT_MIN_MAGNITUDE", "0"))
+
+# 推播中斷 (例如 worker 重啟) 超過此秒數的事件，由其他行程接手送出剩餘批次
+ALERT_RESUME_AFTER_SECONDS = float(os.getenv("ALERT_RESUME_AFTER_SECONDS", "300"))
+
+# ==============================================================================
+# 22. 上游容錯 (請求期限、斷路器、對沖請求、最後一次成功的資料)
+# ==============================================================================
+
+# 每組 webhook 事件從開始處理起的期限 (秒)；所有上游呼叫 (CWA、USGS、MCP、Gemini) 的逾時都不超過剩餘時間，
+# 讓回覆能在 LINE reply token 失效前送出
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "40"))
+
+# 同一個上游連續失敗幾次後開啟斷路器 (0 表示停用)，以及開啟後多久才放行一個試探請求 (秒)
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+# GET 超過此秒數仍未回應時，再送出一個相同的請求並採用先完成者 (0 表示停用)
+HTTP_HEDGE_DELAY = float(os.getenv("HTTP_HEDGE_DELAY", "0"))
+
+# 上游失敗時，改用快取中最後一次成功取得的資料 (並在回覆中標示) 的最大資料年齡 (秒)；0 表示停用
+STALE_FALLBACK_MAX_AGE = float(os.getenv("STALE_FALLBACK_MAX_AGE", "86400"))
+
+# ==============================================================================
+# 23. AI 對話記憶 (依使用者保存最近的對話與工具結果)
+# ==============================================================================
+
+# 啟用後，一對一聊天中的追問 (例如「那第二大的呢？」) 會帶著先前的對話與查詢結果，不必重新搜尋
+AI_SESSION_ENABLED = os.getenv("AI_SESSION_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# 每個行程最多保存幾位使用者的對話 (超過時淘汰最久未使用者)，以及閒置多久後清除 (秒)
+AI_SESSION_MAX_USERS = int(os.getenv("AI_SESSION_MAX_USERS", "500"))
+AI_SESSION_TTL_SECONDS = float(os.getenv("AI_SESSION_TTL_SECONDS", "1800"))
+
+# 每位使用者保存的對話 (含工具結果) 的估計 token 上限；超過時先移除較舊的工具結果，再把較舊的對話濃縮成摘要
+AI_SESSION_TOKEN_BUDGET = int(os.getenv("AI_SESSION_TOKEN_BUDGET", "6000"))
+
+# ==============================================================================
+# 24. 使用者頻率限制與重複請求合併
+# ==============================================================================
+
+# 依 LINE 使用者 ID 的 token bucket 頻率限制 (每個行程各自計算)；群組與聊天室不受限制
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# 一般指令 (地震查詢、說明等)：可連續送出的次數與每分鐘補充的次數
+RATE_LIMIT_CHEAP_BURST = int(os.getenv("RATE_LIMIT_CHEAP_BURST", "10"))
+RATE_LIMIT_CHEAP_PER_MINUTE = float(os.getenv("RATE_LIMIT_CHEAP_PER_MINUTE", "30"))
+
+# AI 對話與工具查詢 (「7 <問題>」與交給 Gemini 的一般文字)：可連續送出的次數與每分鐘補充的次數
+RATE_LIMIT_AI_BURST = int(os.getenv("RATE_LIMIT_AI_BURST", "3"))
+RATE_LIMIT_AI_PER_MINUTE = float(os.getenv("RATE_LIMIT_AI_PER_MINUTE", "6"))
+
+# 每個行程最多追蹤幾位使用者的 bucket (超過時淘汰最久未使用者)
+RATE_LIMIT_MAX_USERS = int(os.getenv("RATE_LIMIT_MAX_USERS", "5000"))
+
+# 同一位使用者在前一個相同請求仍在處理時再次送出，直接等待並共用前一個請求的回覆
+REQUEST_COALESCING_ENABLED = os.getenv("REQUEST_COALESCING_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# ==============================================================================
+# 25. 地震報告圖代理 (縮小後由 /static 提供)
+# ==============================================================================
+
+# 啟用後，CWA 報告圖 (ReportImageURI) 只下載一次，縮小為原圖與預覽圖後以地震編號快取在 STATIC_DIR，
+# 回覆改用本服務的 /static 連結 (需要可公開存取的網址：PUBLIC_BASE_URL 或請求的網址)
+REPORT_IMAGE_PROXY_ENABLED = os.getenv("REPORT_IMAGE_PROXY_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# 原圖與預覽圖的最長邊 (像素)，以及 JPEG 品質
+REPORT_IMAGE_MAX_SIDE = int(os.getenv("REPORT_IMAGE_MAX_SIDE", "1280"))
+REPORT_IMAGE_PREVIEW_SIDE = int(os.getenv("REPORT_IMAGE_PREVIEW_SIDE", "240"))
+REPORT_IMAGE_JPEG_QUALITY = int(os.getenv("REPORT_IMAGE_JPEG_QUALITY", "85"))
+
+# 下載報告圖的逾時秒數，以及接受的原始檔案大小上限 (位元組)
+REPORT_IMAGE_TIMEOUT = float(os.getenv("REPORT_IMAGE_TIMEOUT", "10"))
+REPORT_IMAGE_MAX_SOURCE_BYTES = int(os.getenv("REPORT_IMAGE_MAX_SOURCE_BYTES", str(10 * 1024 * 1024)))
+
+# 下載或處理失敗的報告圖在這段時間 (秒) 內不再重試，直接回覆 CWA 的原始網址
+REPORT_IMAGE_FAILURE_TTL = float(os.getenv("REPORT_IMAGE_FAILURE_TTL", "300"))
+
+# ==============================================================================
+# 26. 地震活動統計 (本地目錄的彙總與餘震分群)
+# ==============================================================================
+
+# 「地震活動」判斷近期是否偏高：比較近 N 天的事件數 (規模下限) 與過去幾年的平均值
+SEISMICITY_ACTIVITY_MIN_MAGNITUDE = float(os.getenv("SEISMICITY_ACTIVITY_MIN_MAGNITUDE", "4.5"))
+SEISMICITY_ACTIVITY_WINDOW_DAYS = int(os.getenv("SEISMICITY_ACTIVITY_WINDOW_DAYS", "30"))
+SEISMICITY_BASELINE_YEARS = int(os.getenv("SEISMICITY_BASELINE_YEARS", "5"))
+
+# 餘震分群時可作為主震的最小規模 (較小的事件只會被歸為餘震或獨立事件)
+SEISMICITY_MAINSHOCK_MIN_MAGNITUDE = float(os.getenv("SEISMICITY_MAINSHOCK_MIN_MAGNITUDE", "5.0"))
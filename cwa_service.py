@@ -1,9 +1,10 @@
 # cwa_service.py (Final Defensive Parsing Version)
-import requests
+import http_client
 import re
-import pandas as pd
 from datetime import datetime, timedelta, timezone
 from config import CWA_API_KEY, CWA_ALARM_API, CWA_SIGNIFICANT_API
+from response_cache import cached_feed, cached_feed_async
+from quake_models import Quake
 
 TAIPEI_TZ = timezone(timedelta(hours=8))
 
@@ -31,13 +32,71 @@ def _parse_cwa_time(s: str) -> tuple[str, str]:
         return (tw_str, utc_str)
     return (s, "未知")
 
+def _significant_params(days: int) -> dict:
+    now = datetime.now(timezone.utc)
+    time_from = (now - timedelta(days=days)).strftime("%Y-%m-%d")
+    return {"Authorization": CWA_API_KEY, "format": "JSON", "timeFrom": time_from}
+
+def _latest_params() -> dict:
+    return {"Authorization": CWA_API_KEY, "format": "JSON", "limit": 1, "orderby": "OriginTime desc"}
+
+def fetch_cwa_alarm_payload(refresh: bool = False) -> dict:
+    """取得 CWA 地震預警清單的原始 JSON (經由快取)。"""
+    def _load():
+        r = http_client.get(CWA_ALARM_API, timeout=10)
+        r.raise_for_status()
+        return r.json()
+    return cached_feed("cwa_alarm", None, _load, refresh)
+
+def fetch_significant_payload(days: int = 7, refresh: bool = False) -> dict:
+    """取得最近 N 天 CWA 顯著有感地震報告的原始 JSON (經由快取)。"""
+    def _load():
+        r = http_client.get(CWA_SIGNIFICANT_API, params=_significant_params(days), timeout=15)
+        r.raise_for_status()
+        return r.json()
+    return cached_feed("cwa_significant", days, _load, refresh)
+
+def fetch_latest_significant_payload(refresh: bool = False) -> dict:
+    """取得最新一筆 CWA 顯著有感地震報告的原始 JSON (經由快取)。"""
+    def _load():
+        r = http_client.get(CWA_SIGNIFICANT_API, params=_latest_params(), timeout=15)
+        r.raise_for_status()
+        return r.json()
+    return cached_feed("cwa_latest", None, _load, refresh)
+
+# --- 非同步版本 (ASGI 模式)，與同步版本共用快取與格式化 ---
+async def fetch_cwa_alarm_payload_async(refresh: bool = False) -> dict:
+    import async_http_client
+    return await cached_feed_async(
+        "cwa_alarm", None, lambda: async_http_client.get_json(CWA_ALARM_API, timeout=10), refresh)
+
+async def fetch_significant_payload_async(days: int = 7, refresh: bool = False) -> dict:
+    import async_http_client
+    return await cached_feed_async(
+        "cwa_significant", days,
+        lambda: async_http_client.get_json(CWA_SIGNIFICANT_API, params=_significant_params(days), timeout=15), refresh)
+
+async def fetch_latest_significant_payload_async(refresh: bool = False) -> dict:
+    import async_http_client
+    return await cached_feed_async(
+        "cwa_latest", None,
+        lambda: async_http_client.get_json(CWA_SIGNIFICANT_API, params=_latest_params(), timeout=15), refresh)
+
 def fetch_cwa_alarm_list(limit: int = 5) -> str:
     try:
-        r = requests.get(CWA_ALARM_API, timeout=10)
-        r.raise_for_status()
-        payload = r.json()
+        payload = fetch_cwa_alarm_payload()
+    except Exception as e:
+        return f"❌ 地震預警查詢失敗：{e}"
+    return format_cwa_alarm_list(payload, limit)
+
+async def fetch_cwa_alarm_list_async(limit: int = 5) -> str:
+    try:
+        payload = await fetch_cwa_alarm_payload_async()
     except Exception as e:
         return f"❌ 地震預警查詢失敗：{e}"
+    return format_cwa_alarm_list(payload, limit)
+
+def format_cwa_alarm_list(payload: dict, limit: int = 5) -> str:
     items = payload.get("data", [])
     if not items: return "✅ 目前沒有地震預警。"
     def _key(it):
@@ -65,7 +124,15 @@ def fetch_cwa_alarm_list(limit: int = 5) -> str:
         )
     return "\n\n".join(lines).strip()
 
-def _parse_significant_earthquakes(obj: dict) -> pd.DataFrame:
+def _parse_origin_time(s) -> datetime | None:
+    """CWA 的 OriginTime 為台灣時間 (例如 2025-01-01 08:00:00)；無法解析時回傳 None。"""
+    try:
+        dt = datetime.fromisoformat(str(s).strip())
+    except (TypeError, ValueError):
+        return None
+    return dt.replace(tzinfo=TAIPEI_TZ) if dt.tzinfo is None else dt.astimezone(TAIPEI_TZ)
+
+def _parse_significant_earthquakes(obj: dict) -> list[Quake]:
     records = obj.get("records", {})
     quakes = records.get("Earthquake", [])
     rows = []
@@ -81,69 +148,55 @@ def _parse_significant_earthquakes(obj: dict) -> pd.DataFrame:
         depth_raw = ei.get("FocalDepth") or ei.get("depth") or ei.get("Depth")
         mag_raw = mag_info.get("MagnitudeValue") or mag_info.get("magnitudeValue") or mag_info.get("Value") or mag_info.get("value")
         
-        rows.append({
-            "ID": q.get("EarthquakeNo"), "Time": ei.get("OriginTime"),
-            "Lat": _to_float(epic.get("EpicenterLatitude") or epic.get("epicenterLatitude")),
-            "Lon": _to_float(epic.get("EpicenterLongitude") or epic.get("epicenterLongitude")),
-            "Depth": _to_float(depth_raw), 
-            "Magnitude": _to_float(mag_raw),
-            "Location": epic.get("Location") or epic.get("location"), 
-            "URL": q.get("Web") or q.get("ReportURL"),
-        })
-        
-    df = pd.DataFrame(rows)
-    if not df.empty and "Time" in df.columns:
-        # df["Time"] = pd.to_datetime(df["Time"], errors="coerce", utc=True).dt.tz_convert(TAIPEI_TZ)
-        # 假設 TAIPEI_TZ 已在檔案開頭定義
-        df["Time"] = pd.to_datetime(df["Time"], errors="coerce").dt.tz_localize(TAIPEI_TZ)
-    return df
+        rows.append(Quake(
+            id=str(q.get("EarthquakeNo") or ""), time=_parse_origin_time(ei.get("OriginTime")),
+            latitude=_to_float(epic.get("EpicenterLatitude") or epic.get("epicenterLatitude")),
+            longitude=_to_float(epic.get("EpicenterLongitude") or epic.get("epicenterLongitude")),
+            depth=_to_float(depth_raw), 
+            magnitude=_to_float(mag_raw),
+            place=epic.get("Location") or epic.get("location") or "", 
+            url=q.get("Web") or q.get("ReportURL") or "",
+            image_url=q.get("ReportImageURI") or "",
+        ))
+    return rows
+
+def format_significant_earthquakes(data: dict, days: int = 7, limit: int = 5) -> str:
+    quakes = _parse_significant_earthquakes(data)
+    if not quakes: return f"✅ 過去 {days} 天內沒有顯著有感地震報告。"
+    # 依時間由新到舊排序，時間不明的排在最後
+    quakes.sort(key=lambda q: (q.time is not None, q.time.timestamp() if q.time else 0), reverse=True)
+    lines = [f"🚨 CWA 最新顯著有感地震 (近{days}天内):", "-" * 20]
+    for q in quakes[:limit]:
+        mag_str = f"{q.magnitude:.1f}" if q.magnitude is not None else "—"
+        depth_str = f"{q.depth:.0f}" if q.depth is not None else "—"
+        lines.append(
+            f"時間: {q.time.strftime('%Y-%m-%d %H:%M') if q.time else '—'}\n"
+            f"地點: {q.place or '—'}\n"
+            f"規模: M{mag_str} | 深度: {depth_str} km\n"
+            f"報告: {q.url or '無'}"
+        )
+    return "\n\n".join(lines)
 
 def fetch_significant_earthquakes(days: int = 7, limit: int = 5) -> str:
     if not CWA_API_KEY: return "❌ 顯著地震查詢失敗：管理者尚未設定 CWA_API_KEY。"
-    now = datetime.now(timezone.utc)
-    time_from = (now - timedelta(days=days)).strftime("%Y-%m-%d")
-    params = {"Authorization": CWA_API_KEY, "format": "JSON", "timeFrom": time_from}
     try:
-        r = requests.get(CWA_SIGNIFICANT_API, params=params, timeout=15)
-        r.raise_for_status()
-        data = r.json()
-        df = _parse_significant_earthquakes(data)
-        if df.empty: return f"✅ 過去 {days} 天內沒有顯著有感地震報告。"
-        df = df.sort_values(by="Time", ascending=False).head(limit)
-        lines = [f"🚨 CWA 最新顯著有感地震 (近{days}天内):", "-" * 20]
-        for _, row in df.iterrows():
-            mag_str = f"{row['Magnitude']:.1f}" if pd.notna(row['Magnitude']) else "—"
-            depth_str = f"{row['Depth']:.0f}" if pd.notna(row['Depth']) else "—"
-            lines.append(
-                f"時間: {row['Time'].strftime('%Y-%m-%d %H:%M') if pd.notna(row['Time']) else '—'}\n"
-                f"地點: {row['Location'] or '—'}\n"
-                f"規模: M{mag_str} | 深度: {depth_str} km\n"
-                f"報告: {row['URL'] or '無'}"
-            )
-        return "\n\n".join(lines)
+        return format_significant_earthquakes(fetch_significant_payload(days), days, limit)
     except Exception as e:
         return f"❌ 顯著地震查詢失敗：{e}"
 
-def fetch_latest_significant_earthquake() -> dict | None:
+async def fetch_significant_earthquakes_async(days: int = 7, limit: int = 5) -> str:
+    if not CWA_API_KEY: return "❌ 顯著地震查詢失敗：管理者尚未設定 CWA_API_KEY。"
     try:
-        if not CWA_API_KEY: raise ValueError("錯誤：尚未設定 CWA_API_KEY Secret。")
-        params = {"Authorization": CWA_API_KEY, "format": "JSON", "limit": 1, "orderby": "OriginTime desc"}
-        r = requests.get(CWA_SIGNIFICANT_API, params=params, timeout=15)
-        r.raise_for_status()
-        data = r.json()
-        df = _parse_significant_earthquakes(data)
-        if df.empty: return None
-
-        latest_eq_data = df.iloc[0].to_dict()
-        
-        quakes = data.get("records", {}).get("Earthquake", [])
-        if quakes:
-            latest_eq_data["ImageURL"] = quakes[0].get("ReportImageURI")
-
-        if pd.notna(latest_eq_data.get("Time")):
-            latest_eq_data["TimeStr"] = latest_eq_data["Time"].strftime('%Y-%m-%d %H:%M')
-
-        return latest_eq_data
+        return format_significant_earthquakes(await fetch_significant_payload_async(days), days, limit)
     except Exception as e:
-        raise e
+        return f"❌ 顯著地震查詢失敗：{e}"
+
+def fetch_latest_significant_earthquake() -> Quake | None:
+    if not CWA_API_KEY: raise ValueError("錯誤：尚未設定 CWA_API_KEY Secret。")
+    quakes = _parse_significant_earthquakes(fetch_latest_significant_payload())
+    return quakes[0] if quakes else None
 
+async def fetch_latest_significant_earthquake_async() -> Quake | None:
+    if not CWA_API_KEY: raise ValueError("錯誤：尚未設定 CWA_API_KEY Secret。")
+    quakes = _parse_significant_earthquakes(await fetch_latest_significant_payload_async())
+    return quakes[0] if quakes else None
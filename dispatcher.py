@@ -0,0 +1,74 @@
+# dispatcher.py
+import os
+import queue
+import threading
+from typing import Callable
+
+class WebhookDispatcher:
+    """
+    有界的背景工作池：/callback 只負責把事件放進佇列，
+    由固定數量的工作執行緒呼叫 worker_fn(event, base_url) 處理並回覆。
+    """
+
+    def __init__(self, worker_fn: Callable, workers: int = 4, maxsize: int = 100):
+        self._worker_fn = worker_fn
+        self._workers = max(1, int(workers))
+        self._queue = queue.Queue(maxsize=max(1, int(maxsize)))
+        self._lock = threading.Lock()
+        self._threads = []
+        self._pid = None
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def _ensure_started(self) -> None:
+        # gunicorn 會在 fork 之後才處理請求，因此在第一次送件時才建立執行緒，
+        # 並以 PID 判斷是否需要在子行程中重新建立。
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            self._threads = [
+                threading.Thread(target=self._run, name=f"webhook-worker-{i}", daemon=True)
+                for i in range(self._workers)
+            ]
+            for t in self._threads:
+                t.start()
+            self._pid = os.getpid()
+
+    def _run(self) -> None:
+        while True:
+            event, base_url = self._queue.get()
+            try:
+                self._worker_fn(event, base_url)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"背景處理 Webhook 事件失敗: {e}")
+            finally:
+                self._queue.task_done()
+
+    def submit(self, event, base_url: str) -> bool:
+        """將事件放入佇列；佇列已滿時回傳 False。"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((event, base_url))
+            return True
+        except queue.Full:
+            self.rejected += 1
+            return False
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> dict:
+        return {
+            "workers": self._workers,
+            "queue_depth": self.qsize(),
+            "queue_maxsize": self._queue.maxsize,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
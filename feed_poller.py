@@ -0,0 +1,185 @@
+# feed_poller.py
+import os
+import threading
+import time
+
+from config import FEED_POLL_INTERVALS, FEED_SNAPSHOT_MAX_AGE_FACTOR, PUBLIC_BASE_URL
+from cwa_service import fetch_cwa_alarm_payload, fetch_significant_payload, fetch_latest_significant_payload
+from usgs_service import fetch_global_last24h_payload
+import catalog_store
+
+# 已追蹤事件 ID 的上限，避免長時間執行後無限成長
+MAX_SEEN_IDS = 2000
+
+def _fetch_significant() -> dict:
+    # /latest 與 /significant 都來自 E-A0015-001，一起更新快取
+    fetch_latest_significant_payload(refresh=True)
+    return fetch_significant_payload(refresh=True)
+
+# 每個 feed：如何取得資料、如何列出事件與其 ID/版本，以及要預先產生哪些指令的回覆
+FEEDS = {
+    "cwa_alarm": {
+        "fetch": lambda: fetch_cwa_alarm_payload(refresh=True),
+        "items": lambda payload: payload.get("data", []) or [],
+        "id": lambda it: str(it.get("identifier")),
+        "version": lambda it: it.get("msgNo"),
+        "commands": ("/alert",),
+    },
+    "cwa_significant": {
+        "fetch": _fetch_significant,
+        "items": lambda payload: payload.get("records", {}).get("Earthquake", []) or [],
+        "id": lambda q: str(q.get("EarthquakeNo")),
+        "version": lambda q: q.get("ReportContent"),
+        "commands": ("/significant", "/latest"),
+    },
+    "usgs_global": {
+        "fetch": lambda: fetch_global_last24h_payload(refresh=True),
+        "items": lambda payload: payload.get("features", []) or [],
+        "id": lambda f: str(f.get("id")),
+        "version": lambda f: f.get("properties", {}).get("updated"),
+        "commands": ("/global",),
+    },
+    "usgs_catalog": {
+        # 增量同步本地目錄；回傳的是本次有異動的事件
+        "fetch": catalog_store.sync,
+        "items": lambda payload: payload.get("features", []),
+        "id": lambda f: str(f.get("id")),
+        "version": lambda f: f.get("properties", {}).get("updated"),
+        "commands": ("/taiwan",),
+    },
+}
+
+class FeedPoller:
+    """
+    在背景依各 feed 的間隔輪詢上游資料，以事件 ID 偵測新事件，
+    並在資料有變動時預先產生對應指令的回覆訊息 (TextMessage / ImageMessage)。
+    """
+
+    def __init__(self, feeds: dict, intervals: dict):
+        self._feeds = feeds
+        self._intervals = {name: intervals.get(name, 60) for name in feeds}
+        self._lock = threading.Lock()
+        self._snapshots = {}   # command -> (messages, feed)
+        self._checked_at = {}  # feed -> 最後一次成功輪詢的 monotonic 時間
+        self._fingerprints = {}
+        self._seen = {}        # feed -> dict(id -> None)，保留插入順序
+        self._listeners = []
+        self._counts = {name: {"polls": 0, "errors": 0, "renders": 0, "new_events": 0} for name in feeds}
+        self._pid = None
+        self._stop = threading.Event()
+
+    def add_listener(self, fn) -> None:
+        """註冊新事件通知：fn(feed_name, new_items)。首次輪詢的既有事件不會通知。"""
+        self._listeners.append(fn)
+
+    def _commands(self, spec: dict) -> tuple:
+        """要預先產生回覆的指令。回覆含 /static 圖片連結的指令需要公開網址，未設定 PUBLIC_BASE_URL 時改由請求即時產生。"""
+        # 延遲匯入以避免與 command_handler 互相匯入
+        from command_handler import BASE_URL_COMMANDS
+        if PUBLIC_BASE_URL:
+            return spec["commands"]
+        return tuple(c for c in spec["commands"] if c not in BASE_URL_COMMANDS)
+
+    def _render(self, commands: tuple) -> dict:
+        from command_handler import build_reply
+        return {command: build_reply(command, "", PUBLIC_BASE_URL) for command in commands}
+
+    def poll_once(self, name: str) -> list:
+        """輪詢單一 feed，回傳本次偵測到的新事件。"""
+        spec = self._feeds[name]
+        try:
+            payload = spec["fetch"]()
+            items = spec["items"](payload)
+        except Exception as e:
+            self._counts[name]["errors"] += 1
+            print(f"背景輪詢 {name} 失敗: {e}")
+            return []
+        self._counts[name]["polls"] += 1
+
+        ids = [spec["id"](it) for it in items]
+        fingerprint = tuple((i, spec["version"](it)) for i, it in zip(ids, items))
+        seen = self._seen.get(name)
+        new_items = [it for i, it in zip(ids, items) if seen is not None and i not in seen]
+
+        commands = self._commands(spec)
+        if fingerprint != self._fingerprints.get(name) or any(c not in self._snapshots for c in commands):
+            rendered = self._render(commands)
+            self._counts[name]["renders"] += 1
+            with self._lock:
+                for command, messages in rendered.items():
+                    self._snapshots[command] = (messages, name)
+            self._fingerprints[name] = fingerprint
+
+        seen = dict(seen or {})
+        seen.update(dict.fromkeys(ids))
+        while len(seen) > MAX_SEEN_IDS:
+            seen.pop(next(iter(seen)))
+        self._seen[name] = seen
+        with self._lock:
+            self._checked_at[name] = time.monotonic()
+
+        if new_items:
+            self._counts[name]["new_events"] += len(new_items)
+            print(f"--- {name} 偵測到 {len(new_items)} 筆新事件 ---")
+            for fn in self._listeners:
+                try:
+                    fn(name, new_items)
+                except Exception as e:
+                    print(f"新事件通知處理失敗: {e}")
+        return new_items
+
+    def _run(self) -> None:
+        next_due = {name: 0.0 for name in self._feeds}
+        while not self._stop.is_set():
+            name = min(next_due, key=next_due.get)
+            delay = next_due[name] - time.monotonic()
+            if delay > 0 and self._stop.wait(delay):
+                break
+            self.poll_once(name)
+            next_due[name] = time.monotonic() + self._intervals[name]
+
+    def ensure_started(self) -> None:
+        """啟動背景輪詢執行緒 (每個行程一次，fork 後會重新啟動)。"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._stop.clear()
+            threading.Thread(target=self._run, name="feed-poller", daemon=True).start()
+            self._pid = os.getpid()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._pid = None
+
+    def snapshot_age(self, feed: str) -> float | None:
+        checked_at = self._checked_at.get(feed)
+        return None if checked_at is None else time.monotonic() - checked_at
+
+    def get_snapshot(self, command: str) -> list | None:
+        """取得預先產生的回覆；快照不存在或過舊時回傳 None。"""
+        with self._lock:
+            entry = self._snapshots.get(command)
+        if entry is None:
+            return None
+        messages, feed = entry
+        age = self.snapshot_age(feed)
+        if age is None or age > self._intervals[feed] * FEED_SNAPSHOT_MAX_AGE_FACTOR:
+            return None
+        return list(messages)
+
+    def stats(self) -> dict:
+        result = {}
+        for name in self._feeds:
+            age = self.snapshot_age(name)
+            result[name] = {
+                **self._counts[name],
+                "interval_seconds": self._intervals[name],
+                "age_seconds": round(age, 3) if age is not None else None,
+                "events_tracked": len(self._seen.get(name) or ()),
+            }
+        return result
+
+
+feed_poller = FeedPoller(FEEDS, FEED_POLL_INTERVALS)
@@ -0,0 +1,134 @@
+# http_client.py
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import TimeoutError as Urllib3TimeoutError
+from urllib3.util.retry import Retry
+
+import metrics
+import resilience
+from config import HTTP_POOL_MAXSIZE, HTTP_RETRY_TOTAL, HTTP_RETRY_BACKOFF, HTTP_RETRY_JITTER, HTTP_HEDGE_DELAY
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+hedged_requests = metrics.register(metrics.Counter(
+    "linebot_http_hedged_requests_total", "GETs that sent a second (hedged) request, by which one answered first.",
+    ("host", "winner")))
+
+_lock = threading.Lock()
+_sessions = {}
+_hedge_executor = None
+_pid = None
+
+def _build_session() -> requests.Session:
+    retry = Retry(
+        total=HTTP_RETRY_TOTAL,
+        backoff_factor=HTTP_RETRY_BACKOFF,
+        backoff_jitter=HTTP_RETRY_JITTER,
+        status_forcelist=RETRY_STATUS,
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_MAXSIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def get_session(url: str) -> requests.Session:
+    """取得目標主機專用、可重複使用 keep-alive 連線的 Session (每個行程各自一份)。"""
+    host = urlsplit(url).netloc
+    with _lock:
+        _ensure_process()
+        session = _sessions.get(host)
+        if session is None:
+            session = _sessions[host] = _build_session()
+        return session
+
+def _ensure_process() -> None:
+    # 呼叫端須持有 _lock；fork 後不可共用父行程的 socket 與執行緒
+    global _pid, _hedge_executor
+    if _pid != os.getpid():
+        _sessions.clear()
+        _hedge_executor = None
+        _pid = os.getpid()
+
+def _get_hedge_executor() -> ThreadPoolExecutor:
+    global _hedge_executor
+    with _lock:
+        _ensure_process()
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(max_workers=HTTP_POOL_MAXSIZE * 2, thread_name_prefix="http-hedge")
+        return _hedge_executor
+
+def _close_response(future) -> None:
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+def _hedged_get(session: requests.Session, url: str, host: str, kwargs: dict) -> requests.Response:
+    """先送出一個請求；HTTP_HEDGE_DELAY 秒內未完成就再送一個相同的請求，採用先成功者。"""
+    executor = _get_hedge_executor()
+    futures = [executor.submit(contextvars.copy_context().run, session.get, url, **kwargs)]
+    done, _ = wait(futures, timeout=HTTP_HEDGE_DELAY)
+    if not done:
+        futures.append(executor.submit(contextvars.copy_context().run, session.get, url, **kwargs))
+    pending, error = set(futures), None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        winners = [f for f in done if f.exception() is None]
+        if winners:
+            for f in winners[1:]:
+                _close_response(f)
+            for f in pending:
+                f.add_done_callback(_close_response)
+            if len(futures) > 1:
+                hedged_requests.inc(host=host, winner="first" if winners[0] is futures[0] else "hedge")
+            return winners[0].result()
+        error = next(iter(done)).exception()
+    raise error
+
+def _is_timeout(e: Exception) -> bool:
+    # 重試用完時，讀取逾時會被包成 ConnectionError(MaxRetryError(reason=ReadTimeoutError))
+    reason = getattr(e.args[0], "reason", None) if e.args else None
+    return isinstance(e, requests.Timeout) or isinstance(reason, Urllib3TimeoutError)
+
+def get(url: str, **kwargs) -> requests.Response:
+    """
+    以連線池發送 GET 請求；429 / 5xx 會自動退避重試。耗時與結果依上游主機記錄於 metrics。
+    逾時不超過本次請求的剩餘期限，並經過該主機的斷路器；啟用 HTTP_HEDGE_DELAY 時慢的請求會再送一次。
+    """
+    host = urlsplit(url).netloc
+    default_timeout = kwargs.get("timeout")
+    kwargs["timeout"] = resilience.timeout(default_timeout)
+    # 逾時因請求期限而縮短時，逾時不代表上游不健康
+    shortened = default_timeout is not None and kwargs["timeout"] < default_timeout
+    breaker = resilience.breaker(host)
+    breaker.before()
+    status = None
+    try:
+        with metrics.span(f"http:{host}"):
+            session = get_session(url)
+            if HTTP_HEDGE_DELAY > 0:
+                response = _hedged_get(session, url, host, kwargs)
+            else:
+                response = session.get(url, **kwargs)
+            status = response.status_code
+    except Exception as e:
+        if shortened and _is_timeout(e):
+            breaker.release()
+        else:
+            breaker.failure()
+        raise
+    finally:
+        metrics.record_upstream(host, status)
+    if status in RETRY_STATUS:
+        breaker.failure()
+    else:
+        breaker.success()
+    return response
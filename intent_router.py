@@ -0,0 +1,166 @@
+# intent_router.py
+import difflib
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+
+from config import INTENT_CONFIDENCE_THRESHOLD
+
+# 固定回覆
+CANNED_REPLIES = {
+    "greeting": "👋 你好！輸入「9」查看指令列表，或輸入「7 您的問題」與 AI 助理對話。",
+    "thanks": "😊 不客氣！有需要隨時找我。",
+    "empty": "🙂 輸入「9」可以查看我能做的事喔！",
+}
+
+# 小型離線分類器的訓練語料；"ai" 類別代表應交給 Gemini 的一般問題
+TRAINING_EXAMPLES = {
+    "/latest": ["最新地震", "剛剛的地震", "剛才地震", "最近一次地震", "最新的地震報告", "剛剛地震", "最新一筆地震", "地震報告"],
+    "/alert": ["地震速報", "預警", "地震警報", "地震預警查詢", "速報", "強震即時警報"],
+    "/global": ["全球地震", "世界地震", "國外地震", "全世界地震", "全球24小時地震"],
+    "/taiwan": ["台灣今年地震", "今年台灣地震", "台灣地震列表", "今年的地震", "臺灣今年地震"],
+    "/significant": ["顯著地震", "有感地震", "最近七天地震", "這週地震", "近7天地震", "顯著有感地震"],
+    "/help": ["指令", "說明", "help", "怎麼用", "功能", "選單", "menu", "指令列表", "使用說明"],
+    "/info": ["關於", "你是誰", "版本", "about", "關於你", "開發者"],
+    "greeting": ["你好", "嗨", "哈囉", "hi", "hello", "早安", "午安", "晚安", "安安", "哈嘍", "您好", "hey"],
+    "thanks": ["謝謝", "感謝", "thanks", "thank you", "謝啦", "3q", "多謝", "感恩", "thx"],
+    "ai": [
+        "台灣最高的山是哪座", "今天天氣如何", "幫我寫一首詩", "2024年最大的地震是哪一個",
+        "花蓮昨天有地震嗎", "地震為什麼會發生", "規模和震度有什麼不同", "幫我找找去年規模6以上的地震",
+        "如何準備防災包", "請解釋板塊運動", "明天會下雨嗎", "翻譯這句話", "1999年集集地震的規模",
+        "台北有活動斷層嗎", "比較今年和去年的地震次數", "寫一個python程式", "講個笑話",
+        "what is an earthquake", "tell me a story", "推薦一本書",
+    ],
+}
+
+# 額外的別名 (與 command_handler.CMD_MAP 一起用於模糊比對)
+EXTRA_ALIASES = {
+    "最新地震": "/latest", "全球地震": "/global", "地震速報": "/alert",
+    "有感地震": "/significant", "顯著地震": "/significant", "指令": "/help", "說明": "/help",
+}
+
+# 看起來是真正問題的訊息，直接交給 Gemini
+QUESTION_PATTERN = re.compile(r"[?？]|嗎|呢|什麼|甚麼|多少|哪|為何|為什麼|怎麼|如何|幾|是否|請問|幫我")
+
+# 規則與模糊比對只處理短訊息，長句交給分類器或 Gemini
+SHORT_MESSAGE_LENGTH = 8
+
+# 分類器判定時，訊息特徵至少要有此比例出現在該類別的語料中，避免對陌生內容過度自信
+MIN_FEATURE_COVERAGE = 0.6
+
+# 關鍵字規則：短訊息以這些詞開頭即視為寒暄或道謝 (例如「早安啊」、「謝謝你」)
+KEYWORD_RULES = {
+    "greeting": ("你好", "您好", "哈囉", "哈嘍", "嗨", "hi", "hello", "hey", "早安", "午安", "晚安", "安安"),
+    "thanks": ("謝謝", "感謝", "多謝", "感恩", "thanks", "thankyou", "thx", "3q"),
+}
+
+@dataclass
+class Route:
+    kind: str             # "command" | "canned" | "llm"
+    stage: str            # 判定的階段
+    command: str = ""
+    reply: str = ""
+    confidence: float = 1.0
+
+def normalize(text: str) -> str:
+    """全形轉半形、轉小寫，並移除空白、標點與表情符號。"""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return "".join(ch for ch in text if unicodedata.category(ch)[0] in ("L", "N"))
+
+def _features(text: str) -> list[str]:
+    chars = list(text)
+    return chars + [a + b for a, b in zip(chars, chars[1:])]
+
+class NaiveBayesIntentModel:
+    """以字元 unigram/bigram 為特徵的多項式 Naive Bayes 分類器 (訓練資料很小，啟動時即時訓練)。"""
+
+    def __init__(self, examples: dict):
+        self._token_counts = {}
+        self._totals = {}
+        self._priors = {}
+        vocab = set()
+        n_docs = sum(len(v) for v in examples.values())
+        for label, texts in examples.items():
+            counts = Counter()
+            for t in texts:
+                counts.update(_features(normalize(t)))
+            self._token_counts[label] = counts
+            self._totals[label] = sum(counts.values())
+            self._priors[label] = math.log(len(texts) / n_docs)
+            vocab.update(counts)
+        self._vocab_size = len(vocab)
+
+    def predict(self, text: str) -> tuple[str, float, float]:
+        """回傳 (最可能的類別, 後驗機率, 訊息特徵出現在該類別語料中的比例)。"""
+        feats = _features(text)
+        scores = {}
+        for label, counts in self._token_counts.items():
+            denom = self._totals[label] + self._vocab_size
+            scores[label] = self._priors[label] + sum(math.log((counts[f] + 1) / denom) for f in feats)
+        best = max(scores, key=scores.get)
+        z = sum(math.exp(s - scores[best]) for s in scores.values())
+        coverage = sum(1 for f in feats if f in self._token_counts[best]) / max(1, len(feats))
+        return best, 1.0 / z, coverage
+
+class IntentRouter:
+    def __init__(self, aliases: dict, threshold: float):
+        self._aliases = {normalize(k): v for k, v in aliases.items() if normalize(k)}
+        self._fuzzy_keys = [k for k in self._aliases if len(k) >= 2]
+        self._threshold = threshold
+        self._model = NaiveBayesIntentModel(TRAINING_EXAMPLES)
+        self._lock = threading.Lock()
+        self._counts = defaultdict(int)
+
+    def _record(self, route: Route) -> Route:
+        with self._lock:
+            self._counts[f"{route.kind}:{route.stage}"] += 1
+            self._counts["llm_calls" if route.kind == "llm" else "llm_calls_saved"] += 1
+        return route
+
+    def route(self, text: str) -> Route:
+        """判斷一則未對應到指令的訊息該如何處理。"""
+        norm = normalize(text)
+        if not norm:
+            return self._record(Route("canned", "empty", reply=CANNED_REPLIES["empty"]))
+        if norm in self._aliases:
+            return self._record(Route("command", "alias", command=self._aliases[norm]))
+        if QUESTION_PATTERN.search(text) and len(norm) > 2:
+            return self._record(Route("llm", "question"))
+        if len(norm) <= SHORT_MESSAGE_LENGTH:
+            for label, keywords in KEYWORD_RULES.items():
+                if any(norm.startswith(k) and len(norm) <= len(k) + 2 for k in keywords):
+                    return self._record(Route("canned", "keyword", reply=CANNED_REPLIES[label]))
+            match = difflib.get_close_matches(norm, self._fuzzy_keys, n=1, cutoff=0.75)
+            if match:
+                ratio = difflib.SequenceMatcher(None, norm, match[0]).ratio()
+                return self._record(Route("command", "fuzzy", command=self._aliases[match[0]], confidence=ratio))
+        label, confidence, coverage = self._model.predict(norm)
+        if label != "ai" and confidence >= self._threshold and coverage >= MIN_FEATURE_COVERAGE:
+            if label in CANNED_REPLIES:
+                return self._record(Route("canned", "model", reply=CANNED_REPLIES[label], confidence=confidence))
+            return self._record(Route("command", "model", command=label, confidence=confidence))
+        return self._record(Route("llm", "fallback", confidence=confidence))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counts)
+
+
+_router = None
+_router_lock = threading.Lock()
+
+def get_router() -> IntentRouter:
+    """取得共用的路由器 (第一次使用時以 command_handler 的別名建立)。"""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                from command_handler import CMD_MAP
+                _router = IntentRouter({**CMD_MAP, **EXTRA_ALIASES}, INTENT_CONFIDENCE_THRESHOLD)
+    return _router
+
+def stats() -> dict:
+    return _router.stats() if _router is not None else {}
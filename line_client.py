@@ -0,0 +1,131 @@
+# line_client.py
+import asyncio
+import os
+import threading
+import time
+from linebot.v3.messaging import (
+    Configuration, ApiClient, MessagingApi, AsyncApiClient, AsyncMessagingApi,
+    ReplyMessageRequest, PushMessageRequest
+)
+from linebot.v3.messaging.exceptions import ApiException
+
+import metrics
+from config import CHANNEL_ACCESS_TOKEN, REPLY_TOKEN_TTL_SECONDS, HTTP_POOL_MAXSIZE, LINE_API_HOST
+
+line_config = Configuration(host=LINE_API_HOST, access_token=CHANNEL_ACCESS_TOKEN)
+line_config.connection_pool_maxsize = HTTP_POOL_MAXSIZE
+
+_api_lock = threading.Lock()
+_api_client = None
+_messaging_api = None
+_api_pid = None
+
+def get_messaging_api() -> MessagingApi:
+    """
+    取得此行程共用的 MessagingApi。
+    ApiClient 內部的 urllib3 連線池可跨執行緒使用，保留 keep-alive 連線以省去每次回覆的 TLS 握手。
+    """
+    global _api_client, _messaging_api, _api_pid
+    if _api_pid == os.getpid():
+        return _messaging_api
+    with _api_lock:
+        if _api_pid != os.getpid():
+            _api_client = ApiClient(line_config)
+            _messaging_api = MessagingApi(_api_client)
+            _api_pid = os.getpid()
+        return _messaging_api
+
+_async_state = {"key": None, "client": None, "api": None}
+
+def get_async_messaging_api() -> AsyncMessagingApi:
+    """取得目前事件迴圈共用的 AsyncMessagingApi (aiohttp 連線池綁定事件迴圈，換了迴圈就重新建立)。"""
+    key = (os.getpid(), asyncio.get_running_loop())
+    if _async_state["key"] != key:
+        client = AsyncApiClient(line_config)
+        _async_state.update(key=key, client=client, api=AsyncMessagingApi(client))
+    return _async_state["api"]
+
+async def aclose() -> None:
+    """關閉目前事件迴圈的 AsyncApiClient (ASGI lifespan 結束時呼叫)。"""
+    client = _async_state["client"]
+    _async_state.update(key=None, client=None, api=None)
+    if client is not None:
+        await client.close()
+
+def get_push_target(event) -> str | None:
+    """取得事件來源 (使用者、群組或聊天室) 的 ID，供 push API 使用。"""
+    source = getattr(event, "source", None)
+    if source is None:
+        return None
+    return (getattr(source, "group_id", None)
+            or getattr(source, "room_id", None)
+            or getattr(source, "user_id", None))
+
+def get_user_id(event) -> str | None:
+    """一對一聊天的使用者 ID；群組與聊天室回傳 None (訂閱推播只對使用者本人)。"""
+    source = getattr(event, "source", None)
+    if getattr(source, "type", None) != "user":
+        return None
+    return getattr(source, "user_id", None)
+
+def _reply_token_expired(event) -> bool:
+    """依事件時間戳判斷 reply token 是否已經過期。"""
+    timestamp_ms = getattr(event, "timestamp", None)
+    if not timestamp_ms:
+        return False
+    return time.time() - timestamp_ms / 1000 > REPLY_TOKEN_TTL_SECONDS
+
+def _is_invalid_reply_token(e: ApiException) -> bool:
+    return e.status == 400 and "reply token" in str(e.body or "").lower()
+
+def send_reply(event, messages: list) -> None:
+    """
+    回覆使用者訊息。
+    若 reply token 已過期 (等待過久或 LINE 回報無效)，改用 push API 傳送。
+    """
+    target = get_push_target(event)
+    line_bot_api = get_messaging_api()
+    if target and _reply_token_expired(event):
+        print("--- reply token 已逾時，改用 push API 回覆 ---")
+        with metrics.span("line_push"):
+            line_bot_api.push_message_with_http_info(
+                PushMessageRequest(to=target, messages=messages)
+            )
+        return
+    try:
+        with metrics.span("line_reply"):
+            line_bot_api.reply_message_with_http_info(
+                ReplyMessageRequest(
+                    reply_token=event.reply_token,
+                    messages=messages
+                )
+            )
+    except ApiException as e:
+        if not (target and _is_invalid_reply_token(e)):
+            raise
+        print("--- reply token 無效，改用 push API 回覆 ---")
+        with metrics.span("line_push"):
+            line_bot_api.push_message_with_http_info(
+                PushMessageRequest(to=target, messages=messages)
+            )
+
+async def send_reply_async(event, messages: list) -> None:
+    """send_reply 的非同步版本，逾時與無效 reply token 時同樣改用 push API。"""
+    target = get_push_target(event)
+    line_bot_api = get_async_messaging_api()
+    if target and _reply_token_expired(event):
+        print("--- reply token 已逾時，改用 push API 回覆 ---")
+        with metrics.span("line_push"):
+            await line_bot_api.push_message_with_http_info(PushMessageRequest(to=target, messages=messages))
+        return
+    try:
+        with metrics.span("line_reply"):
+            await line_bot_api.reply_message_with_http_info(
+                ReplyMessageRequest(reply_token=event.reply_token, messages=messages)
+            )
+    except ApiException as e:
+        if not (target and _is_invalid_reply_token(e)):
+            raise
+        print("--- reply token 無效，改用 push API 回覆 ---")
+        with metrics.span("line_push"):
+            await line_bot_api.push_message_with_http_info(PushMessageRequest(to=target, messages=messages))
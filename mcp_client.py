@@ -0,0 +1,120 @@
+# mcp_client.py
+import queue
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from datetime import datetime
+
+from config import MCP_SERVER_URL, MCP_CLIENT_POOL_SIZE, MCP_RESULT_CACHE_SIZE, MCP_RESULT_CACHE_TTL
+from response_cache import TTLCache, shared_loader
+import metrics
+import resilience
+
+MCP_API_NAME = "/gradio_fetch_and_plot_data"
+
+class ClientPool:
+    """
+    延遲建立、可重複使用的 Gradio Client 連線池。
+    建立 Client 時需下載設定並解析 API，只在第一次使用 (或連線損壞後) 才付出這個成本。
+    """
+
+    def __init__(self, src: str, size: int):
+        self._src = src
+        self._size = max(1, int(size))
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self._size)
+        self.created = 0
+        self.discarded = 0
+
+    def _acquire(self):
+        self._slots.acquire()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            from gradio_client import Client  # 延遲載入，只有第一次查詢才付出匯入成本
+            client = Client(src=self._src, verbose=False)
+        except BaseException:
+            self._slots.release()
+            raise
+        self.created += 1
+        return client
+
+    def predict(self, **kwargs):
+        """
+        借用一個 Client 呼叫 predict；發生錯誤時丟棄該 Client，下次重新連線。
+        經過 "mcp" 斷路器，且最多等到本次請求的期限。
+        """
+        timeout = resilience.timeout(None)
+        breaker = resilience.breaker("mcp")
+        breaker.before()
+        try:
+            client = self._acquire()
+        except Exception:
+            breaker.failure()
+            raise
+        try:
+            with metrics.span("mcp_predict"):
+                result = client.submit(**kwargs).result(timeout=timeout)
+        except FutureTimeoutError as e:
+            # 因請求期限而放棄等待，不代表 MCP 伺服器故障
+            # (Python 3.10 以前 concurrent.futures.TimeoutError 不是內建 TimeoutError 的子類別)
+            breaker.release()
+            self.discarded += 1
+            self._slots.release()
+            raise resilience.DeadlineExceeded("等待 MCP 查詢結果逾時") from e
+        except BaseException:
+            breaker.failure()
+            self.discarded += 1
+            self._slots.release()
+            raise
+        breaker.success()
+        self._idle.put(client)
+        self._slots.release()
+        return result
+
+    def stats(self) -> dict:
+        return {"size": self._size, "idle": self._idle.qsize(), "created": self.created, "discarded": self.discarded}
+
+
+client_pool = ClientPool(MCP_SERVER_URL, MCP_CLIENT_POOL_SIZE)
+result_cache = TTLCache(maxsize=MCP_RESULT_CACHE_SIZE)
+
+def _normalize_date(s: str) -> str:
+    return datetime.strptime(str(s).strip(), "%Y-%m-%d").strftime("%Y-%m-%d")
+
+def search(start_date: str, end_date: str,
+           min_latitude: float, max_latitude: float,
+           min_longitude: float, max_longitude: float,
+           min_depth: float, max_depth: float,
+           min_magnitude: float, max_magnitude: float) -> dict:
+    """
+    向 MCP 伺服器查詢地震資料表 ({"headers", "data"})。
+    以正規化後的查詢條件為 key 快取結果；相同查詢在 TTL 內不會再呼叫遠端，並行的相同查詢也只會送出一次。
+    """
+    start_date, end_date = _normalize_date(start_date), _normalize_date(end_date)
+    key = (
+        start_date, end_date,
+        round(float(min_latitude), 3), round(float(max_latitude), 3),
+        round(float(min_longitude), 3), round(float(max_longitude), 3),
+        round(float(min_depth), 1), round(float(max_depth), 1),
+        round(float(min_magnitude), 2), round(float(max_magnitude), 2),
+    )
+
+    def _load() -> dict:
+        result = client_pool.predict(
+            param_0=start_date, param_1="00:00:00",
+            param_2=end_date, param_3="23:59:59",
+            param_4=key[2], param_5=key[3],
+            param_6=key[4], param_7=key[5],
+            param_8=key[6], param_9=key[7],
+            param_10=key[8], param_11=key[9],
+            api_name=MCP_API_NAME,
+        )
+        return result[0]
+
+    return result_cache.get_or_load(
+        "mcp_search", key, shared_loader("mcp_search", key, _load, MCP_RESULT_CACHE_TTL), MCP_RESULT_CACHE_TTL)
+
+def stats() -> dict:
+    return {"clients": client_pool.stats(), "cache": result_cache.stats().get("mcp_search", {}), "cached_queries": len(result_cache)}
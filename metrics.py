@@ -0,0 +1,199 @@
+# metrics.py
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+from config import SLOW_REQUEST_SECONDS
+
+# 延遲直方圖的桶上界 (秒)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# 不在任何請求追蹤範圍內 (例如背景輪詢) 的 span 所使用的 command 標籤
+NO_COMMAND = "none"
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, value: float = 1, **labels) -> None:
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = dict(self._values)
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in sorted(values.items())]
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series = {}  # labels -> [各桶計數..., sum, count]
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list[str]:
+        with self._lock:
+            snapshot = {k: list(v) for k, v in self._series.items()}
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets, series):
+                cumulative += n
+                le = _labels(self.labelnames, key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            le = _labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(series[-2])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+# ------------------------------------------------------------------------------
+# 內建的指標
+# ------------------------------------------------------------------------------
+request_duration = Histogram(
+    "linebot_request_duration_seconds", "End-to-end time to handle one webhook event, by command.", ("command",))
+stage_duration = Histogram(
+    "linebot_stage_duration_seconds", "Time spent in each processing stage, by command.", ("stage", "command"))
+stage_errors = Counter(
+    "linebot_stage_errors_total", "Exceptions raised inside a processing stage.", ("stage", "command"))
+upstream_requests = Counter(
+    "linebot_upstream_requests_total", "HTTP requests to upstream APIs by outcome (ok, client_error, server_error, error).",
+    ("upstream", "outcome"))
+slow_requests = Counter(
+    "linebot_slow_requests_total", "Webhook events slower than SLOW_REQUEST_SECONDS.", ("command",))
+
+_metrics = [request_duration, stage_duration, stage_errors, upstream_requests, slow_requests]
+_collectors = []
+
+def register(metric):
+    """加入其他模組定義的 Counter / Histogram，一併由 /metrics 輸出。"""
+    _metrics.append(metric)
+    return metric
+
+def register_collector(fn: Callable[[], list]) -> None:
+    """
+    註冊在輸出時才計算的指標 (例如佇列深度、快取統計)。
+    fn 回傳 [(名稱, 類型, 說明, [(labels dict, 數值), ...]), ...]。
+    """
+    _collectors.append(fn)
+
+def render() -> str:
+    """以 Prometheus 文字格式 (0.0.4) 輸出所有指標。"""
+    lines = []
+    for metric in _metrics:
+        lines += metric.render()
+    for fn in _collectors:
+        try:
+            families = fn()
+        except Exception as e:
+            print(f"收集指標失敗: {e}")
+            continue
+        for name, kind, help, samples in families:
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+            for labels, value in samples:
+                if value is None:
+                    continue
+                names = tuple(labels)
+                lines.append(f"{name}{_labels(names, tuple(labels[n] for n in names))} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+# ------------------------------------------------------------------------------
+# 追蹤範圍 (trace) 與階段 (span)
+# ------------------------------------------------------------------------------
+class Trace:
+    """一則 webhook 事件的處理過程：所屬指令，以及依序完成的各階段耗時。"""
+    __slots__ = ("command", "started", "spans")
+
+    def __init__(self):
+        self.command = None
+        self.started = time.perf_counter()
+        self.spans = []
+
+_current = contextvars.ContextVar("metrics_trace", default=None)
+
+def current_command() -> str:
+    t = _current.get()
+    return (t.command if t is not None else None) or NO_COMMAND
+
+def set_command(command: str) -> None:
+    """標記目前處理中的指令 (只記錄第一次判定的結果)。"""
+    t = _current.get()
+    if t is not None and not t.command:
+        t.command = command
+
+@contextmanager
+def trace():
+    """包住一則事件的完整處理；結束時記錄總耗時，超過 SLOW_REQUEST_SECONDS 時印出各階段的耗時。"""
+    t = Trace()
+    token = _current.set(t)
+    try:
+        yield t
+    finally:
+        _current.reset(token)
+        elapsed = time.perf_counter() - t.started
+        command = t.command or NO_COMMAND
+        request_duration.observe(elapsed, command=command)
+        if SLOW_REQUEST_SECONDS and elapsed >= SLOW_REQUEST_SECONDS:
+            slow_requests.inc(command=command)
+            breakdown = ", ".join(f"{stage}={d:.3f}s" for stage, d in t.spans)
+            print(f"--- 慢請求 {elapsed:.3f}s (指令 {command})：{breakdown} ---")
+
+@contextmanager
+def span(stage: str):
+    """記錄一個處理階段的耗時；發生例外時累計錯誤次數後照常拋出。"""
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        stage_errors.inc(stage=stage, command=current_command())
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_duration.observe(elapsed, stage=stage, command=current_command())
+        t = _current.get()
+        if t is not None:
+            t.spans.append((stage, elapsed))
+
+def record_upstream(upstream: str, status: int | None) -> None:
+    """依 HTTP 狀態碼累計上游請求結果；status 為 None 表示連線失敗或逾時。"""
+    if status is None:
+        outcome = "error"
+    elif status >= 500:
+        outcome = "server_error"
+    elif status >= 400:
+        outcome = "client_error"
+    else:
+        outcome = "ok"
+    upstream_requests.inc(upstream=upstream, outcome=outcome)
@@ -1,44 +1,138 @@
 # plotting_service.py
+import hashlib
+import multiprocessing
 import os
-import uuid
-import pandas as pd
-import matplotlib
-matplotlib.use("Agg")  # 使用非互動式後端
-import matplotlib.pyplot as plt
-from matplotlib.colors import Normalize
-import matplotlib.cm as cm
-from config import STATIC_DIR, CURRENT_YEAR
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from config import CURRENT_YEAR, MAP_RENDER_WORKERS, MAP_RENDER_TIMEOUT
+from asset_store import asset_store
+import metrics
+import resilience
+import shared_cache
+from quake_models import QuakeBatch
 
 # Note: The setup_chinese_font function is no longer needed as all text will be in English.
 
-def create_and_save_map(df: pd.DataFrame) -> str:
-    """Create an earthquake map, save the image, and return the filename."""
-    # The call to setup_chinese_font() has been removed.
-    fig, ax = plt.subplots(figsize=(9, 6), dpi=150)
-    ax.set_xlim(118.5, 123.5)
-    ax.set_ylim(20.5, 26.8)
-    ax.set_xlabel("Longitude (°E)")
-    ax.set_ylabel("Latitude (°N)")
-    
+# Fixed color scale so the basemap and colorbar can be drawn once per worker process.
+MAG_VMIN, MAG_VMAX = 4.5, 7.5
+
+# ------------------------------------------------------------------------------
+# Worker process side (matplotlib is only imported inside the render processes)
+# ------------------------------------------------------------------------------
+_fig = None
+_ax = None
+_cmap = None
+_norm = None
+
+def _init_worker() -> None:
+    """Build the static figure (axes, grid, colorbar) once per render process."""
+    global _fig, _ax, _cmap, _norm
+    os.environ.setdefault("MPLCONFIGDIR", "/tmp/matplotlib")
+    import matplotlib
+    matplotlib.use("Agg")  # 使用非互動式後端
+    import matplotlib.pyplot as plt
+    from matplotlib.colors import Normalize
+    import matplotlib.cm as cm
+
+    _fig, _ax = plt.subplots(figsize=(9, 6), dpi=150)
+    _ax.set_xlim(118.5, 123.5)
+    _ax.set_ylim(20.5, 26.8)
+    _ax.set_xlabel("Longitude (°E)")
+    _ax.set_ylabel("Latitude (°N)")
+    _ax.grid(True, linestyle="--", linewidth=0.5, alpha=0.4)
+
+    _norm = Normalize(vmin=MAG_VMIN, vmax=MAG_VMAX)
+    _cmap = matplotlib.colormaps["YlOrRd"]
+    _fig.colorbar(cm.ScalarMappable(norm=_norm, cmap=_cmap), ax=_ax, pad=0.02).set_label("Magnitude")
     # [MODIFIED] The title has been changed to English.
-    ax.set_title(f"Significant Earthquakes (M≥5.0) in Taiwan Area This Year ({CURRENT_YEAR}) — UTC")
-    
-    ax.grid(True, linestyle="--", linewidth=0.5, alpha=0.4)
-
-    mags = df["magnitude"].astype(float).clip(lower=0)
-    norm = Normalize(vmin=max(4.5, mags.min()), vmax=max(6.5, mags.max()))
-    cmap = cm.get_cmap("YlOrRd")
-    colors = cmap(norm(mags.values))
-    sizes = 15 + (mags - mags.min()) * 25
-
-    ax.scatter(df["longitude"].values, df["latitude"].values,
-               s=sizes, c=colors, edgecolor="k", linewidths=0.4, alpha=0.9)
-
-    fig.colorbar(cm.ScalarMappable(norm=norm, cmap=cmap), ax=ax, pad=0.02).set_label("Magnitude")
-
-    filename = f"map_{uuid.uuid4().hex}.png"
-    filepath = os.path.join(STATIC_DIR, filename)
-    fig.tight_layout()
-    fig.savefig(filepath)
-    plt.close(fig)
+    _ax.set_title(f"Significant Earthquakes (M≥5.0) in Taiwan Area This Year ({CURRENT_YEAR}) — UTC")
+    _fig.tight_layout()
+
+def _render_png(lons: list, lats: list, mags: list, title: str) -> bytes:
+    """Draw only the scatter layer on the prepared figure and return PNG bytes."""
+    import io
+    import numpy as np
+    if _fig is None:
+        _init_worker()
+    mags = np.clip(np.asarray(mags, dtype=float), 0, None)
+    sizes = 15 + (mags - MAG_VMIN).clip(min=0) * 25
+    _ax.set_title(title)
+    layer = _ax.scatter(lons, lats, s=sizes, c=_cmap(_norm(mags)),
+                        edgecolor="k", linewidths=0.4, alpha=0.9)
+    try:
+        buf = io.BytesIO()
+        _fig.savefig(buf, format="png")
+        return buf.getvalue()
+    finally:
+        layer.remove()
+
+# ------------------------------------------------------------------------------
+# Web process side
+# ------------------------------------------------------------------------------
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_inflight = {}
+_stats = {"renders": 0, "reused": 0}
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            # spawn avoids inheriting the web worker's threads and locks
+            _executor = ProcessPoolExecutor(
+                max_workers=MAP_RENDER_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+            _executor_pid = os.getpid()
+        return _executor
+
+def _event_set_key(lons: list, lats: list, mags: list, title: str) -> str:
+    """Hash of the (sorted) event set and title, used as a content address for the PNG."""
+    events = sorted(zip((round(x, 4) for x in lons), (round(y, 4) for y in lats), (round(m, 2) for m in mags)))
+    return hashlib.sha256(repr((title, events)).encode()).hexdigest()[:24]
+
+def create_and_save_map(quakes: QuakeBatch) -> str:
+    """Render the earthquake map off the request thread (or reuse an identical one) and return the filename."""
+    lons = quakes.longitude.tolist()
+    lats = quakes.latitude.tolist()
+    mags = quakes.magnitude.tolist()
+    title = f"Significant Earthquakes (M≥5.0) in Taiwan Area This Year ({CURRENT_YEAR}) — UTC"
+    filename = f"map_{_event_set_key(lons, lats, mags, title)}.png"
+    if asset_store.exists(filename):
+        _stats["reused"] += 1
+        return filename
+
+    with _executor_lock:
+        done = _inflight.get(filename)
+        owner = done is None
+        if owner:
+            done = _inflight[filename] = Future()
+    if not owner:
+        # Another thread is rendering the same event set; wait for its file (within the request deadline).
+        done.result(timeout=resilience.timeout(MAP_RENDER_TIMEOUT))
+        _stats["reused"] += 1
+        return filename
+
+    def _render() -> None:
+        with metrics.span("render_map"):
+            future = _get_executor().submit(_render_png, lons, lats, mags, title)
+            png = future.result(timeout=resilience.timeout(MAP_RENDER_TIMEOUT))
+        asset_store.put(png, name=filename)
+
+    try:
+        # STATIC_DIR 由所有 worker 共用；其他行程正在繪製同一張圖時等待它寫入檔案
+        rendered = shared_cache.single_flight(f"map:{filename}", _render, lambda: asset_store.exists(filename))
+        _stats["renders" if rendered else "reused"] += 1
+        done.set_result(filename)
+    except BaseException as e:
+        done.set_exception(e)
+        raise
+    finally:
+        with _executor_lock:
+            _inflight.pop(filename, None)
     return filename
+
+def stats() -> dict:
+    return dict(_stats)
@@ -0,0 +1,127 @@
+# quake_index.py
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+import catalog_store
+from config import (
+    CATALOG_MIN_LATITUDE, CATALOG_MAX_LATITUDE, CATALOG_MIN_LONGITUDE, CATALOG_MAX_LONGITUDE,
+    CATALOG_MIN_MAGNITUDE, CATALOG_START_TIME,
+)
+
+TAIPEI_TZ = timezone(timedelta(hours=8))
+
+# 對齊 MCP 伺服器回傳資料表的欄位，讓 Gemini 不論哪個後端都拿到相同格式
+RESULT_HEADERS = ["date", "time", "latitude", "longitude", "depth", "ML"]
+
+# 兩次檢查目錄版本之間的最短間隔 (秒)
+VERSION_CHECK_INTERVAL = 5.0
+
+class QuakeIndex:
+    """
+    本地地震目錄的記憶體索引。
+    事件依時間排序存成 NumPy 陣列，時間範圍以二分搜尋定位，
+    規模、深度與經緯度條件則以向量化遮罩一次過濾。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0.0
+        # (time_ms, latitude, longitude, depth, magnitude)；整組替換，查詢時不會看到重建到一半的資料
+        self._arrays = (np.empty(0, dtype=np.int64), np.empty(0), np.empty(0), np.empty(0), np.empty(0))
+
+    def refresh(self, force: bool = False) -> None:
+        """目錄內容有變動時重建索引。"""
+        now = time.monotonic()
+        if not force and now - self._checked_at < VERSION_CHECK_INTERVAL:
+            return
+        with self._lock:
+            self._checked_at = now
+            version = catalog_store.version()
+            if version == self._version and not force:
+                return
+            rows = catalog_store.query_events(newest_first=False)
+            n = len(rows)
+            self._arrays = (
+                np.fromiter((r["time_ms"] for r in rows), dtype=np.int64, count=n),
+                np.fromiter((r["latitude"] for r in rows), dtype=float, count=n),
+                np.fromiter((r["longitude"] for r in rows), dtype=float, count=n),
+                np.array([np.nan if r["depth"] is None else r["depth"] for r in rows], dtype=float),
+                np.array([np.nan if r["magnitude"] is None else r["magnitude"] for r in rows], dtype=float),
+            )
+            self._version = version
+
+    def __len__(self) -> int:
+        return len(self._arrays[0])
+
+    def search(self, start_ms: int, end_ms: int, min_magnitude: float, max_magnitude: float,
+               min_depth: float, max_depth: float,
+               min_latitude: float, max_latitude: float,
+               min_longitude: float, max_longitude: float) -> list[list]:
+        """回傳符合條件、與 RESULT_HEADERS 對應的資料列 (依時間由舊到新，時間為台灣時間)。"""
+        time_ms, latitude, longitude, depth, magnitude = self._arrays
+        lo = np.searchsorted(time_ms, start_ms, side="left")
+        hi = np.searchsorted(time_ms, end_ms, side="right")
+        mag, dep, lat, lon = magnitude[lo:hi], depth[lo:hi], latitude[lo:hi], longitude[lo:hi]
+        mask = (
+            (mag >= min_magnitude) & (mag <= max_magnitude)
+            & (dep >= min_depth) & (dep <= max_depth)
+            & (lat >= min_latitude) & (lat <= max_latitude)
+            & (lon >= min_longitude) & (lon <= max_longitude)
+        )
+        result = []
+        for i in np.nonzero(mask)[0] + lo:
+            t = datetime.fromtimestamp(time_ms[i] / 1000, tz=TAIPEI_TZ)
+            result.append([
+                t.strftime("%Y-%m-%d"), t.strftime("%H:%M:%S"),
+                round(float(latitude[i]), 4), round(float(longitude[i]), 4),
+                round(float(depth[i]), 1), round(float(magnitude[i]), 1),
+            ])
+        return result
+
+
+quake_index = QuakeIndex()
+
+def _local_range_ms(start_date: str, end_date: str) -> tuple[int, int]:
+    """將 'YYYY-MM-DD' 日期 (台灣時間，含起訖當日) 轉換為毫秒時間戳範圍。"""
+    start = datetime.strptime(start_date, "%Y-%m-%d").replace(tzinfo=TAIPEI_TZ)
+    end = datetime.strptime(end_date, "%Y-%m-%d").replace(tzinfo=TAIPEI_TZ) + timedelta(days=1)
+    return int(start.timestamp() * 1000), int(end.timestamp() * 1000) - 1
+
+def covers(start_date: str, end_date: str, min_magnitude: float,
+           min_latitude: float, max_latitude: float,
+           min_longitude: float, max_longitude: float) -> bool:
+    """判斷本地目錄是否完整涵蓋查詢的時間、規模與區域。"""
+    if min_magnitude < CATALOG_MIN_MAGNITUDE:
+        return False
+    if not (min_latitude >= CATALOG_MIN_LATITUDE and max_latitude <= CATALOG_MAX_LATITUDE
+            and min_longitude >= CATALOG_MIN_LONGITUDE and max_longitude <= CATALOG_MAX_LONGITUDE):
+        return False
+    start_ms, end_ms = _local_range_ms(start_date, end_date)
+    catalog_start_ms, _ = _local_range_ms(CATALOG_START_TIME, CATALOG_START_TIME)
+    synced_at = catalog_store.last_sync_at()
+    if synced_at is None or start_ms < catalog_start_ms:
+        return False
+    # 結束日期為今天 (或之後) 時視為「查到最新」，以最近一次同步的資料回答
+    ends_today = datetime.strptime(end_date, "%Y-%m-%d").date() >= datetime.now(TAIPEI_TZ).date()
+    return end_ms <= synced_at * 1000 or ends_today
+
+def search_local(start_date: str, end_date: str,
+                 min_magnitude: float, max_magnitude: float,
+                 min_depth: float, max_depth: float,
+                 min_latitude: float, max_latitude: float,
+                 min_longitude: float, max_longitude: float) -> dict:
+    """
+    以本地索引回答地震搜尋，回傳與 MCP 資料表相同的 {"headers", "data"} 結構。
+    呼叫前應先以 covers() 確認本地資料涵蓋查詢範圍。
+    """
+    quake_index.refresh()
+    start_ms, end_ms = _local_range_ms(start_date, end_date)
+    data = quake_index.search(
+        start_ms, end_ms, min_magnitude, max_magnitude, min_depth, max_depth,
+        min_latitude, max_latitude, min_longitude, max_longitude,
+    )
+    return {"headers": RESULT_HEADERS, "data": data}
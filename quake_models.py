@@ -0,0 +1,116 @@
+# quake_models.py
+import math
+from array import array
+from dataclasses import dataclass, fields
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Iterable, Iterator
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+@dataclass(slots=True)
+class Quake:
+    """單一地震事件 (取代只有幾筆資料的 DataFrame 列)；未知的數值為 None。"""
+    time: datetime | None
+    latitude: float | None
+    longitude: float | None
+    depth: float | None
+    magnitude: float | None
+    place: str = ""
+    url: str = ""
+    id: str = ""
+    image_url: str = ""
+
+    @classmethod
+    def from_usgs_feature(cls, feature: dict) -> "Quake":
+        """由 USGS GeoJSON 的單一 feature 建立。"""
+        p = feature["properties"]
+        lon, lat, *rest = feature["geometry"]["coordinates"]
+        return cls(
+            time=datetime.fromtimestamp(p["time"] / 1000, tz=timezone.utc),
+            latitude=lat, longitude=lon, depth=rest[0] if rest else None,
+            magnitude=p.get("mag"), place=p.get("place") or "", url=p.get("url") or "",
+            id=str(feature.get("id") or ""),
+        )
+
+    @classmethod
+    def from_catalog_row(cls, row) -> "Quake":
+        """由 catalog_store.query_events 回傳的資料列建立。"""
+        return cls(
+            time=datetime.fromtimestamp(row["time_ms"] / 1000, tz=timezone.utc),
+            latitude=row["latitude"], longitude=row["longitude"], depth=row["depth"],
+            magnitude=row["magnitude"], place=row["place"] or "", url=row["url"] or "", id=row["id"],
+        )
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in QUAKE_FIELDS}
+
+QUAKE_FIELDS = tuple(f.name for f in fields(Quake))
+
+def _num(x) -> float:
+    return math.nan if x is None else float(x)
+
+def _opt(x: float) -> float | None:
+    return None if math.isnan(x) else x
+
+class QuakeBatch:
+    """
+    以欄位陣列 (array.array) 儲存的地震事件集合，供地圖繪製等大量資料的路徑使用。
+    數值欄位以 NaN 表示未知，時間以 UTC 毫秒儲存；逐筆存取時還原為 Quake。
+    """
+    __slots__ = ("time_ms", "latitude", "longitude", "depth", "magnitude", "place", "url", "id")
+
+    def __init__(self):
+        self.time_ms = array("d")
+        self.latitude = array("d")
+        self.longitude = array("d")
+        self.depth = array("d")
+        self.magnitude = array("d")
+        self.place = []
+        self.url = []
+        self.id = []
+
+    @classmethod
+    def from_quakes(cls, quakes: Iterable[Quake]) -> "QuakeBatch":
+        batch = cls()
+        for q in quakes:
+            batch.append(q)
+        return batch
+
+    def append(self, q: Quake) -> None:
+        self.time_ms.append(math.nan if q.time is None else q.time.timestamp() * 1000)
+        self.latitude.append(_num(q.latitude))
+        self.longitude.append(_num(q.longitude))
+        self.depth.append(_num(q.depth))
+        self.magnitude.append(_num(q.magnitude))
+        self.place.append(q.place)
+        self.url.append(q.url)
+        self.id.append(q.id)
+
+    def __len__(self) -> int:
+        return len(self.time_ms)
+
+    def __getitem__(self, i: int) -> Quake:
+        t = self.time_ms[i]
+        return Quake(
+            time=None if math.isnan(t) else datetime.fromtimestamp(t / 1000, tz=timezone.utc),
+            latitude=_opt(self.latitude[i]), longitude=_opt(self.longitude[i]),
+            depth=_opt(self.depth[i]), magnitude=_opt(self.magnitude[i]),
+            place=self.place[i], url=self.url[i], id=self.id[i],
+        )
+
+    def __iter__(self) -> Iterator[Quake]:
+        return (self[i] for i in range(len(self)))
+
+    def head(self, n: int) -> list[Quake]:
+        return [self[i] for i in range(min(n, len(self)))]
+
+    def to_pandas(self) -> "pd.DataFrame":
+        """匯出為 pandas DataFrame (欄位與舊版 fetch_taiwan_df_this_year 相同，另含 depth 與 id)。"""
+        import pandas as pd
+        return pd.DataFrame({
+            "latitude": self.latitude, "longitude": self.longitude, "magnitude": self.magnitude,
+            "place": self.place,
+            "time_utc": pd.to_datetime(pd.Series(self.time_ms, dtype="float64"), unit="ms", utc=True),
+            "url": self.url, "depth": self.depth, "id": self.id,
+        })
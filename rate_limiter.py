@@ -0,0 +1,171 @@
+# rate_limiter.py
+"""
+依使用者限制昂貴請求的頻率，避免單一使用者連續送出 AI 問題而佔滿 worker：
+
+- RateLimiter：每位使用者、每種費用類別 ("cheap" / "ai") 各一個 token bucket。
+- Coalescer：同一位使用者在相同請求仍在處理時再次送出，等待並共用進行中的結果，不重複執行。
+
+兩者的狀態都只在行程內 (每個 worker 各自計算)。
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Awaitable, Callable, Hashable
+
+import metrics
+import resilience
+from config import (
+    RATE_LIMIT_ENABLED, RATE_LIMIT_CHEAP_BURST, RATE_LIMIT_CHEAP_PER_MINUTE,
+    RATE_LIMIT_AI_BURST, RATE_LIMIT_AI_PER_MINUTE, RATE_LIMIT_MAX_USERS,
+)
+
+KINDS = ("cheap", "ai")
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, capacity: float, now: float):
+        self.tokens, self.updated = capacity, now
+
+    def take(self, capacity: float, per_second: float, now: float) -> float:
+        """取用一個 token；成功回傳 0，否則回傳需要再等待的秒數。"""
+        self.tokens = min(capacity, self.tokens + (now - self.updated) * per_second)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / per_second if per_second > 0 else float("inf")
+
+class RateLimiter:
+    """
+    budgets 為 {費用類別: (可連續送出的次數, 每分鐘補充的次數)}；可連續送出的次數為 0 表示該類別不限制。
+    最多保存 max_users 位使用者的 bucket (LRU 淘汰；被淘汰的使用者下次以滿額的 bucket 重新開始)。
+    """
+
+    def __init__(self, budgets: dict[str, tuple[int, float]], max_users: int):
+        self._budgets = {kind: (burst, per_minute / 60) for kind, (burst, per_minute) in budgets.items()}
+        self._max_users = max(1, max_users)
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+        self._stats = defaultdict(int)
+
+    def acquire(self, user_id: str, kind: str) -> float:
+        """嘗試為使用者取用一次 kind 類別的額度；成功回傳 0，被限制時回傳建議等待的秒數。"""
+        capacity, per_second = self._budgets.get(kind, (0, 0.0))
+        if capacity <= 0:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            buckets = self._buckets.get(user_id)
+            if buckets is None:
+                buckets = self._buckets[user_id] = {}
+                while len(self._buckets) > self._max_users:
+                    self._buckets.popitem(last=False)
+            self._buckets.move_to_end(user_id)
+            bucket = buckets.get(kind)
+            if bucket is None:
+                bucket = buckets[kind] = TokenBucket(capacity, now)
+            wait = bucket.take(capacity, per_second, now)
+            self._stats[f"{kind}_rejected" if wait else f"{kind}_allowed"] += 1
+            return wait
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            result = {f"{kind}_{k}": self._stats[f"{kind}_{k}"] for kind in self._budgets for k in ("allowed", "rejected")}
+            result["users"] = len(self._buckets)
+        return result
+
+class Coalescer:
+    """相同 key 的請求在進行中時，後到者等待並取得同一個結果 (或同一個例外)。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._inflight = {}
+        self._async_inflight = {}
+        self._stats = defaultdict(int)
+
+    def _check_pid(self) -> None:
+        # 呼叫端須持有 self._lock；fork 後父行程的進行中請求不會在子行程完成
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._inflight, self._async_inflight = {}, {}
+
+    def run(self, key: Hashable, fn: Callable[[], object]):
+        with self._lock:
+            self._check_pid()
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            self._stats["leaders" if leader else "coalesced"] += 1
+        if not leader:
+            # 等待時間同樣受本次請求的期限限制
+            try:
+                return future.result(timeout=resilience.timeout(None))
+            except FutureTimeoutError as e:
+                # 領頭請求本身拋出的逾時例外原樣傳回；只有仍在進行時才是等待逾時
+                if future.done():
+                    raise
+                with self._lock:
+                    self._stats["deadline_exceeded"] += 1
+                raise resilience.DeadlineExceeded("等待相同請求的結果逾時") from e
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                if self._inflight.get(key) is future:
+                    del self._inflight[key]
+
+    async def run_async(self, key: Hashable, factory: Callable[[], Awaitable]):
+        """run 的非同步版本；進行中的請求以 task 執行，後到者取消等待時不影響該 task。"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._check_pid()
+            task = self._async_inflight.get((loop, key))
+            leader = task is None
+            if leader:
+                task = self._async_inflight[(loop, key)] = loop.create_task(factory())
+                task.add_done_callback(lambda t: self._async_inflight.pop((loop, key), None))
+            self._stats["leaders" if leader else "coalesced"] += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "inflight": len(self._inflight) + len(self._async_inflight)}
+
+limiter = RateLimiter(
+    {"cheap": (RATE_LIMIT_CHEAP_BURST, RATE_LIMIT_CHEAP_PER_MINUTE),
+     "ai": (RATE_LIMIT_AI_BURST, RATE_LIMIT_AI_PER_MINUTE)} if RATE_LIMIT_ENABLED else {},
+    RATE_LIMIT_MAX_USERS,
+)
+coalescer = Coalescer()
+
+def stats() -> dict:
+    return {"enabled": RATE_LIMIT_ENABLED, **limiter.stats(), "coalescing": coalescer.stats()}
+
+def _collect_metrics() -> list:
+    limits, coalescing = limiter.stats(), coalescer.stats()
+    return [
+        ("linebot_rate_limit_requests_total", "counter", "Per-user rate limit decisions by cost class.",
+         [({"kind": kind, "result": result}, limits.get(f"{kind}_{result}", 0))
+          for kind in KINDS for result in ("allowed", "rejected")]),
+        ("linebot_coalesced_requests_total", "counter",
+         "Requests that waited for an identical in-flight request from the same user instead of running again.",
+         [({}, coalescing.get("coalesced", 0))]),
+    ]
+
+metrics.register_collector(_collect_metrics)
@@ -0,0 +1,147 @@
+# report_images.py
+"""
+CWA 地震報告圖 (ReportImageURI) 的代理。
+
+每張報告圖只向 CWA 下載一次，縮小成「原圖」(最長邊 REPORT_IMAGE_MAX_SIDE) 與「預覽圖」
+(最長邊 REPORT_IMAGE_PREVIEW_SIDE) 兩個 JPEG，以地震編號命名存入 asset_store，
+再由 /static 路由提供給 LINE 用戶端；CWA 的流量因此不會隨使用者人數增加。
+"""
+import hashlib
+import io
+import re
+import threading
+import time
+from concurrent.futures import Future
+
+import http_client
+import metrics
+import resilience
+import shared_cache
+from asset_store import asset_store
+from config import (
+    REPORT_IMAGE_PROXY_ENABLED, REPORT_IMAGE_MAX_SIDE, REPORT_IMAGE_PREVIEW_SIDE, REPORT_IMAGE_JPEG_QUALITY,
+    REPORT_IMAGE_TIMEOUT, REPORT_IMAGE_MAX_SOURCE_BYTES, REPORT_IMAGE_FAILURE_TTL,
+)
+
+_lock = threading.Lock()
+_inflight = {}
+# 檔名 -> 可以再次嘗試下載的時間 (time.monotonic())
+_failed_until = {}
+_stats = {"fetched": 0, "reused": 0, "failed": 0, "skipped": 0, "source_bytes": 0, "original_bytes": 0, "preview_bytes": 0}
+
+def _count(**deltas) -> None:
+    with _lock:
+        for name, n in deltas.items():
+            _stats[name] += n
+
+def _names(quake_id: str, image_url: str) -> tuple[str, str]:
+    # 以地震編號命名；附上網址的雜湊，CWA 更換同一地震的報告圖時會產生新的檔名 (舊檔名的內容不變)
+    stem = re.sub(r"[^A-Za-z0-9_-]", "", quake_id or "") or "unknown"
+    digest = hashlib.sha256(image_url.encode()).hexdigest()[:8]
+    return f"report_{stem}_{digest}.jpg", f"report_{stem}_{digest}_preview.jpg"
+
+def _encode(img) -> bytes:
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=REPORT_IMAGE_JPEG_QUALITY, optimize=True, progressive=True)
+    return buf.getvalue()
+
+def shrink(source: bytes) -> tuple[bytes, bytes]:
+    """將報告圖轉為 (原圖, 預覽圖) 的 JPEG；原本就是夠小的 JPEG 時原圖直接沿用。"""
+    from PIL import Image
+    with Image.open(io.BytesIO(source)) as img:
+        fmt, small_enough = img.format, max(img.size) <= REPORT_IMAGE_MAX_SIDE
+        # JPEG 解碼時直接以較低解析度讀取，省下縮圖前的完整解碼
+        img.draft("RGB", (REPORT_IMAGE_MAX_SIDE, REPORT_IMAGE_MAX_SIDE))
+        if img.mode in ("RGBA", "LA", "P"):
+            # 透明區域鋪上白色背景 (JPEG 不支援透明)
+            rgba = img.convert("RGBA")
+            img = Image.new("RGB", rgba.size, "white")
+            img.paste(rgba, mask=rgba.getchannel("A"))
+        else:
+            img = img.convert("RGB")
+        img.thumbnail((REPORT_IMAGE_MAX_SIDE, REPORT_IMAGE_MAX_SIDE), Image.LANCZOS)
+        original = source if fmt == "JPEG" and small_enough else _encode(img)
+        img.thumbnail((REPORT_IMAGE_PREVIEW_SIDE, REPORT_IMAGE_PREVIEW_SIDE), Image.LANCZOS)
+        return original, _encode(img)
+
+def _fetch(image_url: str) -> bytes:
+    # 以串流讀取並在超過上限時立即中止，過大的檔案不會整個下載進記憶體
+    response = http_client.get(image_url, timeout=REPORT_IMAGE_TIMEOUT, stream=True)
+    with response:
+        response.raise_for_status()
+        declared = response.headers.get("Content-Length", "")
+        if declared.isdigit() and int(declared) > REPORT_IMAGE_MAX_SOURCE_BYTES:
+            raise ValueError(f"報告圖過大 ({declared} bytes)")
+        data = bytearray()
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            data += chunk
+            if len(data) > REPORT_IMAGE_MAX_SOURCE_BYTES:
+                raise ValueError(f"報告圖過大 (超過 {REPORT_IMAGE_MAX_SOURCE_BYTES} bytes)")
+        return bytes(data)
+
+def get_report_images(quake_id: str, image_url: str) -> tuple[str, str] | None:
+    """
+    回傳報告圖 (原圖, 預覽圖) 在 STATIC_DIR 中的檔名；第一次請求時下載並縮圖，之後直接沿用。
+    停用或下載、處理失敗時回傳 None，由呼叫端改用 CWA 的原始網址。
+    """
+    if not REPORT_IMAGE_PROXY_ENABLED or not image_url:
+        return None
+    original, preview = _names(quake_id, image_url)
+
+    def _ready() -> bool:
+        return asset_store.exists(original) and asset_store.exists(preview)
+
+    if _ready():
+        _count(reused=1)
+        return original, preview
+
+    with _lock:
+        retry_at = _failed_until.get(original)
+        if retry_at is not None:
+            if time.monotonic() < retry_at:
+                # 最近才失敗過，不再讓每個請求都重新下載 (也避免一直觸發熔斷器)
+                _stats["skipped"] += 1
+                return None
+            del _failed_until[original]
+        done = _inflight.get(original)
+        owner = done is None
+        if owner:
+            done = _inflight[original] = Future()
+    if not owner:
+        # 同一行程的其他執行緒正在處理同一張圖
+        try:
+            done.result(timeout=resilience.timeout(REPORT_IMAGE_TIMEOUT * 2))
+        except Exception:
+            return None
+        _count(reused=1)
+        return original, preview
+
+    def _build() -> None:
+        with metrics.span("report_image"):
+            source = _fetch(image_url)
+            original_data, preview_data = shrink(source)
+        # 預覽圖最後寫入，_ready() 成立時兩個檔案都已完整
+        asset_store.put(original_data, name=original)
+        asset_store.put(preview_data, name=preview)
+        _count(source_bytes=len(source), original_bytes=len(original_data), preview_bytes=len(preview_data))
+
+    try:
+        # STATIC_DIR 由所有 worker 共用；其他行程正在處理同一張圖時等待它寫入檔案
+        built = shared_cache.single_flight(f"report_image:{original}", _build, _ready)
+        _count(**{"fetched" if built else "reused": 1})
+        done.set_result(None)
+        return original, preview
+    except Exception as e:
+        done.set_exception(e)
+        with _lock:
+            _failed_until[original] = time.monotonic() + REPORT_IMAGE_FAILURE_TTL
+            _stats["failed"] += 1
+        print(f"--- 報告圖處理失敗，改用 CWA 原始網址: {e} ---")
+        return None
+    finally:
+        with _lock:
+            _inflight.pop(original, None)
+
+def stats() -> dict:
+    with _lock:
+        return {"enabled": REPORT_IMAGE_PROXY_ENABLED, **_stats}
@@ -0,0 +1,154 @@
+# resilience.py
+"""
+上游呼叫的容錯機制：
+
+- 請求期限：每組 webhook 事件以 request_scope 設定期限 (contextvar，會傳遞到工具執行緒與 asyncio task)，
+  上游呼叫以 timeout() 取得不超過剩餘時間的逾時秒數。
+- 斷路器：同一個上游連續失敗達門檻後，在冷卻時間內直接拋出 CircuitOpenError，不再讓 worker 等到逾時。
+- 備援紀錄：快取以最後一次成功的資料代替錯誤時以 note_fallback 記錄，回覆時據此加上資料可能過時的提示。
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+from config import CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS
+
+class DeadlineExceeded(TimeoutError):
+    """本次請求的期限已到，不再呼叫上游。"""
+
+class CircuitOpenError(ConnectionError):
+    """上游的斷路器為開啟狀態，直接失敗。"""
+
+_deadline = contextvars.ContextVar("deadline", default=None)
+_fallbacks = contextvars.ContextVar("fallbacks", default=None)
+
+@contextmanager
+def request_scope(seconds: float):
+    """設定本次請求的期限 (外層已有較早的期限時沿用)，並收集期間改用舊資料的紀錄。"""
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None:
+        deadline = min(deadline, current)
+    deadline_token, fallbacks_token = _deadline.set(deadline), _fallbacks.set([])
+    try:
+        yield
+    finally:
+        _deadline.reset(deadline_token)
+        _fallbacks.reset(fallbacks_token)
+
+def remaining() -> float | None:
+    """剩餘秒數；不在任何請求範圍內 (例如背景輪詢) 時回傳 None。"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+def timeout(default: float | None) -> float | None:
+    """上游呼叫的逾時秒數：不超過 default 與剩餘期限；期限已到時拋出 DeadlineExceeded。"""
+    left = remaining()
+    if left is None:
+        return default
+    if left <= 0:
+        raise DeadlineExceeded("已超過本次請求的處理期限")
+    return left if default is None else min(default, left)
+
+def note_fallback(name: str, age: float) -> None:
+    fallbacks = _fallbacks.get()
+    if fallbacks is not None:
+        fallbacks.append((name, age))
+
+def fallbacks() -> list[tuple[str, float]]:
+    """本次請求中改用舊資料的 (資料名稱, 資料年齡秒數)。"""
+    return list(_fallbacks.get() or ())
+
+# ------------------------------------------------------------------------------
+# 斷路器
+# ------------------------------------------------------------------------------
+class CircuitBreaker:
+    """
+    closed：正常呼叫，連續失敗 failure_threshold 次後轉為 open。
+    open：reset_seconds 內直接拋出 CircuitOpenError；之後轉為 half_open，只放行一個試探請求，
+    試探成功回到 closed，失敗則重新 open。
+    """
+
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_seconds: float = CIRCUIT_RESET_SECONDS):
+        self.name = name
+        self._threshold = failure_threshold
+        self._reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self.opened = 0
+        self.rejected = 0
+
+    def before(self) -> None:
+        """呼叫上游之前檢查；斷路器開啟 (或試探請求進行中) 時拋出 CircuitOpenError。"""
+        if self._threshold <= 0:
+            return
+        with self._lock:
+            if self._state == "open" and time.monotonic() - self._opened_at >= self._reset_seconds:
+                self._state, self._probing = "half_open", False
+            if self._state == "open" or (self._state == "half_open" and self._probing):
+                self.rejected += 1
+                raise CircuitOpenError(f"{self.name} 暫時無法連線，請稍後再試")
+            if self._state == "half_open":
+                self._probing = True
+
+    def success(self) -> None:
+        with self._lock:
+            self._state, self._failures, self._probing = "closed", 0, False
+
+    def failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._state == "half_open" or (self._state == "closed" and self._failures >= self._threshold > 0):
+                if self._state != "open":
+                    self.opened += 1
+                    print(f"--- {self.name} 連續失敗 {self._failures} 次，開啟斷路器 ---")
+                self._state, self._opened_at = "open", time.monotonic()
+
+    def release(self) -> None:
+        """結果不代表上游健康與否 (例如因請求期限而縮短的逾時)，只釋放試探名額。"""
+        with self._lock:
+            self._probing = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == "open" and time.monotonic() - self._opened_at >= self._reset_seconds:
+                return "half_open"
+            return self._state
+
+    def stats(self) -> dict:
+        return {"state": self.state, "failures": self._failures, "opened": self.opened, "rejected": self.rejected}
+
+_breakers_lock = threading.Lock()
+_breakers = {}
+
+def breaker(name: str) -> CircuitBreaker:
+    """取得上游 (主機名稱，或 "gemini"、"mcp") 的斷路器；每個行程各自統計。"""
+    b = _breakers.get(name)
+    if b is None:
+        with _breakers_lock:
+            b = _breakers.setdefault(name, CircuitBreaker(name))
+    return b
+
+def stats() -> dict:
+    with _breakers_lock:
+        items = list(_breakers.items())
+    return {name: b.stats() for name, b in sorted(items)}
+
+def _collect_metrics() -> list:
+    s = stats()
+    return [
+        ("linebot_circuit_open", "gauge", "Whether the circuit breaker of each upstream is open (1) or half open (0.5).",
+         [({"upstream": name}, {"open": 1, "half_open": 0.5}.get(b["state"], 0)) for name, b in s.items()]),
+        ("linebot_circuit_rejected_total", "counter", "Upstream calls failed fast by an open circuit breaker.",
+         [({"upstream": name}, b["rejected"]) for name, b in s.items()]),
+    ]
+
+metrics.register_collector(_collect_metrics)
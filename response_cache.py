@@ -0,0 +1,234 @@
+# response_cache.py
+import asyncio
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Hashable
+
+from config import FEED_CACHE_TTL, SHARED_CACHE_ENABLED, STALE_FALLBACK_MAX_AGE
+import resilience
+import shared_cache
+from shared_cache import Aged
+
+class TTLCache:
+    """
+    具有 TTL、stale-while-revalidate 與 single-flight 的記憶體快取。
+
+    - 新鮮 (age < ttl)：直接回傳。
+    - 過期但仍在 stale 視窗內：回傳舊值，並在背景觸發一次更新。
+    - 完全過期或不存在：同一個 key 的並行請求只會觸發一次 loader，
+      其餘請求等待同一份結果 (失敗時一起收到例外，且不會寫入快取)。
+    - 設定 maxsize 時，超過上限會淘汰最久未使用 (LRU) 的項目。
+    - loader 回傳 Aged(value, age) 時 (例如取自跨行程快取)，以資料原本的年齡計算是否過期。
+    - 載入失敗 (或等待超過請求期限) 時，若有不超過 STALE_FALLBACK_MAX_AGE 的舊資料，
+      改回傳最後一次成功的資料，並以 resilience.note_fallback 記錄，讓回覆標示資料可能過時。
+    """
+
+    def __init__(self, maxsize: int | None = None):
+        self._lock = threading.Lock()
+        self._maxsize = maxsize
+        self._entries = OrderedDict()    # key -> (value, stored_at)，依使用順序排列
+        self._inflight = {}   # key -> Future
+        self._tasks = set()   # 背景更新的 asyncio.Task (保留參照以免被回收)
+        self._stats = defaultdict(lambda: defaultdict(int))
+
+    def _count(self, feed: str, name: str) -> None:
+        self._stats[feed][name] += 1
+
+    def _begin(self, feed: str, full_key, ttl: float, stale_ttl: float) -> tuple[str, Any]:
+        """
+        呼叫端須持有 self._lock。回傳 (狀態, 值或 Future)：
+        hit (新鮮)、stale (舊值，已有更新進行中)、refresh (舊值，呼叫端須在背景更新)、
+        wait (等待進行中的載入)、load (呼叫端負責載入)。
+        """
+        entry = self._entries.get(full_key)
+        if entry is not None:
+            value, stored_at = entry
+            age = time.monotonic() - stored_at
+            if age < ttl:
+                self._count(feed, "hits")
+                self._entries.move_to_end(full_key)
+                return "hit", value
+            if age < ttl + stale_ttl:
+                self._count(feed, "stale_hits")
+                self._entries.move_to_end(full_key)
+                if full_key in self._inflight:
+                    return "stale", value
+                self._inflight[full_key] = Future()
+                return "refresh", value
+        future = self._inflight.get(full_key)
+        if future is not None:
+            self._count(feed, "coalesced")
+            return "wait", future
+        self._count(feed, "misses")
+        future = self._inflight[full_key] = Future()
+        return "load", future
+
+    def get_or_load(self, feed: str, key: Hashable, loader: Callable[[], Any],
+                    ttl: float, stale_ttl: float = 0) -> Any:
+        full_key = (feed, key)
+        with self._lock:
+            state, result = self._begin(feed, full_key, ttl, stale_ttl)
+        if state in ("hit", "stale"):
+            return result
+        if state == "refresh":
+            threading.Thread(
+                target=self._load, args=(feed, full_key, loader),
+                name=f"cache-refresh-{feed}", daemon=True
+            ).start()
+            return result
+        if state == "load":
+            self._load(feed, full_key, loader)
+        try:
+            return result.result(timeout=_wait_timeout())
+        except Exception:
+            fallback = self._last_good(feed, full_key)
+            if fallback is None:
+                raise
+            return fallback[0]
+
+    async def get_or_load_async(self, feed: str, key: Hashable, loader: Callable[[], Awaitable[Any]],
+                                ttl: float, stale_ttl: float = 0) -> Any:
+        """
+        get_or_load 的非同步版本：loader 為 coroutine 函式。
+        與同步呼叫共用同一份 in-flight 表，因此執行緒與事件迴圈上的相同請求也會合併成一次載入。
+        """
+        full_key = (feed, key)
+        with self._lock:
+            state, result = self._begin(feed, full_key, ttl, stale_ttl)
+        if state in ("hit", "stale"):
+            return result
+        if state == "refresh":
+            task = asyncio.ensure_future(self._load_async(feed, full_key, loader))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            return result
+        if state == "load":
+            await self._load_async(feed, full_key, loader)
+        try:
+            # shield：逾時只放棄等待，不取消其他呼叫端共用的載入
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(result)), _wait_timeout())
+        except Exception:
+            fallback = self._last_good(feed, full_key)
+            if fallback is None:
+                raise
+            return fallback[0]
+
+    def _last_good(self, feed: str, full_key) -> tuple[Any] | None:
+        """載入失敗時可用的最後一次成功資料 (以 1 元素 tuple 包裝，以便區分值為 None 的情況)。"""
+        with self._lock:
+            entry = self._entries.get(full_key)
+            if entry is None:
+                return None
+            value, stored_at = entry
+            age = time.monotonic() - stored_at
+            if age > STALE_FALLBACK_MAX_AGE:
+                return None
+            self._count(feed, "fallbacks")
+        print(f"--- {feed} 無法取得最新資料，改用 {age:.0f} 秒前的資料 ---")
+        resilience.note_fallback(feed, age)
+        return (value,)
+
+    def _load(self, feed: str, full_key, loader: Callable[[], Any]) -> None:
+        try:
+            value = loader()
+        except BaseException as e:
+            self._finish(feed, full_key, error=e)
+            return
+        self._finish(feed, full_key, value)
+
+    async def _load_async(self, feed: str, full_key, loader: Callable[[], Awaitable[Any]]) -> None:
+        try:
+            value = await loader()
+        except BaseException as e:
+            self._finish(feed, full_key, error=e)
+            return
+        self._finish(feed, full_key, value)
+
+    def _finish(self, feed: str, full_key, value: Any = None, error: BaseException | None = None) -> None:
+        value, age = (value.value, value.age) if isinstance(value, Aged) else (value, 0.0)
+        with self._lock:
+            future = self._inflight.pop(full_key)
+            if error is not None:
+                self._count(feed, "load_errors")
+            else:
+                self._count(feed, "loads")
+                self._store(full_key, value, age)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(value)
+
+    def _store(self, full_key, value: Any, age: float = 0.0) -> None:
+        # 呼叫端須持有 self._lock
+        self._entries[full_key] = (value, time.monotonic() - age)
+        self._entries.move_to_end(full_key)
+        if self._maxsize is not None:
+            while len(self._entries) > self._maxsize:
+                evicted_key, _ = self._entries.popitem(last=False)
+                self._count(evicted_key[0], "evictions")
+
+    def put(self, feed: str, key: Hashable, value: Any) -> Any:
+        """直接寫入一筆資料 (例如背景輪詢取得的最新結果)；value 可為 Aged。回傳實際的值。"""
+        value, age = (value.value, value.age) if isinstance(value, Aged) else (value, 0.0)
+        with self._lock:
+            self._count(feed, "puts")
+            self._store((feed, key), value, age)
+        return value
+
+    def invalidate(self, feed: str | None = None) -> None:
+        """清除指定 feed (或全部) 的快取項目。"""
+        with self._lock:
+            for k in [k for k in self._entries if feed is None or k[0] == feed]:
+                del self._entries[k]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {feed: dict(counts) for feed, counts in self._stats.items()}
+
+
+feed_cache = TTLCache()
+
+def _wait_timeout() -> float | None:
+    # 等待其他呼叫端的載入時，最多等到本次請求的期限
+    left = resilience.remaining()
+    return None if left is None else max(0.0, left)
+
+def shared_loader(feed: str, key: Hashable, loader: Callable[[], Any], ttl: float, stale_ttl: float = 0) -> Callable[[], Any]:
+    """啟用跨行程共用快取時，讓 loader 先經過 shared_cache，多個 worker 對同一筆資料只向上游取得一次。"""
+    if not SHARED_CACHE_ENABLED:
+        return loader
+    return lambda: shared_cache.get_or_load(feed, key, loader, ttl, stale_ttl)
+
+def shared_loader_async(feed: str, key: Hashable, loader: Callable[[], Awaitable[Any]],
+                        ttl: float, stale_ttl: float = 0) -> Callable[[], Awaitable[Any]]:
+    if not SHARED_CACHE_ENABLED:
+        return loader
+    return lambda: shared_cache.get_or_load_async(feed, key, loader, ttl, stale_ttl)
+
+def cached_feed(feed: str, key: Hashable, loader: Callable[[], Any], refresh: bool = False) -> Any:
+    """
+    依 config.FEED_CACHE_TTL 的設定，透過共用快取取得上游資料。
+    refresh=True 時略過行程內的快取重新取得 (跨行程快取中仍在 TTL 內的資料視為最新)，並以結果更新快取。
+    """
+    ttl, stale_ttl = FEED_CACHE_TTL.get(feed, (0, 0))
+    if ttl <= 0:
+        return loader()
+    if refresh:
+        return feed_cache.put(feed, key, shared_loader(feed, key, loader, ttl)())
+    return feed_cache.get_or_load(feed, key, shared_loader(feed, key, loader, ttl, stale_ttl), ttl, stale_ttl)
+
+async def cached_feed_async(feed: str, key: Hashable, loader: Callable[[], Awaitable[Any]],
+                            refresh: bool = False) -> Any:
+    """cached_feed 的非同步版本，loader 為 coroutine 函式。"""
+    ttl, stale_ttl = FEED_CACHE_TTL.get(feed, (0, 0))
+    if ttl <= 0:
+        return await loader()
+    if refresh:
+        return feed_cache.put(feed, key, await shared_loader_async(feed, key, loader, ttl)())
+    return await feed_cache.get_or_load_async(
+        feed, key, shared_loader_async(feed, key, loader, ttl, stale_ttl), ttl, stale_ttl)
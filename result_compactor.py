@@ -0,0 +1,137 @@
+# result_compactor.py
+import json
+import threading
+from typing import TYPE_CHECKING
+
+from config import AI_TOOL_RESULT_FULL_ROWS, AI_TOOL_RESULT_TOP_N, AI_TOOL_RESULT_SAMPLE
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# 震源深度分布的區間 (公里)
+DEPTH_BINS = [float("-inf"), 30, 70, 300, float("inf")]
+DEPTH_LABELS = ["<30km", "30-70km", "70-300km", ">=300km"]
+
+# 依欄位名稱辨識各欄位的關鍵字
+COLUMN_KEYWORDS = {
+    "magnitude": ("mag", "ml", "mw", "規模"),
+    "depth": ("depth", "深度"),
+    "date": ("date", "日期"),
+    "time": ("time", "時間"),
+}
+
+# 估計原始大小時最多序列化的資料列數
+SIZE_ESTIMATE_ROWS = 100
+
+_lock = threading.Lock()
+_stats = {"calls": 0, "compacted": 0, "bytes_in": 0, "bytes_out": 0}
+
+def _dumps(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str)
+
+def _estimate_original_bytes(headers: list, data: list) -> int:
+    """
+    原本送出的格式 (每筆一個 dict、indent=2 的 JSON) 的位元組數，只用於統計與記錄。
+    筆數多時只序列化均勻抽樣的 SIZE_ESTIMATE_ROWS 筆再按比例放大，不必為了記錄再完整序列化一次。
+    """
+    if not data:
+        return 2
+    step = -(-len(data) // SIZE_ESTIMATE_ROWS)
+    sample = data[::step]
+    size = len(json.dumps([dict(zip(headers, row)) for row in sample], indent=2, ensure_ascii=False,
+                          default=str).encode())
+    return size if step == 1 else round(size * len(data) / len(sample))
+
+def _find_column(headers: list, kind: str) -> str | None:
+    keywords = COLUMN_KEYWORDS[kind]
+    for h in headers:
+        name = str(h).strip().lower()
+        if name in keywords or any(k in name for k in keywords if len(k) > 2):
+            return h
+    return None
+
+def _event_times(df: "pd.DataFrame", headers: list) -> "pd.Series":
+    import pandas as pd
+    date_col, time_col = _find_column(headers, "date"), _find_column(headers, "time")
+    if date_col is not None and time_col is not None and date_col != time_col:
+        text = df[date_col].astype(str) + " " + df[time_col].astype(str)
+    elif (date_col or time_col) is not None:
+        text = df[date_col or time_col].astype(str)
+    else:
+        return pd.Series(pd.NaT, index=df.index)
+    return pd.to_datetime(text, errors="coerce")
+
+def summarize(dataframe_dict: dict) -> dict:
+    """以向量化的 pandas/NumPy 運算計算地震資料表的摘要統計。"""
+    # pandas/NumPy 只在需要摘要大量結果時才載入
+    import numpy as np
+    import pandas as pd
+
+    headers = dataframe_dict.get("headers", [])
+    df = pd.DataFrame(dataframe_dict.get("data", []), columns=headers)
+    summary = {"count": int(len(df)), "columns": headers}
+
+    mag_col = _find_column(headers, "magnitude")
+    if mag_col is not None:
+        mags = pd.to_numeric(df[mag_col], errors="coerce")
+        summary["magnitude"] = {
+            "max": float(mags.max()), "min": float(mags.min()),
+            "mean": round(float(mags.mean()), 2),
+            "count_by_floor": {f"M{int(k)}": int(v) for k, v in np.floor(mags.dropna()).value_counts().sort_index().items()},
+        }
+        top = df.loc[mags.nlargest(AI_TOOL_RESULT_TOP_N).index]
+        summary["top_by_magnitude"] = top.values.tolist()
+
+    times = _event_times(df, headers)
+    if times.notna().any():
+        summary["time_range"] = [str(times.min()), str(times.max())]
+        monthly = times.dropna().dt.strftime("%Y-%m").value_counts().sort_index()
+        summary["count_by_month"] = {k: int(v) for k, v in monthly.items()}
+
+    depth_col = _find_column(headers, "depth")
+    if depth_col is not None:
+        depths = pd.to_numeric(df[depth_col], errors="coerce")
+        dist = pd.cut(depths, bins=DEPTH_BINS, labels=DEPTH_LABELS, right=False).value_counts().reindex(DEPTH_LABELS)
+        summary["depth"] = {
+            "max": float(depths.max()), "min": float(depths.min()),
+            "distribution": {k: int(v) for k, v in dist.fillna(0).items()},
+        }
+
+    if AI_TOOL_RESULT_SAMPLE > 0 and len(df) > AI_TOOL_RESULT_SAMPLE:
+        order = times.sort_values(kind="stable").index if times.notna().any() else df.index
+        picks = np.linspace(0, len(order) - 1, AI_TOOL_RESULT_SAMPLE).round().astype(int)
+        summary["sample_rows"] = df.loc[order[picks]].values.tolist()
+    return summary
+
+def compact(dataframe_dict: dict) -> str:
+    """
+    將工具結果轉為送給 Gemini 的精簡 JSON (無多餘空白)。
+    筆數不多時送出完整資料；超過 AI_TOOL_RESULT_FULL_ROWS 筆時改送摘要統計、前 N 大事件與少量樣本。
+    """
+    headers = dataframe_dict.get("headers", [])
+    data = dataframe_dict.get("data", [])
+    original_bytes = _estimate_original_bytes(headers, data)
+
+    if len(data) <= AI_TOOL_RESULT_FULL_ROWS:
+        payload = _dumps({"count": len(data), "columns": headers, "rows": data})
+        compacted = False
+    else:
+        payload = _dumps({"summary": summarize(dataframe_dict),
+                          "note": "資料筆數過多，僅提供摘要統計、規模前幾大事件與依時間抽樣的事件。"})
+        compacted = True
+
+    out_bytes = len(payload.encode())
+    # bytes_in 在資料筆數多時為估計值
+    with _lock:
+        _stats["calls"] += 1
+        _stats["compacted"] += int(compacted)
+        _stats["bytes_in"] += original_bytes
+        _stats["bytes_out"] += out_bytes
+    # 以約 3 bytes/token 粗估節省的 token 數 (中文為主的內容)
+    print(f"--- 工具結果 {len(data)} 筆：{original_bytes} → {out_bytes} bytes，"
+          f"節省約 {(original_bytes - out_bytes) // 3} tokens ---")
+    return payload
+
+def stats() -> dict:
+    with _lock:
+        return {**_stats, "bytes_saved": _stats["bytes_in"] - _stats["bytes_out"]}
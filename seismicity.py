@@ -0,0 +1,401 @@
+# seismicity.py
+"""
+台灣區域地震活動統計 (本地 USGS 目錄)。
+
+- SeismicityRollup 以「台灣時間每日 × 規模 (0.1 級距)」的事件數表彙總整個目錄；
+  目錄有異動時只加減新增或修改的事件 (依 updated_ms 增量更新)，有事件被刪除時才整份重建。
+  每日與每月事件數、逐日最大規模、Gutenberg–Richter b 值都由這張表以向量運算求得。
+- 餘震分群採用 Gardner–Knopoff (1974) 時空窗，目錄版本改變時重新計算並快取。
+"""
+import math
+import threading
+import time
+from datetime import date, datetime
+from typing import NamedTuple
+
+import numpy as np
+
+import catalog_store
+from quake_index import TAIPEI_TZ
+from config import (
+    CATALOG_MIN_MAGNITUDE, CATALOG_START_TIME,
+    SEISMICITY_ACTIVITY_MIN_MAGNITUDE, SEISMICITY_ACTIVITY_WINDOW_DAYS, SEISMICITY_BASELINE_YEARS,
+    SEISMICITY_MAINSHOCK_MIN_MAGNITUDE,
+)
+
+MAG_STEP = 0.1
+MAX_MAGNITUDE = 9.5
+NBINS = int(round((MAX_MAGNITUDE - CATALOG_MIN_MAGNITUDE) / MAG_STEP)) + 1
+BIN_MAGNITUDES = np.round(CATALOG_MIN_MAGNITUDE + np.arange(NBINS) * MAG_STEP, 1)
+
+# 兩次檢查目錄版本之間的最短間隔 (秒)
+VERSION_CHECK_INTERVAL = 5.0
+# 擬合 b 值所需的最少事件數 (規模不低於 Mc)
+MIN_FIT_EVENTS = 50
+# 事件數表每次擴充時預留的天數
+GROW_DAYS = 366
+
+DAY_MS = 86_400_000
+_TAIPEI_OFFSET_MS = 8 * 3_600_000
+
+def _day_number(time_ms):
+    """UTC 毫秒 → 台灣時間的日序 (1970-01-01 起算)；可傳入 NumPy 陣列。"""
+    return (time_ms + _TAIPEI_OFFSET_MS) // DAY_MS
+
+def _day_of(d: date) -> int:
+    return d.toordinal() - date(1970, 1, 1).toordinal()
+
+def _date_of(day: int) -> date:
+    return date.fromordinal(day + date(1970, 1, 1).toordinal())
+
+def _today() -> int:
+    return _day_of(datetime.now(TAIPEI_TZ).date())
+
+def _bins(magnitude: np.ndarray) -> np.ndarray:
+    # 四捨五入到 0.1 級距 (不使用 np.rint 的銀行家捨入)
+    return np.clip(np.floor((magnitude - CATALOG_MIN_MAGNITUDE) / MAG_STEP + 0.5), 0, NBINS - 1).astype(np.int64)
+
+def _first_bin(min_magnitude: float) -> int:
+    return max(0, int(math.ceil(round((min_magnitude - CATALOG_MIN_MAGNITUDE) / MAG_STEP, 6))))
+
+FIRST_DAY = _day_of(datetime.strptime(CATALOG_START_TIME[:10], "%Y-%m-%d").date())
+
+class Clusters(NamedTuple):
+    """依時間排序的事件與其所屬主震的索引 (主震與獨立事件指向自己)。"""
+    time_ms: np.ndarray
+    latitude: np.ndarray
+    longitude: np.ndarray
+    magnitude: np.ndarray
+    parent: np.ndarray
+
+class SeismicityRollup:
+    """本地目錄的每日 × 規模事件數表，以及快取的餘震分群結果。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._version = None
+        self._max_updated = -1
+        # 第 i 列為 FIRST_DAY + i 當天各規模級距的事件數；整個陣列替換，查詢時不會看到更新到一半的資料
+        self._counts = np.zeros((0, NBINS), dtype=np.int32)
+        self._events = {}  # id -> (time_ms, latitude, longitude, magnitude)
+        self._clusters = (None, None)
+        self._stats = {"rebuilds": 0, "incremental_updates": 0, "events_applied": 0, "cluster_runs": 0}
+
+    def _apply(self, rows: list[dict]) -> None:
+        """把新增或修改的事件計入事件數表 (修改的事件先扣除舊的計數)。"""
+        if not rows:
+            return
+        old = [self._events.pop(r["id"], None) for r in rows]
+        old = np.array([o for o in old if o is not None and not math.isnan(o[3])], dtype=float).reshape(-1, 4)
+        time_ms = np.fromiter((r["time_ms"] for r in rows), dtype=np.int64, count=len(rows))
+        magnitude = np.array([np.nan if r["magnitude"] is None else r["magnitude"] for r in rows], dtype=float)
+        valid = ~np.isnan(magnitude)
+        days = _day_number(time_ms) - FIRST_DAY
+        valid &= days >= 0
+
+        counts = self._counts
+        needed = int(days[valid].max()) + 1 if valid.any() else 0
+        if needed > len(counts):
+            grown = np.zeros((needed + GROW_DAYS, NBINS), dtype=np.int32)
+            grown[:len(counts)] = counts
+            counts = grown
+        else:
+            counts = counts.copy()
+        if len(old):
+            old_days = _day_number(old[:, 0].astype(np.int64)) - FIRST_DAY
+            keep = old_days >= 0
+            np.subtract.at(counts, (old_days[keep], _bins(old[keep, 3])), 1)
+        np.add.at(counts, (days[valid], _bins(magnitude[valid])), 1)
+        self._counts = counts
+
+        for r, t, m in zip(rows, time_ms.tolist(), magnitude.tolist()):
+            self._events[r["id"]] = (t, r["latitude"], r["longitude"], m)
+            self._max_updated = max(self._max_updated, r["updated_ms"])
+        self._stats["events_applied"] += len(rows)
+
+    def refresh(self, force: bool = False) -> None:
+        """目錄內容有變動時更新事件數表。"""
+        now = time.monotonic()
+        if not force and now - self._checked_at < VERSION_CHECK_INTERVAL:
+            return
+        with self._lock:
+            self._checked_at = now
+            version = catalog_store.version()
+            if version == self._version and not force:
+                return
+            self._apply(catalog_store.changed_since(self._max_updated))
+            self._stats["incremental_updates"] += 1
+            if len(self._events) != version[1]:
+                # 有事件被刪除 (或其他行程同時寫入)：整份重建
+                self._events, self._max_updated = {}, -1
+                self._counts = np.zeros((0, NBINS), dtype=np.int32)
+                self._apply(catalog_store.changed_since(-1))
+                self._stats["rebuilds"] += 1
+            self._version = version
+
+    def rows(self, start_day: int, end_day: int) -> np.ndarray:
+        """[start_day, end_day) 每天各規模級距的事件數 (超出目錄範圍的日子為 0)。"""
+        counts = self._counts
+        result = np.zeros((max(0, end_day - start_day), NBINS), dtype=np.int32)
+        lo, hi = max(start_day - FIRST_DAY, 0), min(end_day - FIRST_DAY, len(counts))
+        if hi > lo:
+            offset = lo - (start_day - FIRST_DAY)
+            result[offset:offset + hi - lo] = counts[lo:hi]
+        return result
+
+    def count(self, start_day: int, end_day: int, min_magnitude: float) -> int:
+        return int(self.rows(start_day, end_day)[:, _first_bin(min_magnitude):].sum())
+
+    def clusters(self) -> Clusters:
+        """目前目錄的餘震分群 (依目錄版本快取)。"""
+        with self._lock:
+            version, result = self._clusters
+            if version == self._version and result is not None:
+                return result
+            events = np.array([e for e in self._events.values() if not math.isnan(e[3])], dtype=float).reshape(-1, 4)
+            events = events[np.argsort(events[:, 0], kind="stable")]
+            time_ms = events[:, 0].astype(np.int64)
+            parent = decluster(time_ms, events[:, 1], events[:, 2], events[:, 3], SEISMICITY_MAINSHOCK_MIN_MAGNITUDE)
+            result = Clusters(time_ms, events[:, 1], events[:, 2], events[:, 3], parent)
+            self._clusters = (self._version, result)
+            self._stats["cluster_runs"] += 1
+            return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "events": len(self._events), "days": len(self._counts)}
+
+rollup = SeismicityRollup()
+
+def _current() -> SeismicityRollup:
+    catalog_store.ensure_synced()
+    rollup.refresh()
+    return rollup
+
+def stats() -> dict:
+    return rollup.stats()
+
+# ------------------------------------------------------------------------------
+# 統計方法
+# ------------------------------------------------------------------------------
+def _above(rows: np.ndarray, min_magnitude: float) -> np.ndarray:
+    """只保留規模不低於 min_magnitude 的級距 (其餘級距的事件數設為 0)。"""
+    result = rows.copy()
+    result[:, :_first_bin(min_magnitude)] = 0
+    return result
+
+def daily_max_magnitude(rows: np.ndarray) -> np.ndarray:
+    """每天的最大規模 (沒有事件的日子為 NaN)。"""
+    present = rows > 0
+    top = NBINS - 1 - np.argmax(present[:, ::-1], axis=1)
+    return np.where(present.any(axis=1), BIN_MAGNITUDES[top], np.nan)
+
+def fit_gutenberg_richter(histogram: np.ndarray) -> dict | None:
+    """
+    以最大曲率法 (+0.2 修正) 估計完整度 Mc，再以 Aki–Utsu 最大概似法求 b 值 (標準差依 Shi & Bolt)。
+    histogram 為各規模級距的事件數；事件不足時回傳 None。
+    """
+    if histogram.sum() < MIN_FIT_EVENTS:
+        return None
+    mc_bin = min(int(np.argmax(histogram)) + 2, NBINS - 1)
+    counts, mags = histogram[mc_bin:].astype(float), BIN_MAGNITUDES[mc_bin:]
+    n = counts.sum()
+    if n < MIN_FIT_EVENTS:
+        return None
+    mean = float((counts * mags).sum() / n)
+    mc = float(BIN_MAGNITUDES[mc_bin])
+    b = math.log10(math.e) / (mean - (mc - MAG_STEP / 2))
+    b_std = 2.3 * b * b * math.sqrt(float((counts * (mags - mean) ** 2).sum()) / (n * (n - 1)))
+    return {"mc": mc, "b": b, "b_std": b_std, "a": math.log10(n) + b * mc, "n": int(n)}
+
+def _gardner_knopoff(magnitude: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Gardner–Knopoff 餘震時空窗：(天數, 公里)。"""
+    km = 10 ** (0.1238 * magnitude + 0.983)
+    days = np.where(magnitude >= 6.5, 10 ** (0.032 * magnitude + 2.7389), 10 ** (0.5409 * magnitude - 0.547))
+    return days, km
+
+def _distance_km(lat1: float, lon1: float, lat2: np.ndarray, lon2: np.ndarray) -> np.ndarray:
+    lat1, lon1, lat2, lon2 = np.radians(lat1), np.radians(lon1), np.radians(lat2), np.radians(lon2)
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0 * np.arcsin(np.sqrt(np.clip(h, 0, 1)))
+
+def decluster(time_ms: np.ndarray, latitude: np.ndarray, longitude: np.ndarray, magnitude: np.ndarray,
+              min_mainshock: float) -> np.ndarray:
+    """
+    簡易的 Gardner–Knopoff 分群 (只看主震之後的時空窗)：由大到小處理規模不低於 min_mainshock 的未分群事件，
+    其時空窗內尚未分群的事件歸為它的餘震。事件須依時間排序；回傳每個事件所屬主震的索引。
+    """
+    n = len(time_ms)
+    parent = np.full(n, -1, dtype=np.int64)
+    days, km = _gardner_knopoff(magnitude)
+    for i in np.argsort(-magnitude, kind="stable"):
+        if magnitude[i] < min_mainshock:
+            break
+        if parent[i] != -1:
+            continue
+        parent[i] = i
+        hi = int(np.searchsorted(time_ms, time_ms[i] + int(days[i] * DAY_MS), side="right"))
+        if hi <= i + 1:
+            continue
+        # 尚未分群的事件規模都不大於目前的主震 (較大者已先處理)
+        j = np.arange(i + 1, hi)
+        j = j[parent[j] == -1]
+        parent[j[_distance_km(latitude[i], longitude[i], latitude[j], longitude[j]) <= km[i]]] = i
+    independent = parent == -1
+    parent[independent] = np.nonzero(independent)[0]
+    return parent
+
+def _poisson_tail(k: int, lam: float, upper: bool) -> float:
+    """Poisson 分布的 P(X ≥ k) (upper) 或 P(X ≤ k)。"""
+    if lam <= 0:
+        return 1.0 if k <= 0 or not upper else 0.0
+    terms = [math.exp(-lam + i * math.log(lam) - math.lgamma(i + 1)) for i in range(k + (0 if upper else 1))]
+    return max(0.0, 1.0 - sum(terms)) if upper else min(1.0, sum(terms))
+
+# ------------------------------------------------------------------------------
+# 回覆文字
+# ------------------------------------------------------------------------------
+def _fmt_date(d: date) -> str:
+    return d.strftime("%Y-%m-%d")
+
+def _same_day_last_year(d: date) -> date:
+    try:
+        return d.replace(year=d.year - 1)
+    except ValueError:  # 2/29
+        return d.replace(year=d.year - 1, day=28)
+
+def _percent_change(now: int, before: int) -> str:
+    if before == 0:
+        return "去年同期無事件" if now else "持平"
+    return f"{(now - before) / before * 100:+.0f}%"
+
+def activity_report(min_magnitude: float = SEISMICITY_ACTIVITY_MIN_MAGNITUDE) -> str:
+    """今年與去年同期的事件數、今年最大規模，以及近期 (去除餘震後) 是否高於過去幾年的平均。"""
+    r = _current()
+    today = datetime.now(TAIPEI_TZ).date()
+    end = _day_of(today) + 1
+    year_start = _day_of(today.replace(month=1, day=1))
+    last_start = _day_of(today.replace(year=today.year - 1, month=1, day=1))
+    last_end = _day_of(_same_day_last_year(today)) + 1
+    this_year, last_year = r.count(year_start, end, min_magnitude), r.count(last_start, last_end, min_magnitude)
+    lines = [
+        f"📊 台灣區域地震活動 (USGS 目錄，M≥{min_magnitude:.1f})",
+        "-" * 20,
+        f"今年 ({today:%m/%d} 止)：{this_year} 次",
+        f"去年同期：{last_year} 次 ({_percent_change(this_year, last_year)})",
+    ]
+    daily_max = daily_max_magnitude(_above(r.rows(year_start, end), min_magnitude))
+    if not np.isnan(daily_max).all():
+        running = np.fmax.accumulate(daily_max)
+        first = int(np.argmax(running == running[-1]))
+        lines.append(f"今年最大規模：M{running[-1]:.1f} ({_fmt_date(_date_of(year_start + first))})")
+
+    window, threshold = SEISMICITY_ACTIVITY_WINDOW_DAYS, SEISMICITY_ACTIVITY_MIN_MAGNITUDE
+    c = r.clusters()
+    independent = c.parent == np.arange(len(c.parent))
+    window_start_ms = (end - window) * DAY_MS - _TAIPEI_OFFSET_MS
+    baseline_start_ms = max(window_start_ms - SEISMICITY_BASELINE_YEARS * 365 * DAY_MS,
+                            FIRST_DAY * DAY_MS - _TAIPEI_OFFSET_MS)
+    big = c.magnitude >= threshold - 1e-9
+    recent = big & (c.time_ms >= window_start_ms)
+    baseline = big & independent & (c.time_ms >= baseline_start_ms) & (c.time_ms < window_start_ms)
+    baseline_windows = (window_start_ms - baseline_start_ms) / (window * DAY_MS)
+    observed = int((recent & independent).sum())
+    lines.append(f"近 {window} 天 (M≥{threshold:.1f})：{int(recent.sum())} 次，去除餘震後 {observed} 次")
+    if baseline_windows >= 1:
+        expected = baseline.sum() / baseline_windows
+        p_high, p_low = _poisson_tail(observed, expected, upper=True), _poisson_tail(observed, expected, upper=False)
+        level = ("偏高", p_high) if p_high < 0.05 else ("偏低", p_low) if p_low < 0.05 else ("在正常範圍內", None)
+        years = baseline_windows * window / 365
+        detail = f" (p={level[1]:.3f})" if level[1] is not None else ""
+        lines.append(f"過去 {years:.0f} 年平均 (去除餘震)：每 {window} 天 {expected:.1f} 次 → 近期活動{level[0]}{detail}")
+    return "\n".join(lines)
+
+def daily_report(min_magnitude: float = CATALOG_MIN_MAGNITUDE, days: int = 14) -> str:
+    """近 N 天每天的事件數、當日最大規模與期間累計最大規模。"""
+    r = _current()
+    end = _today() + 1
+    rows = _above(r.rows(end - days, end), min_magnitude)
+    counts = rows.sum(axis=1)
+    daily_max = daily_max_magnitude(rows)
+    running = np.fmax.accumulate(daily_max)
+    lines = [f"📅 近 {days} 天每日地震數 (台灣區域，M≥{min_magnitude:.1f})", "-" * 20]
+    for i in range(days):
+        day = _date_of(end - days + i)
+        top = f"最大 M{daily_max[i]:.1f}" if not np.isnan(daily_max[i]) else "—"
+        lines.append(f"{day:%m-%d}  {int(counts[i]):>3} 次  {top}")
+    lines.append(f"合計 {int(counts.sum())} 次" + (f"，期間最大 M{running[-1]:.1f}" if not np.isnan(running[-1]) else ""))
+    return "\n".join(lines)
+
+def monthly_report(min_magnitude: float = 5.0, months: int = 12) -> str:
+    """近 N 個月 (含本月) 每月的事件數與最大規模。"""
+    r = _current()
+    today = datetime.now(TAIPEI_TZ).date()
+    first_month = np.datetime64(today.strftime("%Y-%m"), "M") - (months - 1)
+    start, end = _day_of(first_month.astype("datetime64[D]").item()), _day_of(today) + 1
+    rows = _above(r.rows(start, end), min_magnitude)
+    month_of_day = np.arange(start, end).astype("datetime64[D]").astype("datetime64[M]")
+    index = (month_of_day - first_month).astype(np.int64)
+    counts = np.bincount(index, weights=rows.sum(axis=1), minlength=months).astype(int)
+    daily_max = daily_max_magnitude(rows)
+    month_max = np.full(months, np.nan)
+    np.fmax.at(month_max, index, daily_max)
+    scale = max(1, int(counts.max()))
+    lines = [f"🗓️ 近 {months} 個月每月地震數 (台灣區域，M≥{min_magnitude:.1f})", "-" * 20]
+    for i in range(months):
+        bar = "█" * int(round(counts[i] / scale * 10))
+        top = f" (最大 M{month_max[i]:.1f})" if not np.isnan(month_max[i]) else ""
+        lines.append(f"{first_month + i}  {counts[i]:>3} {bar}{top}")
+    return "\n".join(lines)
+
+def b_value_report(years: int = 10) -> str:
+    """近 N 年的規模–頻率分布擬合 (Gutenberg–Richter)，並推算較大地震的年發生率。"""
+    r = _current()
+    end = _today() + 1
+    start = max(end - int(years * 365.25), FIRST_DAY)
+    histogram = r.rows(start, end).sum(axis=0)
+    span_years = (end - start) / 365.25
+    fit = fit_gutenberg_richter(histogram)
+    if fit is None:
+        return f"近 {years} 年的事件數不足 {MIN_FIT_EVENTS} 筆，無法估計 b 值。"
+    lines = [
+        f"📈 台灣區域規模–頻率分析 (近 {span_years:.1f} 年，USGS 目錄)",
+        "-" * 20,
+        f"完整度規模 Mc：{fit['mc']:.1f} (M≥Mc 共 {fit['n']} 筆)",
+        f"b 值：{fit['b']:.2f} ± {fit['b_std']:.2f}　a 值：{fit['a']:.2f}",
+    ]
+    for m in (6.0, 7.0):
+        rate = 10 ** (fit["a"] - fit["b"] * m) / span_years
+        lines.append(f"推估 M≥{m:.0f} 年發生率：{rate:.2f} 次/年 (約每 {1 / rate:.1f} 年一次)")
+    observed = histogram[_first_bin(6.0):].sum()
+    lines.append(f"實際 M≥6 事件：{int(observed)} 次 ({observed / span_years:.2f} 次/年)")
+    return "\n".join(lines)
+
+def aftershock_report(days: int = 365, limit: int = 5) -> str:
+    """近 N 天的主震 (依規模排序) 與其餘震數，以及去除餘震後的事件數。"""
+    c = _current().clusters()
+    start_ms = (_today() + 1 - days) * DAY_MS - _TAIPEI_OFFSET_MS
+    n = len(c.parent)
+    aftershocks = np.bincount(c.parent, minlength=n) - 1
+    largest = np.full(n, np.nan)
+    is_aftershock = c.parent != np.arange(n)
+    np.fmax.at(largest, c.parent[is_aftershock], c.magnitude[is_aftershock])
+    in_window = c.time_ms >= start_ms
+    mainshocks = np.nonzero(in_window & ~is_aftershock & (c.magnitude >= SEISMICITY_MAINSHOCK_MIN_MAGNITUDE))[0]
+    mainshocks = mainshocks[np.argsort(-c.magnitude[mainshocks], kind="stable")][:limit]
+    lines = [
+        f"🔁 近 {days} 天主震與餘震 (Gardner–Knopoff 時空窗，主震 M≥{SEISMICITY_MAINSHOCK_MIN_MAGNITUDE:.1f})",
+        "-" * 20,
+        f"期間事件 {int(in_window.sum())} 筆，其中餘震 {int((in_window & is_aftershock).sum())} 筆，"
+        f"去除餘震後 {int((in_window & ~is_aftershock).sum())} 筆",
+    ]
+    if not len(mainshocks):
+        lines.append("期間沒有符合條件的主震。")
+    for i in mainshocks:
+        t = datetime.fromtimestamp(c.time_ms[i] / 1000, tz=TAIPEI_TZ)
+        top = f"，最大餘震 M{largest[i]:.1f}" if not np.isnan(largest[i]) else ""
+        lines.append(
+            f"• {t:%Y-%m-%d %H:%M} M{c.magnitude[i]:.1f} ({c.latitude[i]:.2f}°N, {c.longitude[i]:.2f}°E)：餘震 {int(aftershocks[i])} 筆{top}"
+        )
+    return "\n".join(lines)
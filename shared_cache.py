@@ -0,0 +1,241 @@
+# shared_cache.py
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Hashable, NamedTuple
+
+from config import SHARED_CACHE_ENABLED, SHARED_CACHE_PATH, SHARED_CACHE_LEASE_SECONDS
+import resilience
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    stored_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    key TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+# 等待其他行程載入時，重新檢查的間隔秒數
+POLL_INTERVAL = 0.05
+# 每寫入幾筆就清除一次完全過期的項目
+PRUNE_EVERY = 200
+
+class Aged(NamedTuple):
+    """資料與其年齡 (秒)；由其他行程先前取得的資料，年齡從當時起算。"""
+    value: Any
+    age: float
+
+_local = threading.local()
+_stats_lock = threading.Lock()
+_stats = defaultdict(int)
+_writes = 0
+
+def _count(name: str) -> None:
+    with _stats_lock:
+        _stats[name] += 1
+
+def _connect() -> sqlite3.Connection:
+    """每個執行緒各自一個連線 (fork 後重新開啟)；交易由 _transaction 明確控制。"""
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.pid != os.getpid():
+        conn = sqlite3.connect(SHARED_CACHE_PATH, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        _local.conn, _local.pid = conn, os.getpid()
+    return conn
+
+@contextmanager
+def _transaction(conn: sqlite3.Connection):
+    # IMMEDIATE：一開始就取得寫入鎖，避免兩個行程同時判定「沒有租約」
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+def _full_key(feed: str, key: Hashable) -> str:
+    return f"{feed}:{json.dumps(key, sort_keys=True, default=str)}"
+
+def _read(full_key: str) -> tuple[Any, float] | None:
+    row = _connect().execute("SELECT value, stored_at FROM entries WHERE key = ?", (full_key,)).fetchone()
+    return (json.loads(row[0]), time.time() - row[1]) if row else None
+
+def _try_lease(full_key: str) -> str | None:
+    """嘗試取得租約並回傳 token；其他行程持有未過期的租約時回傳 None。"""
+    token = uuid.uuid4().hex
+    now = time.time()
+    with _transaction(_connect()) as conn:
+        row = conn.execute("SELECT expires_at FROM leases WHERE key = ?", (full_key,)).fetchone()
+        if row is not None and row[0] > now:
+            return None
+        if row is not None:
+            _count("takeovers")
+        conn.execute("INSERT OR REPLACE INTO leases (key, owner, expires_at) VALUES (?, ?, ?)",
+                     (full_key, token, now + SHARED_CACHE_LEASE_SECONDS))
+    return token
+
+def _release(full_key: str, token: str, payload: str | None = None, keep_for: float = 0) -> None:
+    """釋放租約；payload 不為 None 時同時寫入資料 (同一個交易)。"""
+    global _writes
+    now = time.time()
+    with _transaction(_connect()) as conn:
+        if payload is not None:
+            conn.execute("INSERT OR REPLACE INTO entries (key, value, stored_at, expires_at) VALUES (?, ?, ?, ?)",
+                         (full_key, payload, now, now + keep_for))
+        conn.execute("DELETE FROM leases WHERE key = ? AND owner = ?", (full_key, token))
+        if payload is not None:
+            _writes += 1
+            if _writes % PRUNE_EVERY == 0:
+                conn.execute("DELETE FROM entries WHERE expires_at < ?", (now,))
+
+def _step(full_key: str, ttl: float, stale_ttl: float) -> tuple:
+    """
+    不會阻塞的一步：("value", Aged) 表示可直接使用，("load", token) 表示由呼叫端載入，
+    ("wait", None) 表示其他行程正在載入且沒有可用的舊值。
+    """
+    entry = _read(full_key)
+    if entry is not None and entry[1] < ttl:
+        _count("hits")
+        return "value", Aged(*entry)
+    token = _try_lease(full_key)
+    if token is not None:
+        # 讀取之後、取得租約之前，前一個持有者可能剛寫入結果
+        latest = _read(full_key)
+        if latest is not None and latest[1] < ttl:
+            _release(full_key, token)
+            _count("hits")
+            return "value", Aged(*latest)
+        return "load", token
+    if entry is not None and entry[1] < ttl + stale_ttl:
+        # 其他行程正在更新，先回傳舊值
+        _count("stale_hits")
+        return "value", Aged(*entry)
+    return "wait", None
+
+def _check_deadline() -> None:
+    # 等待其他行程載入時，超過本次請求的期限就放棄 (由呼叫端改用舊資料或回報錯誤)
+    left = resilience.remaining()
+    if left is not None and left <= 0:
+        _count("deadline_exceeded")
+        raise resilience.DeadlineExceeded("等待其他行程載入資料逾時")
+
+def _encode(value: Any) -> str | None:
+    try:
+        return json.dumps(value, ensure_ascii=False)
+    except (TypeError, ValueError):
+        _count("unserializable")
+        return None
+
+def get_or_load(feed: str, key: Hashable, loader: Callable[[], Any], ttl: float, stale_ttl: float = 0) -> Aged:
+    """
+    跨行程的 single-flight 快取 (值須可轉為 JSON)：
+    資料在 ttl 內直接回傳；否則只有取得租約的行程呼叫 loader，其他行程回傳 stale 視窗內的舊值，
+    或等待該行程寫入結果 (租約過期則接手載入)。
+    """
+    full_key = _full_key(feed, key)
+    waited = False
+    while True:
+        state, result = _step(full_key, ttl, stale_ttl)
+        if state == "value":
+            return result
+        if state == "load":
+            try:
+                value = loader()
+            except BaseException:
+                _count("load_errors")
+                _release(full_key, result)
+                raise
+            _count("loads")
+            _release(full_key, result, _encode(value), ttl + stale_ttl)
+            return Aged(value, 0.0)
+        if not waited:
+            _count("waits")
+            waited = True
+        _check_deadline()
+        time.sleep(POLL_INTERVAL)
+
+async def get_or_load_async(feed: str, key: Hashable, loader: Callable[[], Awaitable[Any]],
+                            ttl: float, stale_ttl: float = 0) -> Aged:
+    """get_or_load 的非同步版本；SQLite 操作可能等待其他行程的寫入鎖，因此在執行緒中進行。"""
+    full_key = _full_key(feed, key)
+    waited = False
+    while True:
+        state, result = await asyncio.to_thread(_step, full_key, ttl, stale_ttl)
+        if state == "value":
+            return result
+        if state == "load":
+            try:
+                value = await loader()
+            except BaseException:
+                _count("load_errors")
+                await asyncio.to_thread(_release, full_key, result)
+                raise
+            _count("loads")
+            await asyncio.to_thread(_release, full_key, result, _encode(value), ttl + stale_ttl)
+            return Aged(value, 0.0)
+        if not waited:
+            _count("waits")
+            waited = True
+        _check_deadline()
+        await asyncio.sleep(POLL_INTERVAL)
+
+def single_flight(name: str, fn: Callable[[], Any], ready: Callable[[], bool]) -> bool:
+    """
+    跨行程只讓一個行程執行 fn (例如繪製同一張地圖、同步地震目錄)。
+    其他行程等待到 ready() 為真即返回；回傳值表示 fn 是否由本行程執行。
+    """
+    if not SHARED_CACHE_ENABLED:
+        if ready():
+            return False
+        fn()
+        return True
+    full_key = f"once:{name}"
+    waited = False
+    while True:
+        if ready():
+            return False
+        token = _try_lease(full_key)
+        if token is not None:
+            try:
+                # 取得租約前，前一個持有者可能剛完成
+                if ready():
+                    return False
+                fn()
+                return True
+            finally:
+                _release(full_key, token)
+        if not waited:
+            _count("waits")
+            waited = True
+        time.sleep(POLL_INTERVAL)
+
+def clear() -> None:
+    """清除所有項目與租約 (供測試與手動重設使用)。"""
+    with _transaction(_connect()) as conn:
+        conn.execute("DELETE FROM entries")
+        conn.execute("DELETE FROM leases")
+
+def stats() -> dict:
+    with _stats_lock:
+        result = dict(_stats)
+    if SHARED_CACHE_ENABLED:
+        try:
+            result["entries"] = _connect().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        except sqlite3.Error as e:
+            result["error"] = str(e)
+    return {"enabled": SHARED_CACHE_ENABLED, "path": SHARED_CACHE_PATH, **result}
@@ -0,0 +1,170 @@
+# subscriber_store.py
+import json
+import sqlite3
+import time
+import uuid
+
+from config import SUBSCRIBER_DB_PATH, ALERT_MULTICAST_BATCH_SIZE
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS subscribers (
+    user_id TEXT PRIMARY KEY,
+    subscribed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS deliveries (
+    event_key TEXT PRIMARY KEY,
+    feed TEXT NOT NULL,
+    detected_at REAL NOT NULL,
+    claimed_at REAL NOT NULL,
+    messages TEXT NOT NULL,
+    status TEXT NOT NULL,
+    recipients INTEGER NOT NULL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS delivery_batches (
+    event_key TEXT NOT NULL,
+    batch_no INTEGER NOT NULL,
+    retry_key TEXT NOT NULL,
+    recipients TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    sent_at REAL,
+    PRIMARY KEY (event_key, batch_no)
+);
+CREATE INDEX IF NOT EXISTS idx_deliveries_status ON deliveries (status, claimed_at);
+"""
+
+def connect() -> sqlite3.Connection:
+    """開啟訂閱者資料庫 (WAL 模式，所有 worker 行程共用)。"""
+    conn = sqlite3.connect(SUBSCRIBER_DB_PATH, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+# ------------------------------------------------------------------------------
+# 訂閱者
+# ------------------------------------------------------------------------------
+def subscribe(user_id: str) -> bool:
+    """加入訂閱；回傳 False 表示原本就已訂閱。"""
+    conn = connect()
+    try:
+        with conn:
+            cur = conn.execute("INSERT OR IGNORE INTO subscribers (user_id, subscribed_at) VALUES (?, ?)",
+                               (user_id, time.time()))
+        return cur.rowcount > 0
+    finally:
+        conn.close()
+
+def unsubscribe(user_id: str) -> bool:
+    """取消訂閱；回傳 False 表示原本就未訂閱。"""
+    conn = connect()
+    try:
+        with conn:
+            cur = conn.execute("DELETE FROM subscribers WHERE user_id = ?", (user_id,))
+        return cur.rowcount > 0
+    finally:
+        conn.close()
+
+def is_subscribed(user_id: str) -> bool:
+    conn = connect()
+    try:
+        return conn.execute("SELECT 1 FROM subscribers WHERE user_id = ?", (user_id,)).fetchone() is not None
+    finally:
+        conn.close()
+
+def subscriber_count() -> int:
+    conn = connect()
+    try:
+        return conn.execute("SELECT COUNT(*) FROM subscribers").fetchone()[0]
+    finally:
+        conn.close()
+
+# ------------------------------------------------------------------------------
+# 推播紀錄：每個事件只會被一個行程認領一次，並預先切好批次與各自的 retry key
+# ------------------------------------------------------------------------------
+def claim_delivery(event_key: str, feed: str, messages: list[dict], detected_at: float) -> bool:
+    """
+    認領一個事件的推播並依目前的訂閱者建立批次。
+    事件已被認領過 (本行程或其他 worker、或重啟前) 時回傳 False，藉此保證同一事件不會推播兩次。
+    """
+    conn = connect()
+    try:
+        with conn:
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO deliveries "
+                "(event_key, feed, detected_at, claimed_at, messages, status, recipients) VALUES (?, ?, ?, ?, ?, ?, 0)",
+                (event_key, feed, detected_at, time.time(), json.dumps(messages, ensure_ascii=False), "sending"),
+            )
+            if cur.rowcount == 0:
+                return False
+            users = [row[0] for row in conn.execute("SELECT user_id FROM subscribers ORDER BY subscribed_at")]
+            batches = [users[i:i + ALERT_MULTICAST_BATCH_SIZE] for i in range(0, len(users), ALERT_MULTICAST_BATCH_SIZE)]
+            conn.executemany(
+                "INSERT INTO delivery_batches (event_key, batch_no, retry_key, recipients, status) VALUES (?, ?, ?, ?, ?)",
+                [(event_key, n, str(uuid.uuid4()), json.dumps(batch), "pending") for n, batch in enumerate(batches)],
+            )
+            conn.execute("UPDATE deliveries SET recipients = ? WHERE event_key = ?", (len(users), event_key))
+        return True
+    finally:
+        conn.close()
+
+def reclaim_stalled(older_than: float) -> list[str]:
+    """接手認領後超過 older_than 秒仍未完成的推播 (例如送到一半 worker 重啟)，回傳事件 key。"""
+    now = time.time()
+    conn = connect()
+    try:
+        with conn:
+            keys = [row[0] for row in conn.execute(
+                "SELECT event_key FROM deliveries WHERE status = 'sending' AND claimed_at < ?", (now - older_than,))]
+            conn.executemany("UPDATE deliveries SET claimed_at = ? WHERE event_key = ?", [(now, k) for k in keys])
+        return keys
+    finally:
+        conn.close()
+
+def get_delivery(event_key: str) -> dict | None:
+    conn = connect()
+    try:
+        row = conn.execute("SELECT feed, detected_at, messages, status, recipients FROM deliveries WHERE event_key = ?",
+                           (event_key,)).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    return {"event_key": event_key, "feed": row[0], "detected_at": row[1], "messages": json.loads(row[2]),
+            "status": row[3], "recipients": row[4]}
+
+def pending_batches(event_key: str) -> list[dict]:
+    """尚未成功送出的批次 (已送出的批次在接手時會略過)。"""
+    conn = connect()
+    try:
+        rows = conn.execute(
+            "SELECT batch_no, retry_key, recipients, attempts FROM delivery_batches "
+            "WHERE event_key = ? AND status != 'sent' ORDER BY batch_no", (event_key,)).fetchall()
+    finally:
+        conn.close()
+    return [{"batch_no": r[0], "retry_key": r[1], "recipients": json.loads(r[2]), "attempts": r[3]} for r in rows]
+
+def mark_batch(event_key: str, batch_no: int, status: str, attempts: int) -> None:
+    conn = connect()
+    try:
+        with conn:
+            conn.execute(
+                "UPDATE delivery_batches SET status = ?, attempts = ?, sent_at = ? WHERE event_key = ? AND batch_no = ?",
+                (status, attempts, time.time() if status == "sent" else None, event_key, batch_no))
+    finally:
+        conn.close()
+
+def finish_delivery(event_key: str) -> str:
+    """依各批次結果標記推播完成 (done) 或部分失敗 (failed)，回傳狀態。"""
+    conn = connect()
+    try:
+        with conn:
+            failed = conn.execute("SELECT COUNT(*) FROM delivery_batches WHERE event_key = ? AND status != 'sent'",
+                                  (event_key,)).fetchone()[0]
+            status = "failed" if failed else "done"
+            conn.execute("UPDATE deliveries SET status = ?, finished_at = ? WHERE event_key = ?",
+                         (status, time.time(), event_key))
+        return status
+    finally:
+        conn.close()
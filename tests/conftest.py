@@ -0,0 +1,16 @@
+# tests/conftest.py
+"""
+測試共用設定。config 在匯入時讀取環境變數，因此在任何專案模組匯入前先將資料目錄指向暫存目錄，
+並啟用訂閱指令。
+"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_tmp = tempfile.mkdtemp(prefix="linebot_test_")
+os.environ.setdefault("DATA_DIR", os.path.join(_tmp, "data"))
+os.environ.setdefault("STATIC_DIR", os.path.join(_tmp, "static"))
+os.environ.setdefault("ALERT_FANOUT_ENABLED", "true")
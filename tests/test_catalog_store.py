@@ -0,0 +1,74 @@
+# tests/test_catalog_store.py
+import threading
+
+import pytest
+
+import catalog_store
+import shared_cache
+import usgs_service
+
+def _feature(event_id: str, time_ms: int, updated_ms: int | None = None) -> dict:
+    return {
+        "id": event_id,
+        "properties": {"time": time_ms, "updated": updated_ms or time_ms, "mag": 5.0, "place": "", "url": ""},
+        "geometry": {"coordinates": [121.6, 23.8, 10.0]},
+    }
+
+@pytest.fixture
+def catalog(monkeypatch, tmp_path):
+    # 每個測試使用空的目錄資料庫 (尚未同步過)
+    monkeypatch.setattr(catalog_store, "CATALOG_DB_PATH", str(tmp_path / "catalog.sqlite3"))
+    monkeypatch.setattr(catalog_store, "CATALOG_PAGE_SIZE", 2)
+    monkeypatch.setattr(catalog_store, "_initial_pid", None)
+    shared_cache.clear()
+
+def test_cold_catalog_syncs_in_background(monkeypatch, catalog):
+    release, pages = threading.Event(), []
+
+    def fetch_page(params, offset):
+        release.wait(5)
+        pages.append(offset)
+        return [_feature("a", 1_000)] if offset == 1 else []
+
+    monkeypatch.setattr(catalog_store, "_fetch_page", fetch_page)
+    # 請求執行緒不等待首次完整同步
+    with pytest.raises(catalog_store.CatalogNotReady):
+        catalog_store.ensure_synced()
+    with pytest.raises(catalog_store.CatalogNotReady):
+        catalog_store.ensure_synced()
+    release.set()
+    sync_threads = [t for t in threading.enumerate() if t.name == "catalog-initial-sync"]
+    assert len(sync_threads) == 1
+    sync_threads[0].join(5)
+    assert pages == [1]
+    catalog_store.ensure_synced()
+    assert [e["id"] for e in catalog_store.query_events()] == ["a"]
+
+def test_interrupted_initial_sync_resumes(monkeypatch, catalog):
+    upstream = [_feature("a", 1_000, 5_000), _feature("b", 2_000), _feature("c", 3_000), _feature("d", 4_000)]
+    requests = []
+
+    def fetch_page(params, offset):
+        requests.append((params["starttime"], offset))
+        if len(requests) == 2:
+            raise ConnectionError("interrupted")
+        start = 0 if params["starttime"] == catalog_store.CATALOG_START_TIME else 2_000
+        rows = [f for f in upstream if f["properties"]["time"] >= start]
+        return rows[offset - 1:offset + 1]
+
+    monkeypatch.setattr(catalog_store, "_fetch_page", fetch_page)
+    with pytest.raises(ConnectionError):
+        catalog_store.initial_sync()
+    assert catalog_store.last_sync_at() is None
+    catalog_store.initial_sync()
+    # 第二次從已存入的最新事件時間接續
+    assert requests[2][0] == catalog_store._iso_ms(2_000)
+    assert sorted(e["id"] for e in catalog_store.query_events()) == ["a", "b", "c", "d"]
+    assert catalog_store.version()[0] == "5000"
+
+def test_taiwan_query_uses_api_while_catalog_is_cold(monkeypatch, catalog):
+    monkeypatch.setattr(catalog_store, "start_initial_sync", lambda: None)
+    monkeypatch.setattr(usgs_service, "fetch_taiwan_payload_this_year",
+                        lambda min_mag: {"features": [_feature("api", 1_700_000_000_000)]})
+    result = usgs_service.fetch_taiwan_quakes_this_year(5.0)
+    assert len(result) == 1
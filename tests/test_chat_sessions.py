@@ -0,0 +1,79 @@
+# tests/test_chat_sessions.py
+from types import SimpleNamespace
+
+import pytest
+
+import ai_service
+import chat_sessions
+
+ARGS = {"start_date": "2024-01-01", "end_date": "2024-12-31"}
+
+@pytest.fixture
+def store(monkeypatch):
+    store = chat_sessions.SessionStore(max_users=10, ttl=600, token_budget=10_000)
+    monkeypatch.setattr(chat_sessions, "sessions", store)
+    return store
+
+def test_follow_up_reuses_earlier_tool_result(monkeypatch, store):
+    calls = []
+    monkeypatch.setattr(ai_service, "available_tools", {"search": lambda **args: calls.append(args) or "[]"})
+    monkeypatch.setattr(ai_service, "_function_args", lambda fc: dict(ARGS))
+    session = store.get("U-reuse")
+    fc = SimpleNamespace(name="search")
+
+    _, results = ai_service._run_tool_calls([fc], timeout=5, session=session)
+    store.add_turn(session, "q1", [results], "a1")
+    _, results = ai_service._run_tool_calls([fc], timeout=5, session=session)
+    assert results[0][2] == "[]"
+    assert len(calls) == 1
+    assert store.stats()["tool_reuse"] == 1
+
+def test_history_stays_within_token_budget():
+    store = chat_sessions.SessionStore(max_users=10, ttl=600, token_budget=400)
+    session = store.get("U-budget")
+    for i in range(20):
+        store.add_turn(session, f"問題 {i}", [[("search", ARGS, "地震" * 100, False)]], "回答" * 10)
+    assert session.tokens() <= 400
+    assert session.turns[-1].question == "問題 19"
+    assert session.summary
+
+def test_sessions_are_bounded_by_user_count():
+    store = chat_sessions.SessionStore(max_users=3, ttl=600, token_budget=1000)
+    for i in range(5):
+        store.get(f"U-{i}")
+    assert store.stats()["sessions"] == 3
+
+def test_find_tool_result_skips_failed_results():
+    store = chat_sessions.SessionStore(max_users=10, ttl=600, token_budget=10_000)
+    session = store.get("U-sessions")
+    store.add_turn(session, "q1", [[("search", ARGS, "工具執行逾時，請改用較小的查詢範圍。", True)]], "a1")
+    assert store.find_tool_result(session, "search", ARGS) is None
+    store.add_turn(session, "q2", [[("search", ARGS, "[]", False)]], "a2")
+    assert store.find_tool_result(session, "search", ARGS) == "[]"
+    assert store.find_tool_result(session, "search", {**ARGS, "min_magnitude": 5}) is None
+
+def test_failed_tool_call_is_retried_on_follow_up(monkeypatch, store):
+    calls = []
+
+    def search(**args):
+        calls.append(args)
+        if len(calls) == 1:
+            raise ConnectionError("upstream unavailable")
+        return "[]"
+
+    monkeypatch.setattr(ai_service, "available_tools", {"search": search})
+    monkeypatch.setattr(ai_service, "_function_args", lambda fc: dict(ARGS))
+    session = store.get("U-retry")
+    fc = SimpleNamespace(name="search")
+
+    _, results = ai_service._run_tool_calls([fc], timeout=5, session=session)
+    assert results[0][2].startswith("工具執行失敗") and results[0][3]
+    store.add_turn(session, "q1", [results], "a1")
+
+    _, results = ai_service._run_tool_calls([fc], timeout=5, session=session)
+    assert results[0][2:] == ("[]", False)
+    assert len(calls) == 2
+    store.add_turn(session, "q2", [results], "a2")
+
+    ai_service._run_tool_calls([fc], timeout=5, session=session)
+    assert len(calls) == 2
@@ -0,0 +1,37 @@
+# tests/test_command_handler.py
+import asyncio
+
+import command_handler
+import subscriber_store
+
+def _text(reply: list) -> str:
+    assert len(reply) == 1
+    return reply[0].text
+
+def test_subscribe_and_unsubscribe_through_process_message():
+    user_id = "U-subscription-sync"
+    assert "已訂閱" in _text(command_handler.process_message("訂閱", "https://x", user_id))
+    assert subscriber_store.is_subscribed(user_id)
+    assert "已經訂閱過" in _text(command_handler.process_message("/subscribe", "https://x", user_id))
+    assert "已取消訂閱" in _text(command_handler.process_message("取消訂閱", "https://x", user_id))
+    assert not subscriber_store.is_subscribed(user_id)
+    assert "沒有訂閱" in _text(command_handler.process_message("/unsubscribe", "https://x", user_id))
+
+def test_subscribe_and_unsubscribe_through_process_message_async():
+    user_id = "U-subscription-async"
+    assert "已訂閱" in _text(asyncio.run(command_handler.process_message_async("訂閱", "https://x", user_id)))
+    assert subscriber_store.is_subscribed(user_id)
+    assert "已取消訂閱" in _text(asyncio.run(command_handler.process_message_async("取消訂閱", "https://x", user_id)))
+    assert not subscriber_store.is_subscribed(user_id)
+
+def test_subscription_requires_one_on_one_chat():
+    assert "一對一聊天" in _text(command_handler.process_message("訂閱", "https://x", None))
+
+def test_activity_default_magnitude_follows_config(monkeypatch):
+    import seismicity
+    from config import SEISMICITY_ACTIVITY_MIN_MAGNITUDE
+
+    received = []
+    monkeypatch.setattr(seismicity, "activity_report", lambda m: received.append(m) or "ok")
+    assert _text(command_handler.process_message("地震活動", "https://x", "U-activity")) == "ok"
+    assert received == [SEISMICITY_ACTIVITY_MIN_MAGNITUDE]
@@ -0,0 +1,43 @@
+# tests/test_feed_poller.py
+import pytest
+
+import command_handler
+import feed_poller
+
+FEEDS = {
+    "test_feed": {
+        "fetch": lambda: {"items": [{"id": "q1", "version": 1}]},
+        "items": lambda payload: payload["items"],
+        "id": lambda it: it["id"],
+        "version": lambda it: it["version"],
+        "commands": ("/latest", "/alert"),
+    },
+}
+
+@pytest.fixture
+def rendered(monkeypatch):
+    calls = []
+
+    def build_reply(command, arg, request_base_url, user_id=None):
+        calls.append((command, request_base_url))
+        return [f"{command} {request_base_url}"]
+
+    monkeypatch.setattr(command_handler, "build_reply", build_reply)
+    return calls
+
+def test_snapshots_use_public_base_url(monkeypatch, rendered):
+    monkeypatch.setattr(feed_poller, "PUBLIC_BASE_URL", "https://bot.example")
+    poller = feed_poller.FeedPoller(FEEDS, {})
+    poller.poll_once("test_feed")
+    assert sorted(rendered) == [("/alert", "https://bot.example"), ("/latest", "https://bot.example")]
+    assert poller.get_snapshot("/latest") == ["/latest https://bot.example"]
+
+def test_base_url_commands_not_prerendered_without_public_base_url(monkeypatch, rendered):
+    monkeypatch.setattr(feed_poller, "PUBLIC_BASE_URL", "")
+    poller = feed_poller.FeedPoller(FEEDS, {})
+    poller.poll_once("test_feed")
+    poller.poll_once("test_feed")
+    # 資料未變動時不重新產生，/latest 也不會因為缺少快照而每次重試
+    assert rendered == [("/alert", "")]
+    assert poller.get_snapshot("/latest") is None
+    assert poller.get_snapshot("/alert") == ["/alert "]
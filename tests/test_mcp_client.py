@@ -0,0 +1,54 @@
+# tests/test_mcp_client.py
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import pytest
+
+import mcp_client
+import resilience
+import shared_cache
+
+TAIWAN = (21.0, 26.0, 119.0, 123.0, 0.0, 100.0)
+
+@pytest.fixture
+def remote(monkeypatch):
+    calls = []
+
+    def predict(**kwargs):
+        calls.append(kwargs)
+        return [{"headers": ["time", "magnitude"], "data": [[kwargs["param_0"], kwargs["param_10"]]]}]
+
+    monkeypatch.setattr(mcp_client.client_pool, "predict", predict)
+    mcp_client.result_cache.invalidate()
+    shared_cache.clear()
+    return calls
+
+def test_identical_queries_call_remote_once(remote):
+    first = mcp_client.search("2024-01-01", "2024-12-31", *TAIWAN, 4.5, 8.0)
+    # 日期與數值的寫法不同，正規化後仍是同一個查詢
+    second = mcp_client.search("2024-1-1 ", "2024-12-31", *TAIWAN, "4.50", 8)
+    assert len(remote) == 1
+    assert first == second
+
+def test_different_queries_call_remote_each(remote):
+    mcp_client.search("2024-01-01", "2024-12-31", *TAIWAN, 4.5, 8.0)
+    mcp_client.search("2024-01-01", "2024-12-31", *TAIWAN, 5.0, 8.0)
+    assert len(remote) == 2
+
+def test_predict_timeout_releases_breaker_and_slot(monkeypatch):
+    class Job:
+        def result(self, timeout=None):
+            raise FutureTimeoutError()
+
+    class Client:
+        def submit(self, **kwargs):
+            return Job()
+
+    pool = mcp_client.ClientPool("http://mcp.invalid", 1)
+    monkeypatch.setattr(pool, "_acquire", lambda: pool._slots.acquire() and Client())
+    failures = resilience.breaker("mcp").stats()["failures"]
+    with resilience.request_scope(1), pytest.raises(resilience.DeadlineExceeded):
+        pool.predict(param_0="2024-01-01")
+    assert pool.discarded == 1
+    # 借用的名額已歸還，斷路器也沒有把逾時記為失敗
+    assert pool._slots.acquire(blocking=False)
+    assert resilience.breaker("mcp").stats()["failures"] == failures
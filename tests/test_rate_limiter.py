@@ -0,0 +1,96 @@
+# tests/test_rate_limiter.py
+import asyncio
+import threading
+import time
+
+import pytest
+
+import command_handler
+import rate_limiter
+import resilience
+from config import RATE_LIMIT_AI_BURST
+
+def test_bucket_allows_burst_then_refills(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limiter.time, "monotonic", lambda: now[0])
+    limiter = rate_limiter.RateLimiter({"ai": (2, 6)}, max_users=10)
+    assert limiter.acquire("U1", "ai") == 0
+    assert limiter.acquire("U1", "ai") == 0
+    assert limiter.acquire("U1", "ai") == 10
+    # 其他使用者與其他費用類別各自計算
+    assert limiter.acquire("U2", "ai") == 0
+    assert limiter.acquire("U1", "cheap") == 0
+    now[0] += 10
+    assert limiter.acquire("U1", "ai") == 0
+
+def test_limiter_evicts_least_recent_users():
+    limiter = rate_limiter.RateLimiter({"ai": (1, 1)}, max_users=2)
+    for user_id in ("U1", "U2", "U3"):
+        limiter.acquire(user_id, "ai")
+    assert limiter.stats()["users"] == 2
+    assert limiter.acquire("U1", "ai") == 0
+
+def test_coalescer_shares_in_flight_result():
+    coalescer = rate_limiter.Coalescer()
+    started, release, calls, results = threading.Event(), threading.Event(), [], []
+
+    def work():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "reply"
+
+    leader = threading.Thread(target=lambda: results.append(coalescer.run("k", work)))
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=lambda: results.append(coalescer.run("k", work)))
+    follower.start()
+    time.sleep(0.05)
+    release.set()
+    leader.join()
+    follower.join()
+    assert results == ["reply", "reply"]
+    assert len(calls) == 1
+
+def test_coalesced_wait_is_bounded_by_request_deadline():
+    coalescer = rate_limiter.Coalescer()
+    started, release = threading.Event(), threading.Event()
+
+    def work():
+        started.set()
+        release.wait(5)
+        return "reply"
+
+    leader = threading.Thread(target=lambda: coalescer.run("k", work))
+    leader.start()
+    started.wait(5)
+    try:
+        with resilience.request_scope(0.05), pytest.raises(resilience.DeadlineExceeded):
+            coalescer.run("k", work)
+    finally:
+        release.set()
+        leader.join()
+    assert coalescer.stats()["deadline_exceeded"] == 1
+
+def test_coalescer_run_async_shares_task():
+    coalescer = rate_limiter.Coalescer()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "reply"
+
+    async def main():
+        return await asyncio.gather(coalescer.run_async("k", work), coalescer.run_async("k", work))
+
+    assert asyncio.run(main()) == ["reply", "reply"]
+    assert len(calls) == 1
+
+def test_ai_questions_are_rate_limited(monkeypatch):
+    monkeypatch.setattr(command_handler, "generate_ai_text", lambda prompt, user_id=None: "answer")
+    rate_limiter.limiter.clear()
+    replies = [command_handler.process_message(f"7 問題 {i}", "https://x", "U-ai")[0].text
+               for i in range(RATE_LIMIT_AI_BURST + 1)]
+    assert replies[:-1] == ["answer"] * RATE_LIMIT_AI_BURST
+    assert replies[-1].startswith("⏳")
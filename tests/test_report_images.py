@@ -0,0 +1,128 @@
+# tests/test_report_images.py
+import io
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image
+
+import command_handler
+import report_images
+from asset_store import asset_store
+from config import REPORT_IMAGE_MAX_SIDE, REPORT_IMAGE_PREVIEW_SIDE
+
+def _image(size: tuple, fmt: str, mode: str = "RGB") -> bytes:
+    buf = io.BytesIO()
+    Image.new(mode, size, (200, 30, 30, 128) if mode == "RGBA" else (200, 30, 30)).save(buf, format=fmt)
+    return buf.getvalue()
+
+def _open(data: bytes) -> Image.Image:
+    img = Image.open(io.BytesIO(data))
+    img.load()
+    return img
+
+def _quake() -> SimpleNamespace:
+    # 每個測試使用不同的地震編號與網址，避免沿用其他測試寫入的檔案
+    no = uuid.uuid4().hex[:8]
+    return SimpleNamespace(id=no, image_url=f"https://scweb.cwa.gov.tw/{no}.png")
+
+def test_shrink_large_png_with_transparency():
+    original, preview = report_images.shrink(_image((3000, 2000), "PNG", "RGBA"))
+    original, preview = _open(original), _open(preview)
+    assert (original.format, original.mode) == ("JPEG", "RGB")
+    # 最長邊縮到上限，長寬比不變
+    assert original.size == (REPORT_IMAGE_MAX_SIDE, round(REPORT_IMAGE_MAX_SIDE * 2 / 3))
+    assert preview.size == (REPORT_IMAGE_PREVIEW_SIDE, round(REPORT_IMAGE_PREVIEW_SIDE * 2 / 3))
+
+def test_shrink_keeps_small_jpeg_as_original():
+    source = _image((800, 600), "JPEG")
+    original, preview = report_images.shrink(source)
+    assert original is source
+    assert max(_open(preview).size) == REPORT_IMAGE_PREVIEW_SIDE
+
+def test_proxy_serves_static_urls(monkeypatch):
+    fetched = []
+    monkeypatch.setattr(report_images, "_fetch", lambda url: fetched.append(url) or _image((2000, 1500), "PNG"))
+    quake = _quake()
+    for _ in range(2):
+        original, preview = command_handler._report_image_urls(quake, "https://bot.example")
+    assert len(fetched) == 1
+    assert original.startswith("https://bot.example/static/report_") and preview.endswith("_preview.jpg")
+    assert asset_store.exists(original.rsplit("/", 1)[1]) and asset_store.exists(preview.rsplit("/", 1)[1])
+
+@pytest.mark.parametrize("error", [ConnectionError("unreachable"), ValueError("not an image")])
+def test_falls_back_to_cwa_url_on_failure(monkeypatch, error):
+    def fail(url):
+        raise error
+
+    monkeypatch.setattr(report_images, "_fetch", fail)
+    quake = _quake()
+    assert command_handler._report_image_urls(quake, "https://bot.example") == (quake.image_url, quake.image_url)
+
+def test_falls_back_to_cwa_url_on_bad_image(monkeypatch):
+    monkeypatch.setattr(report_images, "_fetch", lambda url: b"<html>error page</html>")
+    quake = _quake()
+    assert command_handler._report_image_urls(quake, "https://bot.example") == (quake.image_url, quake.image_url)
+
+def test_failure_is_remembered_until_ttl(monkeypatch):
+    calls = []
+
+    def fail(url):
+        calls.append(url)
+        raise ConnectionError("unreachable")
+
+    monkeypatch.setattr(report_images, "_fetch", fail)
+    quake = _quake()
+    for _ in range(3):
+        assert command_handler._report_image_urls(quake, "https://bot.example") == (quake.image_url, quake.image_url)
+    assert len(calls) == 1
+
+    # 過了 REPORT_IMAGE_FAILURE_TTL 之後重新嘗試
+    original, _ = report_images._names(quake.id, quake.image_url)
+    report_images._failed_until[original] = 0
+    command_handler._report_image_urls(quake, "https://bot.example")
+    assert len(calls) == 2
+
+class _StreamedResponse:
+    def __init__(self, chunks: list, headers: dict | None = None):
+        self.chunks, self.headers, self.read = chunks, headers or {}, 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        for chunk in self.chunks:
+            self.read += 1
+            yield chunk
+
+def test_fetch_stops_reading_past_the_size_limit(monkeypatch):
+    limit = report_images.REPORT_IMAGE_MAX_SOURCE_BYTES
+    response = _StreamedResponse([b"x" * (limit // 2)] * 10)
+    monkeypatch.setattr(report_images.http_client, "get", lambda url, **kwargs: response)
+    with pytest.raises(ValueError):
+        report_images._fetch("https://scweb.cwa.gov.tw/huge.png")
+    assert response.read == 3
+
+def test_fetch_rejects_declared_oversize_without_reading(monkeypatch):
+    response = _StreamedResponse([b"x"], {"Content-Length": str(report_images.REPORT_IMAGE_MAX_SOURCE_BYTES + 1)})
+    monkeypatch.setattr(report_images.http_client, "get", lambda url, **kwargs: response)
+    with pytest.raises(ValueError):
+        report_images._fetch("https://scweb.cwa.gov.tw/huge.png")
+    assert response.read == 0
+
+def test_fetch_returns_streamed_body(monkeypatch):
+    captured = {}
+
+    def get(url, **kwargs):
+        captured.update(kwargs)
+        return _StreamedResponse([b"ab", b"cd"])
+
+    monkeypatch.setattr(report_images.http_client, "get", get)
+    assert report_images._fetch("https://scweb.cwa.gov.tw/ok.png") == b"abcd"
+    assert captured["stream"] is True
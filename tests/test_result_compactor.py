@@ -0,0 +1,26 @@
+# tests/test_result_compactor.py
+import json
+
+import result_compactor
+
+HEADERS = ["time", "latitude", "longitude", "depth", "magnitude", "place"]
+
+def _rows(n: int) -> list:
+    return [[f"2024-01-{i % 28 + 1:02d}T00:00:{i % 60:02d}", 23.5 + i % 7 / 10, 121.0 + i % 5 / 10,
+             float(i % 90), round(4.0 + i % 30 / 10, 1), "花蓮縣近海" if i % 3 else "Taiwan"] for i in range(n)]
+
+def _exact(data: list) -> int:
+    return len(json.dumps([dict(zip(HEADERS, row)) for row in data], indent=2, ensure_ascii=False).encode())
+
+def test_original_size_is_exact_for_small_results():
+    data = _rows(result_compactor.SIZE_ESTIMATE_ROWS)
+    assert result_compactor._estimate_original_bytes(HEADERS, data) == _exact(data)
+
+def test_original_size_estimate_for_large_results():
+    data = _rows(5000)
+    assert abs(result_compactor._estimate_original_bytes(HEADERS, data) - _exact(data)) < 0.02 * _exact(data)
+
+def test_compact_counts_estimated_bytes_in():
+    before = result_compactor.stats()["bytes_in"]
+    result_compactor.compact({"headers": HEADERS, "data": _rows(10)})
+    assert result_compactor.stats()["bytes_in"] - before == _exact(_rows(10))
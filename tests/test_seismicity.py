@@ -0,0 +1,78 @@
+# tests/test_seismicity.py
+import time
+
+import numpy as np
+import pytest
+
+import catalog_store
+import command_handler
+import seismicity
+
+DAY_MS = seismicity.DAY_MS
+
+def _write(rows: list[tuple]) -> None:
+    cols = catalog_store.COLUMNS
+    conn = catalog_store.connect()
+    try:
+        with conn:
+            conn.executemany(f"INSERT OR REPLACE INTO events ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})",
+                             rows)
+    finally:
+        conn.close()
+
+def _event(event_id: str, time_ms: int, magnitude: float, updated_ms: int | None = None) -> tuple:
+    return (event_id, time_ms, updated_ms or time_ms, 23.8, 121.6, 10.0, magnitude, "", "")
+
+@pytest.fixture
+def catalog():
+    conn = catalog_store.connect()
+    with conn:
+        conn.execute("DELETE FROM events")
+    conn.close()
+    rng = np.random.default_rng(1)
+    now = int(time.time() * 1000)
+    # b=1 的 Gutenberg–Richter 規模分布，分散在近兩年
+    mags = np.round(4.0 - np.log10(rng.uniform(size=3000)), 1)
+    times = now - rng.uniform(0, 730, 3000) * DAY_MS
+    rows = [_event(f"e{i}", int(t), float(m)) for i, (t, m) in enumerate(zip(times, mags))]
+    _write(rows)
+    return rows
+
+def _table(rollup: seismicity.SeismicityRollup) -> np.ndarray:
+    return rollup.rows(seismicity.FIRST_DAY, seismicity._today() + 1)
+
+def test_incremental_update_matches_rebuild(catalog):
+    rollup = seismicity.SeismicityRollup()
+    rollup.refresh(force=True)
+    assert int(_table(rollup).sum()) == len(catalog)
+
+    now = int(time.time() * 1000)
+    _write([_event(f"new{i}", now - i * 60_000, 4.5, now + i) for i in range(10)]
+           + [_event(e[0], e[1], round(e[6] + 0.5, 1), now + 100 + i) for i, e in enumerate(catalog[:5])])
+    rollup.refresh(force=True)
+    rebuilt = seismicity.SeismicityRollup()
+    rebuilt.refresh(force=True)
+    assert np.array_equal(_table(rollup), _table(rebuilt))
+    assert rollup.stats()["rebuilds"] == 0
+
+def test_deleted_events_trigger_rebuild(catalog):
+    rollup = seismicity.SeismicityRollup()
+    rollup.refresh(force=True)
+    before = rollup.stats()["rebuilds"]
+    conn = catalog_store.connect()
+    with conn:
+        conn.execute("DELETE FROM events WHERE id IN ('e0', 'e1')")
+    conn.close()
+    rollup.refresh(force=True)
+    assert rollup.stats()["rebuilds"] == before + 1
+    assert int(_table(rollup).sum()) == len(catalog) - 2
+
+def test_b_value_of_synthetic_catalog(catalog):
+    rollup = seismicity.SeismicityRollup()
+    rollup.refresh(force=True)
+    fit = seismicity.fit_gutenberg_richter(_table(rollup).sum(axis=0))
+    assert fit is not None and abs(fit["b"] - 1.0) < 0.15
+
+def test_reply_rejects_out_of_range_argument():
+    assert command_handler.get_seismicity_reply("/bvalue", "500").text.startswith("請輸入 1～100 之間的年數")
+    assert command_handler.get_seismicity_reply("/activity", "abc").text.startswith("請輸入 0～9 之間的規模")
@@ -0,0 +1,73 @@
+# tests/test_shared_cache.py
+"""
+跨行程共用快取：多個行程 (模擬 gunicorn worker) 同時查詢同一個上游 (benchmarks/stub_servers.py 的本地 stub) 時，
+TTL 內每個 feed 只呼叫上游一次。
+"""
+import contextlib
+import multiprocessing
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from stub_servers import StubUpstreams
+
+CWA_ALARM_PATH = "/api/v1/earthquake/alarm/list"
+USGS_PATH = "/fdsnws/event/1/query"
+WORKERS = 4
+THREADS = 4
+ROUNDS = 5
+
+def _worker(barrier, errors) -> None:
+    # 在子行程中才匯入，讓 config 讀到父行程設定的環境變數
+    with contextlib.redirect_stdout(sys.stderr):
+        from cwa_service import fetch_cwa_alarm_payload
+        from usgs_service import fetch_global_last24h_payload
+    barrier.wait()
+
+    def _loop():
+        for _ in range(ROUNDS):
+            try:
+                fetch_cwa_alarm_payload()
+                fetch_global_last24h_payload()
+            except Exception:
+                with errors.get_lock():
+                    errors.value += 1
+
+    pool = [threading.Thread(target=_loop) for _ in range(THREADS)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+
+@pytest.fixture
+def stubs(monkeypatch, tmp_path):
+    # stub 的固定延遲讓各行程的第一次查詢互相重疊
+    stubs = StubUpstreams(latency=0.2).start()
+    for name, value in {
+        **stubs.env(),
+        "SHARED_CACHE_ENABLED": "true", "SHARED_CACHE_PATH": str(tmp_path / "cache.sqlite3"),
+        "CACHE_TTL_CWA_ALARM": "60", "CACHE_STALE_CWA_ALARM": "0",
+        "CACHE_TTL_USGS_GLOBAL": "60", "CACHE_STALE_USGS_GLOBAL": "0",
+        "FEED_POLLER_ENABLED": "false", "WARMUP_ON_START": "false",
+    }.items():
+        monkeypatch.setenv(name, value)
+    yield stubs
+    stubs.stop()
+
+def test_one_upstream_call_per_key_across_processes(stubs):
+    ctx = multiprocessing.get_context("spawn")
+    barrier, errors = ctx.Barrier(WORKERS), ctx.Value("i", 0)
+    procs = [ctx.Process(target=_worker, args=(barrier, errors)) for _ in range(WORKERS)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(timeout=120)
+    assert all(p.exitcode == 0 for p in procs)
+    assert errors.value == 0
+    counts = stubs.counts()
+    assert counts["cwa"].get(CWA_ALARM_PATH, 0) == 1
+    assert counts["usgs"].get(USGS_PATH, 0) == 1
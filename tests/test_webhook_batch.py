@@ -0,0 +1,52 @@
+# tests/test_webhook_batch.py
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import rate_limiter
+import webhook_batch
+from config import RATE_LIMIT_CHEAP_BURST
+
+def _event(text: str, user_id: str):
+    return SimpleNamespace(message=SimpleNamespace(text=text), source=SimpleNamespace(type="user", user_id=user_id),
+                           reply_token="token", timestamp=None)
+
+def _exhaust(user_id: str) -> None:
+    for _ in range(RATE_LIMIT_CHEAP_BURST):
+        rate_limiter.limiter.acquire(user_id, "cheap")
+
+@pytest.fixture
+def sent(monkeypatch):
+    replies = {}
+
+    def send_reply(event, messages):
+        replies[event.source.user_id] = messages[0].text
+
+    async def send_reply_async(event, messages):
+        send_reply(event, messages)
+
+    monkeypatch.setattr(webhook_batch, "send_reply", send_reply)
+    monkeypatch.setattr(webhook_batch, "send_reply_async", send_reply_async)
+    rate_limiter.limiter.clear()
+    return replies
+
+@pytest.mark.parametrize("throttled_first", [True, False])
+def test_shared_group_checks_each_users_rate_limit(sent, throttled_first):
+    _exhaust("U-throttled")
+    events = [_event("9", "U-throttled"), _event("9", "U-ok")]
+    webhook_batch.reply_to_group(events if throttled_first else events[::-1], "https://x")
+    assert sent["U-throttled"].startswith("⏳")
+    assert "⏳" not in sent["U-ok"]
+
+def test_shared_group_charges_every_user(sent):
+    before = rate_limiter.limiter.stats()["cheap_allowed"]
+    webhook_batch.reply_to_group([_event("9", f"U-{i}") for i in range(3)], "https://x")
+    assert rate_limiter.limiter.stats()["cheap_allowed"] == before + 3
+    assert len(set(sent.values())) == 1
+
+def test_shared_group_async(sent):
+    _exhaust("U-throttled")
+    asyncio.run(webhook_batch.reply_to_group_async([_event("9", "U-throttled"), _event("9", "U-ok")], "https://x"))
+    assert sent["U-throttled"].startswith("⏳")
+    assert "⏳" not in sent["U-ok"]
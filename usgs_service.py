@@ -1,18 +1,29 @@
 # usgs_service.py
-import requests
-import pandas as pd
+import asyncio
+import http_client
+import catalog_store
+from typing import TYPE_CHECKING
 from datetime import datetime, timedelta, timezone
 from config import USGS_API_BASE_URL, CURRENT_YEAR
+from response_cache import cached_feed, cached_feed_async
+from quake_models import Quake, QuakeBatch
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 def _iso(dt: datetime) -> str:
     """將 datetime 物件格式化為 USGS API 需要的 ISO 8601 字串。"""
     return dt.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
 
-def fetch_global_last24h_text(min_mag: float = 5.0, limit: int = 10) -> str:
-    """從 USGS 擷取過去 24 小時的全球顯著地震。"""
+def _get_geojson(params: dict, timeout: int) -> dict:
+    r = http_client.get(USGS_API_BASE_URL, params=params, timeout=timeout)
+    r.raise_for_status()
+    return r.json()
+
+def _global_params(min_mag: float, limit: int) -> dict:
     now_utc = datetime.now(timezone.utc)
     since = now_utc - timedelta(hours=24)
-    params = {
+    return {
         "format": "geojson",
         "starttime": _iso(since),
         "endtime": _iso(now_utc),
@@ -20,33 +31,11 @@ def fetch_global_last24h_text(min_mag: float = 5.0, limit: int = 10) -> str:
         "limit": int(limit),
         "orderby": "time",
     }
-    try:
-        r = requests.get(USGS_API_BASE_URL, params=params, timeout=15)
-        r.raise_for_status()
-        features = r.json().get("features", [])
-        if not features:
-            return f"✅ 過去 24 小時內，全球無規模 {min_mag} 以上的顯著地震。"
-        
-        lines = [f"🚨 近 24 小時全球顯著地震 (M≥{min_mag}):", "-" * 20]
-        for f in features:
-            p = f["properties"]
-            t_utc = datetime.fromtimestamp(p["time"] / 1000, tz=timezone.utc)
-            
-            lines.append(
-                # [修改] 將 "震級" 改為 "規模"
-                f"規模: {p['mag']:.1f} | 日期時間: {t_utc.strftime('%Y-%m-%d %H:%M')} (UTC)\n"
-                f"地點: {p.get('place', 'N/A')}\n"
-                f"報告連結: {p.get('url', '無')}"
-            )
-        return "\n\n".join(lines)
-    except Exception as e:
-        return f"❌ 查詢失敗：{e}"
 
-def fetch_taiwan_df_this_year(min_mag: float = 5.0) -> pd.DataFrame | str:
-    """從USGS擷取今年以來台灣區域的顯著地震。"""
+def _taiwan_params(min_mag: float) -> dict:
     now_utc = datetime.now(timezone.utc)
     start_of_year_utc = datetime(now_utc.year, 1, 1, tzinfo=timezone.utc)
-    params = {
+    return {
         "format": "geojson", "starttime": _iso(start_of_year_utc), "endtime": _iso(now_utc),
         "minmagnitude": float(min_mag),
         "minlatitude": 21, "maxlatitude": 26,
@@ -54,25 +43,113 @@ def fetch_taiwan_df_this_year(min_mag: float = 5.0) -> pd.DataFrame | str:
         "limit": 250,
         "orderby": "time",
     }
+
+def fetch_global_last24h_payload(min_mag: float = 5.0, limit: int = 10, refresh: bool = False) -> dict:
+    """取得 USGS 過去 24 小時全球地震的原始 GeoJSON (經由快取)。"""
+    def _load():
+        return _get_geojson(_global_params(min_mag, limit), timeout=15)
+    return cached_feed("usgs_global", (float(min_mag), int(limit)), _load, refresh)
+
+def fetch_taiwan_payload_this_year(min_mag: float = 5.0) -> dict:
+    """取得 USGS 今年台灣區域地震的原始 GeoJSON (經由快取)。"""
+    def _load():
+        return _get_geojson(_taiwan_params(min_mag), timeout=20)
+    return cached_feed("usgs_taiwan", float(min_mag), _load)
+
+# --- 非同步版本 (ASGI 模式)，與同步版本共用快取與格式化 ---
+async def fetch_global_last24h_payload_async(min_mag: float = 5.0, limit: int = 10, refresh: bool = False) -> dict:
+    import async_http_client
+    return await cached_feed_async(
+        "usgs_global", (float(min_mag), int(limit)),
+        lambda: async_http_client.get_json(USGS_API_BASE_URL, params=_global_params(min_mag, limit), timeout=15),
+        refresh)
+
+async def fetch_taiwan_payload_this_year_async(min_mag: float = 5.0) -> dict:
+    import async_http_client
+    return await cached_feed_async(
+        "usgs_taiwan", float(min_mag),
+        lambda: async_http_client.get_json(USGS_API_BASE_URL, params=_taiwan_params(min_mag), timeout=20))
+
+def format_global_last24h(payload: dict, min_mag: float = 5.0) -> str:
+    features = payload.get("features", [])
+    if not features:
+        return f"✅ 過去 24 小時內，全球無規模 {min_mag} 以上的顯著地震。"
+
+    lines = [f"🚨 近 24 小時全球顯著地震 (M≥{min_mag}):", "-" * 20]
+    for q in map(Quake.from_usgs_feature, features):
+        lines.append(
+            # [修改] 將 "震級" 改為 "規模"
+            f"規模: {q.magnitude:.1f} | 日期時間: {q.time.strftime('%Y-%m-%d %H:%M')} (UTC)\n"
+            f"地點: {q.place or 'N/A'}\n"
+            f"報告連結: {q.url or '無'}"
+        )
+    return "\n\n".join(lines)
+
+def fetch_global_last24h_text(min_mag: float = 5.0, limit: int = 10) -> str:
+    """從 USGS 擷取過去 24 小時的全球顯著地震。"""
+    try:
+        return format_global_last24h(fetch_global_last24h_payload(min_mag, limit), min_mag)
+    except Exception as e:
+        return f"❌ 查詢失敗：{e}"
+
+async def fetch_global_last24h_text_async(min_mag: float = 5.0, limit: int = 10) -> str:
     try:
-        r = requests.get(USGS_API_BASE_URL, params=params, timeout=20)
-        r.raise_for_status()
-        features = r.json().get("features", [])
-        if not features:
-            return f"✅ 今年 ({CURRENT_YEAR} 年) 以來，台灣區域無 M≥{min_mag:.1f} 的顯著地震。"
-        
-        rows = []
-        for f in features:
-            p = f["properties"]
-            lon, lat, *_ = f["geometry"]["coordinates"]
-            rows.append({
-                "latitude": lat, 
-                "longitude": lon, 
-                "magnitude": p["mag"],
-                "place": p.get("place", ""), 
-                "time_utc": datetime.fromtimestamp(p["time"]/1000, tz=timezone.utc),
-                "url": p.get("url", "")
-            })
-        return pd.DataFrame(rows)
+        return format_global_last24h(await fetch_global_last24h_payload_async(min_mag, limit), min_mag)
+    except Exception as e:
+        return f"❌ 查詢失敗：{e}"
+
+def _taiwan_quakes_from_catalog(min_mag: float) -> QuakeBatch:
+    """從本地地震目錄讀取今年以來的事件 (必要時先做增量同步)。"""
+    catalog_store.ensure_synced()
+    now_utc = datetime.now(timezone.utc)
+    start_of_year_utc = datetime(now_utc.year, 1, 1, tzinfo=timezone.utc)
+    rows = catalog_store.query_events(start_ms=start_of_year_utc.timestamp() * 1000, min_magnitude=min_mag)
+    return QuakeBatch.from_quakes(map(Quake.from_catalog_row, rows))
+
+def _taiwan_quakes_from_api(min_mag: float) -> QuakeBatch:
+    features = fetch_taiwan_payload_this_year(min_mag).get("features", [])
+    return QuakeBatch.from_quakes(map(Quake.from_usgs_feature, features))
+
+def _taiwan_result(quakes: QuakeBatch, min_mag: float) -> QuakeBatch | str:
+    if not quakes:
+        return f"✅ 今年 ({CURRENT_YEAR} 年) 以來，台灣區域無 M≥{min_mag:.1f} 的顯著地震。"
+    return quakes
+
+def fetch_taiwan_quakes_this_year(min_mag: float = 5.0) -> QuakeBatch | str:
+    """
+    從本地同步的 USGS 目錄擷取今年以來台灣區域的顯著地震
+    (規模低於目錄下限，或目錄仍在進行首次同步時，改為直接查詢 USGS)。
+    """
+    try:
+        quakes = None
+        if catalog_store.covers(min_mag):
+            try:
+                quakes = _taiwan_quakes_from_catalog(min_mag)
+            except catalog_store.CatalogNotReady:
+                pass  # 首次同步在背景進行，先直接查詢 USGS
+        if quakes is None:
+            quakes = _taiwan_quakes_from_api(min_mag)
+        return _taiwan_result(quakes, min_mag)
+    except Exception as e:
+        return f"❌ 查詢失敗: {e}"
+
+async def fetch_taiwan_quakes_this_year_async(min_mag: float = 5.0) -> QuakeBatch | str:
+    """非同步版本；本地目錄的讀取與增量同步是阻塞的 SQLite 操作，改在執行緒中進行。"""
+    try:
+        quakes = None
+        if catalog_store.covers(min_mag):
+            try:
+                quakes = await asyncio.to_thread(_taiwan_quakes_from_catalog, min_mag)
+            except catalog_store.CatalogNotReady:
+                pass  # 首次同步在背景進行，先直接查詢 USGS
+        if quakes is None:
+            features = (await fetch_taiwan_payload_this_year_async(min_mag)).get("features", [])
+            quakes = QuakeBatch.from_quakes(map(Quake.from_usgs_feature, features))
+        return _taiwan_result(quakes, min_mag)
     except Exception as e:
         return f"❌ 查詢失敗: {e}"
+
+def fetch_taiwan_df_this_year(min_mag: float = 5.0) -> "pd.DataFrame | str":
+    """同 fetch_taiwan_quakes_this_year，但以 pandas DataFrame 回傳 (供分析或匯出使用)。"""
+    result = fetch_taiwan_quakes_this_year(min_mag)
+    return result if isinstance(result, str) else result.to_pandas()
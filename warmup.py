@@ -0,0 +1,77 @@
+# warmup.py
+import importlib
+import os
+import threading
+import time
+
+from config import WARMUP_DELAY_SECONDS
+
+# 依序預先載入的模組 (對應各指令第一次執行時才匯入的重量級套件)
+WARMUP_MODULES = [
+    "numpy",
+    "pandas",
+    "gradio_client",
+    "quake_index",
+    "result_compactor",
+    "google.generativeai",
+]
+
+_lock = threading.Lock()
+_pid = None
+_stats = {"state": "idle", "steps_ms": {}, "errors": {}}
+
+def _step(name: str, fn) -> None:
+    started = time.perf_counter()
+    try:
+        fn()
+    except Exception as e:
+        _stats["errors"][name] = str(e)
+        print(f"預熱 {name} 失敗: {e}")
+    _stats["steps_ms"][name] = round((time.perf_counter() - started) * 1000, 1)
+
+def warm_up() -> None:
+    """在背景執行緒中載入重量級模組並建立共用物件。"""
+    _stats["state"] = "running"
+    started = time.perf_counter()
+    for module in WARMUP_MODULES:
+        _step(module, lambda m=module: importlib.import_module(m))
+
+    def _router():
+        import intent_router
+        intent_router.get_router()
+
+    def _model():
+        import ai_service
+        ai_service.get_model()
+
+    def _catalog():
+        # 首次完整同步可能需要數十秒，在預熱時完成而不是在第一個 /taiwan 請求中
+        import catalog_store
+        catalog_store.initial_sync()
+
+    _step("intent_router", _router)
+    _step("gemini_model", _model)
+    _step("usgs_catalog", _catalog)
+    _stats["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    _stats["state"] = "done"
+    print(f"--- 背景預熱完成，耗時 {_stats['total_ms']} ms ---")
+
+def ensure_started() -> None:
+    """在目前的行程中啟動一次背景預熱 (以 PID 判斷，相容 gunicorn fork)。"""
+    global _pid
+    if _pid == os.getpid():
+        return
+    with _lock:
+        if _pid == os.getpid():
+            return
+        _pid = os.getpid()
+        _stats["state"] = "scheduled"
+
+        def _run():
+            time.sleep(WARMUP_DELAY_SECONDS)
+            warm_up()
+
+        threading.Thread(target=_run, name="warmup", daemon=True).start()
+
+def stats() -> dict:
+    return {**_stats, "steps_ms": dict(_stats["steps_ms"]), "errors": dict(_stats["errors"])}
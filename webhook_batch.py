@@ -0,0 +1,152 @@
+# webhook_batch.py
+"""
+LINE 可能在同一次 /callback 中送來多個事件 (例如同一秒內有二十位使用者都輸入「1」)。
+這裡先依 command_handler.batch_key 將文字訊息事件分組，每組只執行一次指令，
+再並行回覆組內的每個事件；單一事件回覆失敗不會影響同組或其他組的事件。
+"""
+import asyncio
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from linebot.v3.webhooks import MessageEvent, TextMessageContent
+
+import metrics
+import resilience
+from config import WEBHOOK_WORKERS, WEBHOOK_REPLY_CONCURRENCY, REQUEST_DEADLINE_SECONDS
+from command_handler import (
+    batch_key, charge_rate_limit, process_message, process_message_async, add_stale_notice,
+)
+from line_client import send_reply, send_reply_async, get_user_id
+
+_lock = threading.Lock()
+_pools = {"pid": None, "groups": None, "replies": None}
+_stats = {"batches": 0, "events": 0, "groups": 0, "reply_errors": 0}
+
+def _count(**deltas) -> None:
+    with _lock:
+        for name, n in deltas.items():
+            _stats[name] += n
+
+def _pool(name: str) -> ThreadPoolExecutor:
+    """此行程的執行緒池 (fork 後重新建立)；分組與回覆分開，避免組內等待回覆時佔滿同一個池。"""
+    if _pools["pid"] != os.getpid():
+        with _lock:
+            if _pools["pid"] != os.getpid():
+                _pools.update(
+                    pid=os.getpid(),
+                    groups=ThreadPoolExecutor(max_workers=max(1, WEBHOOK_WORKERS), thread_name_prefix="webhook-group"),
+                    replies=ThreadPoolExecutor(max_workers=max(1, WEBHOOK_REPLY_CONCURRENCY),
+                                               thread_name_prefix="webhook-reply"),
+                )
+    return _pools[name]
+
+def group_events(events) -> list[list]:
+    """只保留文字訊息事件，依 batch_key 分組 (保留各組第一次出現的順序)。"""
+    groups = {}
+    for event in events:
+        if isinstance(event, MessageEvent) and isinstance(event.message, TextMessageContent):
+            groups.setdefault(batch_key(event.message.text, get_user_id(event)), []).append(event)
+    result = list(groups.values())
+    _count(batches=1, events=sum(len(g) for g in result), groups=len(result))
+    return result
+
+def _reply_error(e: Exception) -> None:
+    _count(reply_errors=1)
+    print(f"回覆 Webhook 事件失敗: {e}")
+
+def _admit(group: list) -> tuple[list, list]:
+    """
+    可跨使用者共用回覆的組 (batch_key 不含使用者) 依每個事件各自的使用者扣除頻率限制額度。
+    回傳 (共用回覆的事件, [(被限制的事件, 提示訊息)])；其餘的組交由 process_message 自行檢查，回傳 (None, [])。
+    """
+    first = group[0]
+    if len(group) == 1 or not batch_key(first.message.text, get_user_id(first))[0]:
+        return None, []
+    admitted, limited = [], []
+    for event in group:
+        notice = charge_rate_limit(event.message.text, get_user_id(event))
+        if notice:
+            limited.append((event, notice))
+        else:
+            admitted.append(event)
+    return admitted, limited
+
+def _check_errors(errors: list) -> None:
+    for e in filter(None, errors):
+        _reply_error(e)
+    if errors and all(errors):
+        raise errors[0]
+
+def reply_to_group(group: list, base_url: str) -> None:
+    """
+    以組內第一個事件執行指令，再並行回覆所有事件；全部回覆失敗時拋出例外。
+    被頻率限制的使用者只收到提示訊息，不影響同組其他使用者。
+    指令執行期間的上游呼叫都受 REQUEST_DEADLINE_SECONDS 的期限限制。
+    """
+    with metrics.trace(), resilience.request_scope(REQUEST_DEADLINE_SECONDS):
+        admitted, replies = _admit(group)
+        shared = group if admitted is None else admitted
+        if shared:
+            with metrics.span("process_message"):
+                reply_messages = process_message(shared[0].message.text, base_url, get_user_id(shared[0]),
+                                                 rate_limit=admitted is None)
+            reply_messages = add_stale_notice(reply_messages, resilience.fallbacks())
+            replies += [(event, reply_messages) for event in shared]
+        if len(replies) == 1:
+            send_reply(*replies[0])
+            return
+        # 每個回覆在複製的 context 中執行，span 仍歸屬於這次追蹤
+        futures = [_pool("replies").submit(contextvars.copy_context().run, send_reply, event, messages)
+                   for event, messages in replies]
+        errors = [f.exception() for f in futures]
+    _check_errors(errors)
+
+def handle_events(events, base_url: str) -> None:
+    """同步 (inline) 模式：各組並行處理，並等待全部完成。"""
+    groups = group_events(events)
+    if len(groups) == 1:
+        try:
+            reply_to_group(groups[0], base_url)
+        except Exception as e:
+            print(f"處理 Webhook 事件失敗: {e}")
+        return
+    futures = [_pool("groups").submit(reply_to_group, group, base_url) for group in groups]
+    for f in futures:
+        if f.exception() is not None:
+            print(f"處理 Webhook 事件失敗: {f.exception()}")
+
+async def reply_to_group_async(group: list, base_url: str) -> None:
+    """reply_to_group 的非同步版本 (ASGI 模式)。"""
+    with metrics.trace(), resilience.request_scope(REQUEST_DEADLINE_SECONDS):
+        admitted, replies = _admit(group)
+        shared = group if admitted is None else admitted
+        if shared:
+            with metrics.span("process_message"):
+                reply_messages = await process_message_async(
+                    shared[0].message.text, base_url, get_user_id(shared[0]), rate_limit=admitted is None)
+            reply_messages = add_stale_notice(reply_messages, resilience.fallbacks())
+            replies += [(event, reply_messages) for event in shared]
+        results = await asyncio.gather(*(send_reply_async(event, messages) for event, messages in replies),
+                                       return_exceptions=True)
+    _check_errors([r if isinstance(r, Exception) else None for r in results])
+
+def stats() -> dict:
+    with _lock:
+        result = dict(_stats)
+    # 因與同組事件共用結果而省下的指令執行次數
+    result["shared_events"] = result["events"] - result["groups"]
+    return result
+
+def _collect_metrics() -> list:
+    s = stats()
+    return [
+        ("linebot_webhook_batch_events_total", "counter",
+         "Text message events received, and those that reused another event's reply in the same webhook.",
+         [({"kind": "received"}, s["events"]), ({"kind": "shared"}, s["shared_events"])]),
+        ("linebot_webhook_reply_errors_total", "counter", "Replies that failed inside an event group.",
+         [({}, s["reply_errors"])]),
+    ]
+
+metrics.register_collector(_collect_metrics)